@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Offline asset packs: everything a vocabulary list needs, in one file.
+
+A pack is a SQLite file holding the translations, pinyin, TTS audio,
+Pixabay search results and processed images of a master vocabulary list
+(a whole HSK level, say). It is built once while online:
+
+    python asset_pack.py build hsk1.csv -o hsk1.pack [--version 2024-09]
+
+and mounted read-only when generating (--pack hsk1.pack). The media
+cache, translation cache and pinyin engine then look words up in the pack
+first, by primary key, so decks drawn from its vocabulary are built
+without any network request.
+
+Audio, search results and images are stored under their media cache file
+names, so a pack entry is found exactly where the cache would be read.
+
+Usage: python asset_pack.py build VOCAB.csv -o PACK [--version LABEL] [--concurrency 8] [--cache-dir DIR]
+       python asset_pack.py info PACK
+"""
+import argparse
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+
+# Version of the pack layout; packs of another version are refused
+PACK_FORMAT = 1
+
+# Entries written per transaction while building
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE vocabulary (position INTEGER PRIMARY KEY, chinese TEXT, english TEXT);
+CREATE TABLE translations (chinese TEXT PRIMARY KEY, english TEXT);
+CREATE TABLE pinyin (word TEXT PRIMARY KEY, tone TEXT, tone_numbers TEXT, zhuyin TEXT);
+CREATE TABLE media (name TEXT PRIMARY KEY, data BLOB);
+"""
+
+
+class AssetPack:
+    """A pack file mounted read-only, looked up from any thread."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Asset pack not found: {path}")
+        uri = pathlib.Path(self.path).as_uri() + "?mode=ro&immutable=1"
+        self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        try:
+            self.meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"{path} is not an asset pack: {e}")
+        if self.meta.get("format") != str(PACK_FORMAT):
+            raise ValueError(f"{path} has pack format {self.meta.get('format')}, expected {PACK_FORMAT}")
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, query, value):
+        with self._lock:
+            row = self._db.execute(query, (value,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+
+    def read(self, name):
+        """Return the bytes stored under a media cache file name, or None."""
+        row = self._lookup("SELECT data FROM media WHERE name = ?", name)
+        return bytes(row[0]) if row else None
+
+    def contains(self, name):
+        """Return whether bytes are stored under a media cache file name, without counting a hit or miss."""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM media WHERE name = ?", (name,)).fetchone() is not None
+
+    def translation(self, chinese):
+        row = self._lookup("SELECT english FROM translations WHERE chinese = ?", chinese)
+        return row[0] if row else None
+
+    def pinyin(self, word):
+        """Return the (tone, tone_numbers, zhuyin) annotation of word, or None."""
+        row = self._lookup("SELECT tone, tone_numbers, zhuyin FROM pinyin WHERE word = ?", word)
+        return tuple(row) if row else None
+
+    def image_settings(self):
+        """Return the (image_dpi, image_quality) the images of the pack were processed with."""
+        return int(self.meta["image_dpi"]), int(self.meta["image_quality"])
+
+    def info(self):
+        """Return the metadata of the pack with its entry counts."""
+        info = dict(self.meta, path=self.path, bytes=os.path.getsize(self.path))
+        with self._lock:
+            for table in ("vocabulary", "translations", "pinyin", "media"):
+                info[table] = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return info
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class PackWriter:
+    """Writes a new pack through a temporary file, renamed into place by close()."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self._temp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._db = sqlite3.connect(self._temp_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._meta = dict(meta, format=PACK_FORMAT)
+
+    def _write(self, query, rows):
+        with self._lock:
+            self._db.executemany(query, rows)
+            self._pending += len(rows)
+            if self._pending >= COMMIT_EVERY:
+                self._db.commit()
+                self._pending = 0
+
+    def add_vocabulary(self, pairs):
+        self._write("INSERT INTO vocabulary (chinese, english) VALUES (?, ?)", list(pairs))
+
+    def add_translations(self, translations):
+        self._write("INSERT OR REPLACE INTO translations VALUES (?, ?)", list(translations.items()))
+
+    def add_pinyin(self, annotations):
+        """Add annotations, a dict of word -> (tone, tone_numbers, zhuyin)."""
+        self._write("INSERT OR REPLACE INTO pinyin VALUES (?, ?, ?, ?)",
+                    [(word, *annotation) for word, annotation in annotations.items()])
+
+    def add_media(self, name, data):
+        self._write("INSERT OR REPLACE INTO media VALUES (?, ?)", [(name, data)])
+
+    def close(self):
+        """Write the metadata, compact the pack and move it to its path."""
+        with self._lock:
+            self._meta["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 [(key, str(value)) for key, value in self._meta.items()])
+            self._db.commit()
+            self._db.execute("VACUUM")
+            self._db.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        with self._lock:
+            self._db.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def build_pack(source, pack_path, version=None, concurrency=None, cache_dir=None, image_dpi=None,
+               image_quality=None, progress=print, translator=None):
+    """
+    Resolve every word of a vocabulary CSV or list of rows and write them to a pack.
+
+    Chinese-only rows are translated. Audio, searches and images go
+    through the media cache (cache_dir, or the shared one) and its search
+    index, so words that are already cached are not fetched again. Words whose audio or image
+    could not be fetched are left out of the pack for those assets and
+    listed in the returned summary under "failed". translator replaces the
+    BatchTranslator of the cache directory.
+    """
+    import requests
+
+    import simple_mandarin_ppt as smp
+    from image_processing import image_spec
+    from media_cache import MediaCache
+    from pinyin_engine import PinyinEngine
+    from pipeline import ordered_map
+    from template_blueprint import IMAGE_REGION
+    from translation import BatchTranslator, TranslationCache, failed_translation, translation_cache_path
+
+    start = time.perf_counter()
+    concurrency = concurrency or smp.DEFAULT_CONCURRENCY
+    image_dpi = smp.DEFAULT_IMAGE_DPI if image_dpi is None else image_dpi
+    image_quality = smp.DEFAULT_IMAGE_QUALITY if image_quality is None else image_quality
+    cache = MediaCache(cache_dir) if cache_dir else smp.get_media_cache()
+    if translator is None and cache_dir:
+        translator = BatchTranslator(TranslationCache(translation_cache_path(cache_dir)))
+    translator = translator or smp.get_translator()
+    # The image frame of the default template, as create_ppt_from_template sizes images
+    spec = image_spec(*IMAGE_REGION[2:], dpi=image_dpi, quality=image_quality)
+
+    pairs = list(dict.fromkeys(smp.iter_vocabulary(source, True, translator, progress)))
+    translations = {chinese: english for chinese, english in pairs if english != failed_translation(chinese)}
+    progress(f"Resolving {len(pairs)} words into {pack_path}")
+
+    writer = PackWriter(pack_path, {
+        "version": version or time.strftime("%Y%m%d"),
+        "source": source if isinstance(source, str) else "rows",
+        "image_dpi": image_dpi,
+        "image_quality": image_quality,
+        "words": len(pairs),
+    })
+    failed = []
+
+    def resolve(pair):
+        chinese, english = pair
+        missing = []
+        try:
+            writer.add_media(smp.audio_key(chinese) + ".mp3", smp.generate_audio(chinese, cache))
+        except Exception as e:
+            print(f"No audio for '{chinese}': {e}")
+            missing.append("audio")
+
+        if chinese in translations:
+            image_query, min_size = smp.image_search_params(english, spec)
+            key = smp.search_key(image_query, min_size)
+            try:
+                cached_url = cache.read(key, ".url")
+                if cached_url is not None:
+                    image_url = cached_url.decode("utf-8")
+                else:
+                    image_url = smp.pick_image_url(smp.search_image_hits(image_query, cache), min_size)
+                # An empty entry records that Pixabay has no image for the word
+                writer.add_media(key + ".url", (image_url or "").encode("utf-8"))
+                if image_url:
+                    image = smp.download_image(image_url, image_query, cache, spec)
+                    writer.add_media(smp.image_key(image_query, image_url, spec) + ".img", image)
+            except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                print(f"No image for '{english}': {e}")
+                missing.append("image")
+        else:
+            missing.append("translation")
+        if missing:
+            failed.append({"chinese": chinese, "english": english, "missing": missing})
+        return chinese
+
+    try:
+        writer.add_vocabulary(pairs)
+        writer.add_translations(translations)
+        pinyin = PinyinEngine(None)
+        words = [chinese for chinese, _ in pairs]
+        writer.add_pinyin({word: tuple(annotation.values())
+                           for word, annotation in zip(words, pinyin.annotate_many(words))})
+        for done, _ in enumerate(ordered_map(resolve, pairs, concurrency), start=1):
+            if done % 100 == 0:
+                progress(f"{done}/{len(pairs)} words resolved")
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    return {
+        "pack": pack_path,
+        "words": len(pairs),
+        "failed": failed,
+        "bytes": os.path.getsize(pack_path),
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Resolve a vocabulary list into a pack (needs the network)")
+    build.add_argument("csv", help="Master vocabulary CSV, Chinese-only rows are translated")
+    build.add_argument("-o", "--output", required=True, help="Pack file to write")
+    build.add_argument("--version", help="Version label stored in the pack (default: today's date)")
+    build.add_argument("--concurrency", type=int, help="Words fetched at the same time")
+    build.add_argument("--cache-dir", help="Media cache directory")
+    build.add_argument("--image-dpi", type=int, help="Resolution images are downscaled to (0 keeps them unchanged)")
+    build.add_argument("--image-quality", type=int, help="JPEG quality of the images")
+    info = commands.add_parser("info", help="Show the version and contents of a pack")
+    info.add_argument("pack")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        try:
+            pack = AssetPack(args.pack)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        print(json.dumps(pack.info(), ensure_ascii=False, indent=1))
+        return 0
+
+    if not os.path.exists(args.csv):
+        print(f"File not found: {args.csv}", file=sys.stderr)
+        return 2
+    summary = build_pack(args.csv, args.output, args.version, args.concurrency, args.cache_dir,
+                         args.image_dpi, args.image_quality)
+    print(f"Pack written to {summary['pack']}: "
+          f"{summary['words']} words, {summary['bytes'] / 1e6:.1f} MB, {len(summary['failed'])} incomplete")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the presentation generator against local stand-ins for Pixabay,
+the image CDN, gTTS and Google Translate, so results do not depend on live
+services.
+
+Usage: python benchmark.py [--words 60] [--latency 0.2] [--concurrency 8] [--error-rate 0.05] [--seed 0]
+       python benchmark.py --suite [--sizes 10,100,1000,10000] [--results benchmark_results.jsonl] [--stream]
+                           [--providers local]
+
+The suite builds decks of every size, directly with create_ppt_from_template
+and from a Chinese-only CSV through the translation path, each in a fresh
+process; --stream writes the slides as they are built. The pinyin case
+measures the words per second of the pinyin engine. Wall time, peak RSS
+and deck size are appended to the results file together with the current
+commit, so runs can be compared across commits.
+
+The default run also builds the deck with the offline providers (see
+providers): a local TTS command, an image library and a dictionary made
+for the benchmark words, to compare them with the network-bound ones.
+--providers local runs the suite with them.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import urlparse
+
+from PIL import Image
+
+import simple_mandarin_ppt as smp
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import DictionaryTranslator, ImageLibrary, LocalTTSProvider, Providers
+from translation import BatchTranslator, TranslationCache
+from tts_batch import SEPARATOR
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+with open(smp.PLACEHOLDER_IMAGE_PATH, "rb") as _image_file:
+    STUB_IMAGE = _image_file.read()
+
+# Bytes of speech per word in the stub TTS audio
+STUB_AUDIO_BYTES = 1024
+
+# MPEG-2 Layer III frame header, 32 kbps, 24 kHz, mono, as gTTS returns
+STUB_FRAME_HEADER = b"\xff\xf3\x44\xc0"
+STUB_FRAME_BYTES = 96
+
+# Silent frames around the speech and at a sentence end (about 0.2 and 0.3 s)
+STUB_EDGE_FRAMES = 8
+STUB_PAUSE_FRAMES = 12
+
+# Seed of the stub failures, so runs with an error rate fail the same share of requests
+DEFAULT_SEED = 0
+
+# Vocabulary sizes built by --suite
+SUITE_SIZES = [10, 100, 1000, 10000]
+
+# File the --suite results are appended to
+DEFAULT_RESULTS_PATH = "benchmark_results.jsonl"
+
+SAMPLE_WORDS = [
+    ("海苔", "seaweed"), ("芋头", "taro"), ("豆腐脑", "tofu pudding"),
+    ("粽子", "sticky rice dumpling"), ("豆浆", "soy milk"), ("足球", "football"),
+    ("篮球", "basketball"), ("排球", "volleyball"), ("乒乓球", "table tennis"),
+    ("网球", "tennis"),
+]
+
+
+def make_stub_image(pixels):
+    """Return a noisy JPEG of pixels x pixels, similar in size to a Pixabay large image."""
+    image = Image.effect_noise((pixels, pixels), 64).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+def make_stub_frame(voiced, rng):
+    """Return one stub mp3 frame, with big values in its side info when it is voiced."""
+    # main_data_begin (8 bits) and a private bit, then part2_3_length and big_values
+    side_info = ((400 << 9 | 200) if voiced else 0) << (72 - 9 - 21)
+    payload_bytes = STUB_FRAME_BYTES - len(STUB_FRAME_HEADER) - 9
+    return STUB_FRAME_HEADER + side_info.to_bytes(9, "big") + rng.randbytes(payload_bytes)
+
+
+def make_stub_mp3(text, audio_bytes=STUB_AUDIO_BYTES):
+    """
+    Return stub TTS audio for text: an ID3 tag and mp3 frames with silence
+    around the speech, a short pause between syllables and a longer one at
+    every sentence end, like the audio of gTTS. Nothing decodes the frames.
+    """
+    rng = random.Random(text)
+    syllable_frames = max(1, audio_bytes // STUB_FRAME_BYTES)
+    frames = [make_stub_frame(False, rng) for _ in range(STUB_EDGE_FRAMES)]
+    sentences = [sentence for sentence in text.split(SEPARATOR) if sentence]
+    for number, sentence in enumerate(sentences):
+        if number:
+            frames += [make_stub_frame(False, rng) for _ in range(STUB_PAUSE_FRAMES)]
+        per_character = max(1, syllable_frames // len(sentence))
+        for position in range(len(sentence)):
+            if position:
+                frames.append(make_stub_frame(False, rng))
+            frames += [make_stub_frame(True, rng) for _ in range(per_character)]
+    frames += [make_stub_frame(False, rng) for _ in range(STUB_EDGE_FRAMES)]
+    return b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"".join(frames)
+
+
+def make_vocab(count):
+    """Return count vocabulary pairs, cycling through the sample words."""
+    vocab = []
+    for i in range(count):
+        chinese, english = SAMPLE_WORDS[i % len(SAMPLE_WORDS)]
+        vocab.append((chinese, f"{english} {i}"))
+    return vocab
+
+
+def make_words(count):
+    """Return count made-up Chinese words of two to four characters, the same for every run."""
+    rng = random.Random(count)
+    return ["".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Pixabay search API under /api/ and images under /images/.
+
+    A share of error_rate requests fail with 503, like an overloaded server,
+    drawn from the seeded random generator rng.
+    """
+    latency = 0.0
+    error_rate = 0.0
+    rng = random.Random(DEFAULT_SEED)
+    requests_served = 0
+    tts_requests = 0
+    image = STUB_IMAGE
+
+    def do_GET(self):
+        StubHandler.requests_served += 1
+        time.sleep(self.latency)
+        if self.rng.random() < self.error_rate:
+            self.send_error(503)
+            return
+        path = urlparse(self.path).path
+        if path.startswith("/api"):
+            host = f"http://{self.headers['Host']}"
+            image_url = f"{host}/images/{time.monotonic_ns()}"
+            body = json.dumps({"hits": [{
+                "largeImageURL": image_url + "_1280.jpg",
+                "webformatURL": image_url + "_640.jpg",
+                "webformatWidth": 640,
+                "webformatHeight": 640,
+            }]}).encode()
+            content_type = "application/json"
+        elif path.startswith("/images/"):
+            # Trailing bytes keep every image distinct, as real downloads are
+            body = self.image + path.encode()
+            content_type = "image/jpeg" if body[:2] == b"\xff\xd8" else "image/png"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency, error_rate=0.0, seed=DEFAULT_SEED):
+    """Start the stub server on a free localhost port and return it."""
+    handler = type("Handler", (StubHandler,), {"latency": latency, "error_rate": error_rate,
+                                               "rng": random.Random(seed)})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def install_stubs(server, latency, error_rate=0.0, audio_bytes=STUB_AUDIO_BYTES, seed=DEFAULT_SEED):
+    """Point the generator at the stub server and replace gTTS with a delay."""
+    smp.PIXABAY_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/"
+    rng = random.Random(seed)
+
+    def fake_synthesize_audio(chinese, lang='zh'):
+        StubHandler.requests_served += 1
+        StubHandler.tts_requests += 1
+        time.sleep(latency)
+        if rng.random() < error_rate:
+            raise ConnectionError("stub TTS failure")
+        return make_stub_mp3(chinese, audio_bytes)
+
+    smp.synthesize_audio = fake_synthesize_audio
+
+
+class FakeTranslator:
+    """Stands in for GoogleTranslator, translating every line to a made-up word."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=DEFAULT_SEED):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+    def translate(self, text):
+        StubHandler.requests_served += 1
+        time.sleep(self.latency)
+        if self.rng.random() < self.error_rate:
+            raise ConnectionError("stub translation failure")
+        return "\n".join(f"word {abs(hash(line)) % 100000}" for line in text.split("\n"))
+
+
+def make_local_providers(work_dir, pairs, audio_bytes=STUB_AUDIO_BYTES):
+    """
+    Return offline Providers for the (chinese, english) pairs: a TTS
+    command printing stub audio, an image library of the stub image for
+    every English word and a dictionary of the pairs, made in work_dir.
+    """
+    library_dir = os.path.join(work_dir, "library")
+    os.makedirs(library_dir, exist_ok=True)
+    for _, english in pairs:
+        with open(os.path.join(library_dir, f"{english}.jpg"), "wb") as image_file:
+            image_file.write(StubHandler.image)
+    dictionary_path = os.path.join(work_dir, "dictionary.csv")
+    with open(dictionary_path, "w", newline="", encoding="utf-8") as dictionary_file:
+        csv.writer(dictionary_file).writerows(pairs)
+    # Starting a process per word is what a local speech engine costs at least
+    command = [sys.executable, "-c", f"import os, sys; sys.stdout.buffer.write(os.urandom({audio_bytes}))"]
+    tts = LocalTTSProvider(command, extension="mp3")
+    return Providers(tts, ImageLibrary(library_dir), DictionaryTranslator(dictionary_path))
+
+
+def run_once(vocab, concurrency, output_dir, cache_dir, **options):
+    """Build one deck and return (elapsed seconds, network requests made, summary)."""
+    output_path = os.path.join(output_dir, f"bench_{concurrency}.pptx")
+    cache = MediaCache(cache_dir)
+    requests_before = StubHandler.requests_served
+    start = time.perf_counter()
+    summary = smp.create_ppt_from_template(vocab, "template.pptx", output_path, concurrency=concurrency,
+                                           cache=cache, **options)
+    return time.perf_counter() - start, StubHandler.requests_served - requests_before, summary
+
+
+def run_sharded(vocab, shards, concurrency, output_dir, cache_dir):
+    """Build one deck in shards and return (elapsed seconds, summary)."""
+    output_path = os.path.join(output_dir, f"bench_shards_{shards}.pptx")
+    start = time.perf_counter()
+    summary = smp.create_ppt_sharded(vocab, "template.pptx", output_path, shards, cache_dir, incremental=False,
+                                     concurrency=concurrency)
+    return time.perf_counter() - start, summary
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def current_commit():
+    """Return the checked out commit of this repository, or None outside git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pinyin_case(rows):
+    """
+    Convert rows distinct words to pinyin and return the words per second.
+
+    The words are converted in batches like a generation does: first with
+    an empty store, then by a new engine reading them from the store, then
+    again from memory.
+    """
+    words = make_words(rows)
+    batches = [words[i:i + smp.PINYIN_BATCH_SIZE] for i in range(0, len(words), smp.PINYIN_BATCH_SIZE)]
+
+    def convert_all(engine):
+        start = time.perf_counter()
+        for batch in batches:
+            engine.annotate_many(batch)
+        return time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        store_path = os.path.join(work_dir, "pinyin.sqlite3")
+        engine = PinyinEngine(store_path)
+        cold = convert_all(engine)
+        engine.close()
+        engine = PinyinEngine(store_path, max_entries=rows)
+        stored = convert_all(engine)
+        memory = convert_all(engine)
+        engine.close()
+    return {
+        "case": "pinyin",
+        "rows": rows,
+        "wall_seconds": round(cold, 3),
+        "rows_per_second": round(rows / cold, 1),
+        "store_words_per_second": round(rows / stored, 1),
+        "memory_words_per_second": round(rows / memory, 1),
+        "peak_rss_bytes": peak_rss(),
+        "deck_bytes": 0,
+        "requests": 0,
+    }
+
+
+def run_case(case, rows, config):
+    """
+    Build one deck of the suite in this process and return its result.
+
+    case "deck" hands vocabulary pairs to create_ppt_from_template, case
+    "csv" generates from a Chinese-only CSV with auto-translate and case
+    "pinyin" only converts words to pinyin (see run_pinyin_case).
+    """
+    if case == "pinyin":
+        return run_pinyin_case(rows)
+    if config["image_pixels"]:
+        StubHandler.image = make_stub_image(config["image_pixels"])
+    seed = config.get("seed", DEFAULT_SEED)
+    server = start_stub_server(config["latency"], config["error_rate"], seed)
+    install_stubs(server, config["latency"], config["error_rate"], config["audio_bytes"], seed)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, f"{case}_{rows}.pptx")
+        cache_dir = os.path.join(work_dir, "cache")
+        vocab = make_vocab(rows)
+        if case == "csv":
+            vocab = [(chinese + str(i), english) for i, (chinese, english) in enumerate(vocab)]
+        providers = None
+        backend = FakeTranslator(config["latency"], config["error_rate"], seed)
+        if config.get("providers") == "local":
+            providers = make_local_providers(work_dir, vocab, config["audio_bytes"])
+            backend = providers.translator
+        start = time.perf_counter()
+        if case == "deck":
+            summary = smp.create_ppt_from_template(
+                vocab, smp.DEFAULT_TEMPLATE_PATH, output_path,
+                concurrency=config["concurrency"], cache=MediaCache(cache_dir), stream=config.get("stream", False),
+                providers=providers,
+            )
+        else:
+            csv_path = os.path.join(work_dir, "vocab.csv")
+            with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+                csv.writer(csv_file).writerows([chinese] for chinese, _ in vocab)
+            translator = BatchTranslator(TranslationCache(None), backend=backend)
+            summary = smp.generate_presentation(
+                csv_path, output_path, smp.DEFAULT_TEMPLATE_PATH, auto_translate=True,
+                concurrency=config["concurrency"], cache_dir=cache_dir, translator=translator,
+                stream=config.get("stream", False), providers=providers,
+            )
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    return {
+        "case": case,
+        "rows": rows,
+        "wall_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1),
+        "peak_rss_bytes": peak_rss(),
+        "deck_bytes": summary["deck_bytes"],
+        "requests": StubHandler.requests_served,
+    }
+
+
+def previous_result(results_path, result):
+    """Return the latest earlier result of the same case and configuration, or None."""
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, encoding="utf-8") as results_file:
+        for line in results_file:
+            record = json.loads(line)
+            if all(record.get(field) == result[field] for field in ("case", "rows", "config")):
+                previous = record
+    return previous
+
+
+def run_suite(sizes, config, results_path):
+    """Run every case of the suite in a fresh process and append the results."""
+    commit = current_commit()
+    print(f"{'case':<6}{'rows':>7}{'wall (s)':>11}{'rows/s':>9}{'peak RSS (MB)':>15}{'deck (MB)':>11}  vs previous")
+    for rows in sizes:
+        for case in ("deck", "csv", "pinyin"):
+            # A new process per case so the peak RSS belongs to that case alone
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                result = executor.submit(run_case, case, rows, config).result()
+            result.update(config=config, commit=commit, time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+            previous = previous_result(results_path, result)
+            change = ""
+            if previous:
+                ratio = result["wall_seconds"] / previous["wall_seconds"] if previous["wall_seconds"] else 1
+                change = f"{ratio:.2f}x wall of {previous.get('commit') or 'previous run'}"
+            rss = result["peak_rss_bytes"]
+            print(f"{case:<6}{rows:>7}{result['wall_seconds']:>11.2f}{result['rows_per_second']:>9.1f}"
+                  f"{(rss / 1e6 if rss else float('nan')):>15.1f}{result['deck_bytes'] / 1e6:>11.2f}  {change}")
+            if case == "pinyin":
+                print(f"{'':<13}words/s from the store: {result['store_words_per_second']:.0f}, "
+                      f"from memory: {result['memory_words_per_second']:.0f}")
+
+            with open(results_path, "a", encoding="utf-8") as results_file:
+                results_file.write(json.dumps(result) + "\n")
+    print(f"Results appended to {results_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every stub response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub requests that fail")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed choosing the stub requests that fail")
+    parser.add_argument("--concurrency", type=int, default=smp.DEFAULT_CONCURRENCY)
+    parser.add_argument("--image-pixels", type=int, default=0,
+                        help="Serve a noisy JPEG of this size instead of the placeholder image")
+    parser.add_argument("--audio-bytes", type=int, default=STUB_AUDIO_BYTES, help="Bytes of speech per word in the stub TTS audio")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Also compare building the deck from a warm cache in one process and in this many")
+    parser.add_argument("--stream", action="store_true", help="Run the suite with slides streamed to the deck")
+    parser.add_argument("--providers", choices=("network", "local"), default="network",
+                        help="Run the suite with the stub services or with the offline providers")
+    parser.add_argument("--suite", action="store_true", help="Run the benchmark suite over --sizes vocabulary lists")
+    parser.add_argument("--sizes", default=",".join(map(str, SUITE_SIZES)), help="Comma separated suite sizes")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="File the suite results are appended to")
+    args = parser.parse_args()
+
+    if args.suite:
+        config = {
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "concurrency": args.concurrency,
+            "image_pixels": args.image_pixels,
+            "audio_bytes": args.audio_bytes,
+        }
+        if args.stream:
+            # Only recorded when set, so earlier results still match their configuration
+            config["stream"] = True
+        if args.providers == "local":
+            config["providers"] = "local"
+        if args.seed != DEFAULT_SEED:
+            config["seed"] = args.seed
+        run_suite([int(size) for size in args.sizes.split(",")], config, args.results)
+        return
+
+    if args.image_pixels:
+        StubHandler.image = make_stub_image(args.image_pixels)
+
+    server = start_stub_server(args.latency, args.error_rate, args.seed)
+    install_stubs(server, args.latency, args.error_rate, args.audio_bytes, args.seed)
+    vocab = make_vocab(args.words)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        serial, _, _ = run_once(vocab, 1, output_dir, os.path.join(output_dir, "cache-serial"))
+        cache_dir = os.path.join(output_dir, "cache")
+        concurrent, _, processed = run_once(vocab, args.concurrency, output_dir, cache_dir)
+        # Not incremental, or every slide would be copied from the deck just built
+        warm, warm_requests, _ = run_once(vocab, args.concurrency, output_dir, cache_dir, incremental=False)
+        _, _, unprocessed = run_once(vocab, args.concurrency, output_dir, os.path.join(output_dir, "cache-raw"),
+                                     image_dpi=0)
+        tts = {}
+        for batch_tts in (False, True):
+            tts_before = StubHandler.tts_requests
+            elapsed, _, summary = run_once(vocab, args.concurrency, output_dir,
+                                           os.path.join(output_dir, f"cache-tts-{batch_tts}"), incremental=False,
+                                           batch_tts=batch_tts)
+            tts[batch_tts] = (StubHandler.tts_requests - tts_before, elapsed, summary["audio_bytes"])
+        # Network-bound providers against offline ones, both with a cold cache and images
+        # unchanged, so image processing does not hide the providers
+        network, network_requests, _ = run_once(vocab, args.concurrency, output_dir,
+                                                os.path.join(output_dir, "cache-network"), incremental=False,
+                                                image_dpi=0)
+        untranslated = [(chinese + str(i), english) for i, (chinese, english) in enumerate(vocab)]
+        providers = make_local_providers(os.path.join(output_dir, "local"), untranslated, args.audio_bytes)
+        local, local_requests, _ = run_once(vocab, args.concurrency, output_dir,
+                                            os.path.join(output_dir, "cache-local"), incremental=False,
+                                            image_dpi=0, providers=providers)
+        words = [chinese for chinese, _ in untranslated]
+        translations = {}
+        for label, backend in (("network", FakeTranslator(args.latency, seed=args.seed)),
+                               ("local", providers.translator)):
+            start = time.perf_counter()
+            BatchTranslator(TranslationCache(None), backend=backend).translate_many(words)
+            translations[label] = time.perf_counter() - start
+        if args.shards:
+            # Every asset is cached by now, so only slide building, merging and saving are timed
+            single, _, _ = run_once(vocab, args.concurrency, output_dir, cache_dir, incremental=False)
+            sharded, _ = run_sharded(vocab, args.shards, args.concurrency, output_dir, cache_dir)
+    server.shutdown()
+
+    print(f"\n{args.words} words, {args.latency}s latency per request")
+    print(f"  serial (concurrency=1): {serial:.2f}s")
+    print(f"  prefetch (concurrency={args.concurrency}): {concurrent:.2f}s")
+    print(f"  speedup: {serial / concurrent:.1f}x")
+    print(f"  warm cache: {warm:.2f}s, {warm_requests} network requests")
+    print(f"  images unchanged: {unprocessed['deck_bytes'] / 1e6:.1f} MB, saved in {unprocessed['save_seconds']:.2f}s")
+    print(f"  images downscaled: {processed['deck_bytes'] / 1e6:.1f} MB, saved in {processed['save_seconds']:.2f}s")
+    for batch_tts, label in ((False, "one TTS request per word"), (True, "batched TTS")):
+        tts_requests, elapsed, audio_bytes = tts[batch_tts]
+        print(f"  {label}: {tts_requests} TTS requests, {elapsed:.2f}s, {audio_bytes / 1e3:.0f} kB of audio embedded")
+    print(f"  network providers: {network:.2f}s, {args.words / network:.1f} words/s, "
+          f"{network_requests} network requests, translation {translations['network']:.2f}s")
+    print(f"  local providers: {local:.2f}s, {args.words / local:.1f} words/s, "
+          f"{local_requests} network requests, translation {translations['local']:.3f}s")
+    if args.shards:
+        print(f"  slide building, one process: {single:.2f}s")
+        print(f"  slide building, {args.shards} shards: {sharded:.2f}s ({os.cpu_count()} CPU cores)")
+
+
+if __name__ == "__main__":
+    main()
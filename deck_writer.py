@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Pptx writer streaming slides into the zip while the deck is being built.
+
+python-pptx writes a presentation in one go when it is saved, so every
+slide and every image and mp3 blob stays in memory until the end. A
+StreamingDeckWriter writes a slide, its relationships and the images and
+audio it uses as soon as the slide is finished, then drops them, so the
+memory used no longer grows with the number of slides. The remaining
+parts (presentation, layouts, masters, theme...), the package
+relationships and [Content_Types].xml are written by close().
+"""
+import os
+import threading
+import zipfile
+
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.parts.image import ImagePart
+from pptx.parts.media import MediaPart
+
+
+class _WrittenImagePart(ImagePart):
+    """An image part whose bytes were written and released, keeping the native size of the image."""
+
+    @property
+    def _native_size(self):
+        return self._written_native_size
+
+
+class StreamingDeckWriter:
+    """
+    Writes the parts of a presentation to a pptx file as slides are finished.
+
+    output is a path or a writable binary file. A path is written through
+    a temporary file next to it, which close() renames into place and
+    abort() removes.
+    """
+
+    def __init__(self, prs, output):
+        self._package = prs.part.package
+        self._output = output
+        if isinstance(output, str):
+            self._target = f"{output}.tmp-{os.getpid()}-{threading.get_ident()}"
+        else:
+            self._target = output
+        self._zip = zipfile.ZipFile(self._target, "w", compression=zipfile.ZIP_DEFLATED, strict_timestamps=False)
+        self._written = set()
+        self.parts_streamed = 0
+
+    def write_slide(self, slide):
+        """
+        Write a finished slide and the images and audio it uses, and release them.
+
+        The slide must not be changed afterwards. Images and audio shared
+        with later slides stay in the package, without their bytes.
+        """
+        slide_part = slide.part
+        for rel in slide_part.rels.values():
+            if rel.is_external:
+                continue
+            part = rel.target_part
+            if isinstance(part, (ImagePart, MediaPart)) and part.partname not in self._written:
+                # Later images and audio are matched to the parts by the sha1
+                # of their bytes, computed on first use and then kept
+                part.sha1
+                if isinstance(part, ImagePart):
+                    # add_picture reads the native size of a shared image part
+                    # from its bytes, so keep it before they are dropped
+                    part._written_native_size = part._native_size
+                    part.__class__ = _WrittenImagePart
+                self._write_part(part)
+                part._blob = None
+        self._write_part(slide_part)
+        slide_part._element = None
+        slide_part.__dict__.pop("slide", None)
+
+    def _write_part(self, part):
+        self._zip.writestr(part.partname.membername, part.blob)
+        if part._rels:
+            self._zip.writestr(part.partname.rels_uri.membername, part.rels.xml)
+        self._written.add(part.partname)
+        self.parts_streamed += 1
+
+    def close(self):
+        """Write the remaining parts and the content types, and return the size of the deck in bytes."""
+        parts = tuple(self._package.iter_parts())
+        for part in parts:
+            if part.partname not in self._written:
+                self._write_part(part)
+        self._zip.writestr(PACKAGE_URI.rels_uri.membername, self._package._rels.xml)
+        self._zip.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        self._zip.close()
+        if self._target is self._output:
+            return self._output.tell()
+        os.replace(self._target, self._output)
+        return os.path.getsize(self._output)
+
+    def abort(self):
+        """Stop writing and remove the temporary file, leaving any existing deck as it was."""
+        self._zip.close()
+        if self._target is not self._output and os.path.exists(self._target):
+            os.remove(self._target)
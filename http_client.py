@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP client for Pixabay searches and image downloads.
+
+Keeps connections alive in a pooled requests.Session, applies connect and
+read timeouts, retries 429/5xx responses with exponential backoff, limits
+the request rate per host with a token bucket and keeps per-host counters.
+"""
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds to wait for a connection and for each read from the server
+DEFAULT_TIMEOUT = (5, 20)
+
+# Number of retries after the first attempt
+DEFAULT_RETRIES = 3
+
+# First backoff delay in seconds, doubled on every retry
+DEFAULT_BACKOFF = 0.5
+
+# Status codes that are worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Requests allowed per period (in seconds) for each host.
+# Pixabay documents a limit of 100 requests per 60 seconds for its API.
+RATE_LIMITS = {
+    "pixabay.com": (100, 60),
+}
+
+
+class TokenBucket:
+    """Allows `rate` requests per `period` seconds, with bursts of up to `rate`."""
+
+    def __init__(self, rate, period):
+        self.capacity = rate
+        self.refill_per_second = rate / period
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.refill_per_second
+            time.sleep(delay)
+            waited += delay
+
+
+class HostStats:
+    """Counters for one host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "throttle_wait": round(self.throttle_wait, 3),
+            "latency_avg": round(self.latency_total / self.requests, 3) if self.requests else 0.0,
+            "latency_max": round(self.latency_max, 3),
+        }
+
+
+class HttpClient:
+    """Pooled, rate limited HTTP client with retries."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 rate_limits=None, pool_size=16):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._buckets = {
+            host: TokenBucket(rate, period)
+            for host, (rate, period) in (RATE_LIMITS if rate_limits is None else rate_limits).items()
+        }
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def scale_rate_limits(self, share):
+        """Keep only a share of every rate limit, for clients running side by side."""
+        for bucket in self._buckets.values():
+            bucket.capacity = max(1, bucket.capacity * share)
+            bucket.refill_per_second *= share
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def _host_stats(self, host):
+        with self._lock:
+            return self._stats.setdefault(host, HostStats())
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+    def get(self, url, **kwargs):
+        """
+        Send a GET request and return the response.
+
+        Raises requests.HTTPError for error statuses once the retries are
+        used up, and the underlying exception for connection problems.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).hostname or ""
+        stats = self._host_stats(host)
+        bucket = self._buckets.get(host)
+
+        for attempt in range(self.retries + 1):
+            if bucket is not None:
+                waited = bucket.acquire()
+                if waited:
+                    with self._lock:
+                        stats.throttled += 1
+                        stats.throttle_wait += waited
+
+            response = None
+            error = None
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            latency = time.perf_counter() - start
+
+            with self._lock:
+                stats.requests += 1
+                stats.latency_total += latency
+                stats.latency_max = max(stats.latency_max, latency)
+                if response is not None and response.status_code == 429:
+                    stats.throttled += 1
+
+            if error is None and response.status_code not in RETRY_STATUS:
+                if response.status_code >= 400:
+                    with self._lock:
+                        stats.errors += 1
+                    response.raise_for_status()
+                return response
+
+            if attempt == self.retries:
+                with self._lock:
+                    stats.errors += 1
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+
+            with self._lock:
+                stats.retries += 1
+            if response is not None:
+                response.close()
+            time.sleep(self._retry_delay(attempt, response))
+
+    def stats(self):
+        """Return the counters of every host contacted so far."""
+        with self._lock:
+            return {host: stats.as_dict() for host, stats in self._stats.items()}
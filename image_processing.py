@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Downscale and recompress images before they are embedded.
+
+Pixabay's large images are often several megabytes, while the slide shows
+them in a 5" x 5" frame. Images are resized to the pixel size of the frame
+at a given DPI, stripped of metadata and re-encoded as JPEG (or PNG when
+they have transparency).
+"""
+import io
+from collections import namedtuple
+
+# Default resolution of embedded images, in pixels per inch of the frame
+DEFAULT_IMAGE_DPI = 150
+
+# Default JPEG quality of embedded images
+DEFAULT_IMAGE_QUALITY = 80
+
+EMU_PER_INCH = 914400
+
+# Largest size an image is resized to, and the JPEG quality to encode it with
+ImageSpec = namedtuple("ImageSpec", ["width", "height", "quality"])
+
+
+def image_spec(frame_width, frame_height, dpi=DEFAULT_IMAGE_DPI, quality=DEFAULT_IMAGE_QUALITY):
+    """Return the ImageSpec of a frame given in EMU, or None if dpi is 0 (no processing)."""
+    if not dpi:
+        return None
+    return ImageSpec(
+        max(1, round(frame_width / EMU_PER_INCH * dpi)),
+        max(1, round(frame_height / EMU_PER_INCH * dpi)),
+        quality,
+    )
+
+
+def _has_transparency(image):
+    if image.mode in ("RGBA", "LA"):
+        return image.getchannel("A").getextrema()[0] < 255
+    return image.mode == "P" and "transparency" in image.info
+
+
+def process_image(data, spec):
+    """
+    Return the bytes of an image resized to fit spec and re-encoded.
+
+    The original bytes are kept when re-encoding would make them larger.
+    """
+    # Pillow is only imported once there is an image to process
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        transparent = _has_transparency(image)
+        image = image.convert("RGBA" if transparent else "RGB")
+        image.thumbnail((spec.width, spec.height), Image.LANCZOS)
+
+        # Saving without the original info drops EXIF and other metadata
+        output = io.BytesIO()
+        if transparent:
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.save(output, format="JPEG", quality=spec.quality, optimize=True, progressive=True)
+
+    processed = output.getvalue()
+    return processed if len(processed) < len(data) else data
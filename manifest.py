@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Sidecar manifest for incremental deck regeneration.
+
+Next to each generated deck, <deck>.manifest.json records for every slide
+a hash of its inputs (Chinese, English, template fingerprint and image
+settings) and the hashes of its audio and image. When the deck is
+generated again, slides whose input hash is unchanged are copied from the
+previous deck instead of being rebuilt.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_path):
+    """Return the path of the manifest written next to a deck."""
+    return output_path + ".manifest.json"
+
+
+def row_key(chinese, english, template_fingerprint, settings):
+    """Return the hash of everything a slide is built from."""
+    data = json.dumps([chinese, english, template_fingerprint, settings], ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def content_hash(data):
+    """Return the hash of an asset, or None if there is no asset."""
+    return hashlib.sha256(data).hexdigest() if data is not None else None
+
+
+class PreviousDeck:
+    """
+    The slides of a previously generated deck, looked up by their input hash.
+
+    Slides marked degraded (built without some of their assets) are left
+    out, so they are rebuilt.
+    """
+
+    def __init__(self, entries, slides):
+        self._slides = {}
+        self._entries = {}
+        for entry, slide in zip(entries, slides):
+            if entry.get("degraded"):
+                continue
+            self._slides.setdefault(entry["key"], slide)
+            self._entries.setdefault(entry["key"], entry)
+
+    def __contains__(self, key):
+        return key in self._slides
+
+    def __len__(self):
+        return len(self._slides)
+
+    def slide(self, key):
+        return self._slides[key]
+
+    def entry(self, key):
+        return self._entries[key]
+
+
+def load_previous_deck(output_path, template_fingerprint):
+    """
+    Return the PreviousDeck at output_path, or None if it cannot be reused.
+
+    A deck is only reused when its manifest exists, was built from the same
+    template and still matches the number of slides in the deck.
+    """
+    from pptx import Presentation
+
+    path = manifest_path(output_path)
+    if not (os.path.exists(output_path) and os.path.exists(path)):
+        return None
+    try:
+        with open(path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("template") != template_fingerprint:
+            print("Template changed since the last run, rebuilding every slide.")
+            return None
+        prs = Presentation(output_path)
+    except Exception as e:
+        print(f"Cannot reuse previous deck {output_path}: {e}")
+        return None
+
+    slides = list(prs.slides)
+    if len(slides) != len(manifest["slides"]):
+        print(f"{output_path} was changed since the last run, rebuilding every slide.")
+        return None
+    return PreviousDeck(manifest["slides"], slides)
+
+
+def write_manifest(output_path, template_fingerprint, entries):
+    """Write the manifest of a deck atomically."""
+    path = manifest_path(output_path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+        json.dump(
+            {"version": MANIFEST_VERSION, "template": template_fingerprint, "slides": entries},
+            temp_file, ensure_ascii=False, indent=1,
+        )
+    os.replace(temp_path, path)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache for generated audio, image search results and
+downloaded images, so words reused across lessons are only fetched once.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+# Default location of the cache, shared by every run on this machine
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mandarin_ppt_cache")
+
+# Default size cap of the cache (500 MB)
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+# Marks the SQLite stores kept in the cache directory (pinyin, search
+# index) and their journals, which are not entries and never evicted
+STORE_MARKER = ".sqlite3"
+
+
+def make_key(*parts):
+    """Return the content address for a tuple of key parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """
+    Content-addressed file cache with a size cap and LRU eviction.
+
+    Entries are stored as <key><suffix> files in cache_dir. The modification
+    time of a file is its last use, so the least recently used entries are
+    removed first once the cache grows beyond max_bytes.
+
+    read() looks entries up in the asset pack pack first, if one is
+    mounted (see asset_pack).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, pack=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.pack = pack
+        self.hits = 0
+        self.misses = 0
+        self.pack_hits = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Map of file name -> (size, last use), rebuilt from disk on start
+        self._entries = {}
+        for file_name in os.listdir(cache_dir):
+            file_path = os.path.join(cache_dir, file_name)
+            if file_name.startswith(".") or STORE_MARKER in file_name or not os.path.isfile(file_path):
+                continue
+            stat = os.stat(file_path)
+            self._entries[file_name] = (stat.st_size, stat.st_mtime)
+        self._total_bytes = sum(size for size, _ in self._entries.values())
+
+    def get(self, key, suffix=""):
+        """Return the path of a cached entry, or None if it is not cached."""
+        file_name = key + suffix
+        file_path = os.path.join(self.cache_dir, file_name)
+        with self._lock:
+            entry = self._entries.get(file_name)
+            if entry is None or not os.path.exists(file_path):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Mark the entry as recently used
+            try:
+                os.utime(file_path)
+                self._entries[file_name] = (entry[0], os.path.getmtime(file_path))
+            except OSError:
+                pass
+        return file_path
+
+    def contains(self, key, suffix=""):
+        """Return whether an entry is cached, without counting a hit or miss."""
+        with self._lock:
+            if key + suffix in self._entries:
+                return True
+        return self.pack is not None and self.pack.contains(key + suffix)
+
+    def read(self, key, suffix=""):
+        """Return the bytes of a cached entry, or None if it is not cached."""
+        if self.pack is not None:
+            data = self.pack.read(key + suffix)
+            if data is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.pack_hits += 1
+                return data
+        file_path = self.get(key, suffix)
+        if file_path is None:
+            return None
+        try:
+            with open(file_path, "rb") as cached_file:
+                return cached_file.read()
+        except OSError:
+            # Evicted by another process after the lookup
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+                entry = self._entries.pop(key + suffix, None)
+                if entry is not None:
+                    self._total_bytes -= entry[0]
+            return None
+
+    def put(self, key, data, suffix=""):
+        """Store data atomically under key and return the path of the entry."""
+        file_name = key + suffix
+        file_path = os.path.join(self.cache_dir, file_name)
+
+        # Write to a temporary file first so readers never see partial data
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, file_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            old = self._entries.get(file_name)
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._entries[file_name] = (len(data), os.path.getmtime(file_path))
+            self._total_bytes += len(data)
+            self._evict(keep=file_name)
+        return file_path
+
+    def _evict(self, keep):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for file_name, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if file_name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                continue
+            del self._entries[file_name]
+            self._total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return the hit/miss counters and current size of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "pack_hits": self.pack_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Stage timers, counters and per-word spans for a generation run.
+
+A RunMetrics collects how long each stage (translation, TTS, Pixabay
+search, download, slide building, save...) took, overall and per word,
+and can log every span and event (run start and end, skipped rows,
+degraded slides) as a JSON line. NULL_METRICS does nothing and is used
+when instrumentation is off, so the cost is a method call per stage.
+"""
+import contextlib
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "word", "start")
+
+    def __init__(self, metrics, stage, word):
+        self.metrics = metrics
+        self.stage = stage
+        self.word = word
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._record(self.stage, self.word, self.start, time.perf_counter() - self.start, exc is not None)
+        return False
+
+
+class RunMetrics:
+    """Collects timings and counters of one run."""
+
+    def __init__(self, events_path=None):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.words = {}
+        self._lock = threading.Lock()
+        self._events = open(events_path, "a", encoding="utf-8") if events_path else None
+
+    def stage(self, name, word=None):
+        """Context manager timing one stage, optionally for one word."""
+        return _Span(self, name, word)
+
+    def timed_iter(self, iterable, name):
+        """Yield from iterable, timing each wait for the next item as a stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _record(self, stage, word, start, duration, failed):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max": 0.0, "errors": 0})
+            totals["count"] += 1
+            totals["seconds"] += duration
+            totals["max"] = max(totals["max"], duration)
+            if failed:
+                totals["errors"] += 1
+            if word is not None:
+                spans = self.words.setdefault(word, {})
+                spans[stage] = spans.get(stage, 0.0) + duration
+            if self._events:
+                self._events.write(json.dumps({
+                    "event": "span",
+                    "stage": stage,
+                    "word": word,
+                    "start": round(start - self.started, 6),
+                    "seconds": round(duration, 6),
+                    "failed": failed,
+                }, ensure_ascii=False) + "\n")
+
+    def event(self, name, **fields):
+        """Log a single event to the JSON-lines log, if there is one."""
+        if self._events:
+            with self._lock:
+                fields.update(event=name, time=round(time.perf_counter() - self.started, 6))
+                self._events.write(json.dumps(fields, ensure_ascii=False) + "\n")
+
+    def report(self):
+        """Return the stage totals, counters and per-word spans as a dict."""
+        with self._lock:
+            return {
+                "elapsed": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    name: dict(totals, seconds=round(totals["seconds"], 4), max=round(totals["max"], 4))
+                    for name, totals in self.stages.items()
+                },
+                "counters": dict(self.counters),
+                "words": {
+                    word: {stage: round(seconds, 4) for stage, seconds in spans.items()}
+                    for word, spans in self.words.items()
+                },
+            }
+
+    def close(self):
+        if self._events:
+            self._events.close()
+            self._events = None
+
+
+class _NullMetrics:
+    """Stand-in for RunMetrics when instrumentation is off."""
+
+    _span = contextlib.nullcontext()
+
+    def stage(self, name, word=None):
+        return self._span
+
+    def timed_iter(self, iterable, name):
+        return iterable
+
+    def count(self, name, amount=1):
+        pass
+
+    def event(self, name, **fields):
+        pass
+
+    def report(self):
+        return None
+
+    def close(self):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+class RequestTally:
+    """
+    Metrics of one word: passes everything on to metrics and keeps its own
+    total of the provider requests (the provider_requests counter) made
+    for the word.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        if name == "provider_requests":
+            with self._lock:
+                self.requests += amount
+        self.metrics.count(name, amount)
+
+    def __getattr__(self, name):
+        return getattr(self.metrics, name)
+
+# Profilers that can be run around a generation
+PROFILERS = ("cprofile", "tracemalloc")
+
+
+@contextlib.contextmanager
+def profiled(profiler, output_path):
+    """
+    Run the enclosed code under cProfile or tracemalloc and dump the result.
+
+    cProfile only sees the calling thread, which builds the slides; fetching
+    and translation run in background threads. tracemalloc sees all threads
+    and writes a snapshot for tracemalloc.Snapshot.load.
+    """
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(output_path)
+            print(f"cProfile stats written to {output_path}")
+    elif profiler == "tracemalloc":
+        tracemalloc.start(10)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(output_path)
+            print(f"tracemalloc snapshot written to {output_path} (peak {peak / 1e6:.1f} MB)")
+    else:
+        yield
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Pinyin annotation of vocabulary with memoization.
+
+A word is segmented by pypinyin once and every style is derived from that
+pass: tone marks (nǐ hǎo), tone numbers (ni3 hao3) and zhuyin (ㄋㄧˇ ㄏㄠˇ).
+Annotations are kept in a bounded LRU in memory and, optionally, in a
+SQLite file shared by all runs, so words repeated across lessons are only
+converted once. An override table gives the reading of polyphones that
+pypinyin gets wrong, for whole words or for phrases inside them.
+"""
+import collections
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from media_cache import DEFAULT_CACHE_DIR, STORE_MARKER
+
+# Styles of an annotation, in the order they are stored
+STYLES = ("tone", "tone_numbers", "zhuyin")
+DEFAULT_STYLE = "tone"
+
+# File name of the store in a cache directory. It carries the store marker,
+# so the media cache sharing the directory never counts or evicts the
+# store or its -wal and -shm files while it is open
+PINYIN_STORE_NAME = "pinyin" + STORE_MARKER
+
+# Default location of the persistent store
+DEFAULT_PINYIN_STORE = os.path.join(DEFAULT_CACHE_DIR, PINYIN_STORE_NAME)
+
+# Words kept in memory
+DEFAULT_MAX_ENTRIES = 10000
+
+# Words looked up in the store per query, below SQLite's variable limit
+STORE_QUERY_SIZE = 500
+
+
+def load_overrides(path):
+    """
+    Read a polyphone override table, a CSV file of word,pinyin rows.
+
+    The pinyin has one syllable per character, separated by spaces, with
+    tone marks (yín háng) or tone numbers (yin2 hang2). Empty rows and rows
+    starting with # are ignored. Raises ValueError for malformed rows.
+    """
+    from pypinyin.contrib.tone_convert import tone3_to_tone
+
+    overrides = {}
+    with open(path, newline="", encoding="utf-8-sig") as overrides_file:
+        for line_number, row in enumerate(csv.reader(overrides_file), start=1):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            word = row[0].strip()
+            syllables = [tone3_to_tone(syllable) for syllable in (row[1] if len(row) > 1 else "").split()]
+            if len(syllables) != len(word):
+                raise ValueError(f"{path}, line {line_number}: {word} has {len(word)} characters "
+                                 f"but {len(syllables)} syllables")
+            overrides[word] = syllables
+    return overrides
+
+
+class PinyinEngine:
+    """
+    Converts Chinese words to pinyin, remembering the results.
+
+    store_path is the SQLite file shared between runs, or None to keep
+    annotations in memory only. overrides maps words or phrases to their
+    tone-marked syllables, as returned by load_overrides. Annotations in
+    the asset pack pack, if one is mounted, are used before the store.
+    """
+
+    def __init__(self, store_path=DEFAULT_PINYIN_STORE, overrides=None, max_entries=DEFAULT_MAX_ENTRIES, pack=None):
+        self.store_path = store_path
+        self.pack = pack
+        self.overrides = dict(overrides or {})
+        self.overrides_fingerprint = hashlib.sha256(
+            json.dumps(self.overrides, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.pack_hits = 0
+        self.store_hits = 0
+        self.converted = 0
+        self._longest_override = max(map(len, self.overrides), default=0)
+        self._memory = collections.OrderedDict()
+        # Tone numbers and zhuyin of each syllable; there are only about
+        # 1300 toned syllables and converting them is most of the work
+        self._syllable_styles = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if store_path:
+            try:
+                self._db = self._open_store(store_path)
+            except sqlite3.Error as e:
+                print(f"Ignoring unreadable pinyin store {store_path}: {e}")
+
+    def _open_store(self, path):
+        import pypinyin
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # Losing the last writes of a cache on a crash is fine
+        db.execute("PRAGMA synchronous=NORMAL")
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS pinyin "
+                       "(word TEXT PRIMARY KEY, tone TEXT, tone_numbers TEXT, zhuyin TEXT)")
+            row = db.execute("SELECT value FROM meta WHERE key = 'pypinyin'").fetchone()
+            if row is None or row[0] != pypinyin.__version__:
+                # Readings change between pypinyin versions
+                db.execute("DELETE FROM pinyin")
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('pypinyin', ?)", (pypinyin.__version__,))
+        return db
+
+    def _segment(self, text):
+        """Return (syllable, is_pinyin) pairs of text, leaving non-Chinese runs as they are."""
+        if not text:
+            return []
+        from pypinyin import Style, pinyin
+
+        # Runs pypinyin cannot convert are marked so they are not converted to other styles
+        items = pinyin(text, style=Style.TONE, errors=lambda chars: ["\0" + chars])
+        return [(item[0][1:], False) if item[0].startswith("\0") else (item[0], True) for item in items]
+
+    def _syllables(self, word):
+        """Return the (syllable, is_pinyin) pairs of word and whether an override applied."""
+        if not self._longest_override:
+            return self._segment(word), False
+        # Take the longest override at each position, pypinyin does the rest
+        items = []
+        overridden = False
+        rest_start = position = 0
+        while position < len(word):
+            for length in range(min(self._longest_override, len(word) - position), 0, -1):
+                phrase = word[position:position + length]
+                if phrase in self.overrides:
+                    items += self._segment(word[rest_start:position])
+                    items += [(syllable, True) for syllable in self.overrides[phrase]]
+                    overridden = True
+                    position += length
+                    rest_start = position
+                    break
+            else:
+                position += 1
+        items += self._segment(word[rest_start:])
+        return items, overridden
+
+    def _syllable_in_styles(self, syllable):
+        """Return the tone-number and zhuyin forms of a tone-marked syllable."""
+        styles = self._syllable_styles.get(syllable)
+        if styles is None:
+            from pypinyin import Style
+            from pypinyin.style import convert
+            styles = (convert(syllable, Style.TONE3, True, None), convert(syllable, Style.BOPOMOFO, True, None))
+            self._syllable_styles[syllable] = styles
+        return styles
+
+    def _annotate(self, word):
+        """Convert word in every style and return (annotation tuple, whether an override applied)."""
+        items, overridden = self._syllables(word)
+        tones, numbers, zhuyin = [], [], []
+        for syllable, is_pinyin in items:
+            tones.append(syllable)
+            if is_pinyin:
+                syllable_numbers, syllable_zhuyin = self._syllable_in_styles(syllable)
+            else:
+                syllable_numbers = syllable_zhuyin = syllable
+            numbers.append(syllable_numbers)
+            zhuyin.append(syllable_zhuyin)
+        return (" ".join(tones), " ".join(numbers), " ".join(zhuyin)), overridden
+
+    def _load(self, words):
+        """Return the stored annotations of words, by word."""
+        found = {}
+        if self._db is None or not words:
+            return found
+        with self._lock:
+            for start in range(0, len(words), STORE_QUERY_SIZE):
+                chunk = words[start:start + STORE_QUERY_SIZE]
+                rows = self._db.execute(
+                    f"SELECT word, tone, tone_numbers, zhuyin FROM pinyin WHERE word IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for word, *annotation in rows:
+                    found[word] = tuple(annotation)
+        return found
+
+    def _store(self, annotations):
+        if self._db is None or not annotations:
+            return
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO pinyin VALUES (?, ?, ?, ?)",
+                                         [(word, *annotation) for word, annotation in annotations.items()])
+            except sqlite3.Error as e:
+                print(f"Could not write to the pinyin store: {e}")
+
+    def _lookup_many(self, words):
+        """Return the annotation tuple of every distinct word in words, by word."""
+        results = {}
+        missing = []
+        with self._lock:
+            for word in words:
+                if word in results:
+                    continue
+                annotation = self._memory.get(word)
+                if annotation is None:
+                    results[word] = None
+                    missing.append(word)
+                else:
+                    self._memory.move_to_end(word)
+                    results[word] = annotation
+                    self.memory_hits += 1
+        if not missing:
+            return results
+
+        # Words with an override are never stored, so the table can change between runs
+        plain = [word for word in missing if not self._has_override(word)]
+        packed = {}
+        if self.pack is not None:
+            for word in plain:
+                annotation = self.pack.pinyin(word)
+                if annotation is not None:
+                    packed[word] = annotation
+        stored = self._load([word for word in plain if word not in packed])
+        stored.update(packed)
+        converted = {}
+        for word in missing:
+            annotation = stored.get(word)
+            if annotation is None:
+                annotation, overridden = self._annotate(word)
+                if not overridden:
+                    converted[word] = annotation
+            results[word] = annotation
+        self._store(converted)
+
+        with self._lock:
+            self.pack_hits += len(packed)
+            self.store_hits += len(stored) - len(packed)
+            self.converted += len(missing) - len(stored)
+            for word in missing:
+                self._memory[word] = results[word]
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        return results
+
+    def _has_override(self, word):
+        return bool(self._longest_override) and any(phrase in word for phrase in self.overrides)
+
+    def annotate_many(self, words):
+        """Return the annotation of each word, a dict of style -> text, in the same order."""
+        results = self._lookup_many(words)
+        return [dict(zip(STYLES, results[word])) for word in words]
+
+    def convert_many(self, words, style=DEFAULT_STYLE):
+        """Return the pinyin of each word in one style, in the same order."""
+        index = STYLES.index(style)
+        results = self._lookup_many(words)
+        return [results[word][index] for word in words]
+
+    def convert(self, word, style=DEFAULT_STYLE):
+        return self.convert_many([word], style)[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "pack_hits": self.pack_hits,
+                "store_hits": self.store_hits,
+                "converted": self.converted,
+                "entries": len(self._memory),
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to connect generator stages with bounded queues, so each stage
+runs ahead of the next one by at most a few items.
+"""
+import collections
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Default number of items a stage may run ahead of the next one
+DEFAULT_QUEUE_SIZE = 32
+
+_DONE = object()
+
+
+class Cancelled(Exception):
+    """Raised inside a run once its cancel event is set."""
+
+
+def raise_if_cancelled(cancel):
+    """Raise Cancelled if the threading.Event cancel is set. cancel may be None."""
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("generation was cancelled")
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def run_in_thread(iterable, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Consume iterable in a background thread and yield its items.
+
+    Items pass through a queue of maxsize, so the producer blocks once it
+    is that far ahead. Exceptions raised by the producer are re-raised in
+    the consumer.
+    """
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageError(e))
+            return
+        finally:
+            # Stop generator stages right away instead of when garbage collected
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+        put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        # Let the producer exit if the consumer stops early
+        stopped.set()
+
+
+def ordered_map(func, iterable, concurrency, window=None):
+    """
+    Yield func(item) for every item, computed by a thread pool.
+
+    Results come out in input order. At most window items (default twice
+    the concurrency) are in flight, so the input is read lazily.
+    """
+    window = window or concurrency * 2
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        pending = collections.deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Drop work that has not started when the consumer stops early
+            for future in pending:
+                future.cancel()
+
+
+class ThreadPerCall:
+    """
+    Executor running every call in a daemon thread of its own.
+
+    The caller limits how many calls are in flight. A call it gave up on
+    keeps running without taking the place of later calls, as it would in
+    the fixed set of workers of a ThreadPoolExecutor.
+    """
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
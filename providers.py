@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Providers of the audio, images and translations of a deck.
+
+Each kind has an online provider, the default, and an offline one:
+
+    TTS          gtts                  gTTS (Google), batched (see tts_batch)
+                 local[:COMMAND]       a local speech engine, espeak-ng by default
+    images       pixabay[:API_KEY]     Pixabay search and download
+                 library:DIRECTORY     a local image library, indexed once
+    translation  google                Google Translate (deep_translator)
+                 dictionary:PATH       a local dictionary file
+
+load_providers() takes these specs, as given to --tts, --images and
+--translator on the command line, and returns the Providers of a run.
+
+A TTS provider has a name (part of the media cache key of its audio), the
+extension of the audio it makes, whether it is remote (network requests
+are limited and searches are kept in the search index), whether batch
+requests are cheaper than single ones, and synthesize(text) returning the
+audio bytes. An image provider has a name, remote, search(query) returning
+ranked hits (dicts with a largeImageURL, see pick_image_url) and
+fetch(url) returning the image bytes. A translation provider has
+translate(text), translating every line of text (see BatchTranslator).
+
+The image library index is built by `python providers.py index DIRECTORY`
+or on first use. It maps the words of the file names, of their folders and
+of an optional tags.csv file (relative path,keywords) to the images, in a
+SQLite file read through a memory map, so a lookup never lists the
+library.
+"""
+import argparse
+import csv
+import os
+import pathlib
+import re
+import shlex
+import sqlite3
+import subprocess
+import sys
+import threading
+import urllib.parse
+import urllib.request
+
+from search_index import normalize_query
+
+TTS_PROVIDERS = ("gtts", "local")
+IMAGE_PROVIDERS = ("pixabay", "library")
+TRANSLATION_PROVIDERS = ("google", "dictionary")
+
+# Local speech engine: {text} is replaced by the word, the audio is read from stdout
+DEFAULT_LOCAL_TTS_COMMAND = "espeak-ng -v cmn --stdout {text}"
+
+# Seconds a local speech engine gets per word
+LOCAL_TTS_TIMEOUT = 30
+
+# Index file of an image library, inside the library
+LIBRARY_INDEX_NAME = ".image_index.sqlite3"
+
+# Optional file of relative path,keywords rows in the library
+LIBRARY_TAGS_NAME = "tags.csv"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp")
+
+# Bytes of the index mapped into memory
+LIBRARY_MMAP_BYTES = 256 * 1024 * 1024
+
+# Hits returned by a library search
+LIBRARY_MAX_HITS = 20
+
+
+class GTTSProvider:
+    """gTTS, one request per text of up to 100 characters."""
+
+    name = "gtts"
+    extension = "mp3"
+    remote = True
+    batch = True
+
+    def synthesize(self, text):
+        import simple_mandarin_ppt as smp
+        return smp.synthesize_audio(text)
+
+
+class LocalTTSProvider:
+    """
+    A local speech engine run as a command, which prints the audio of
+    the text in place of {text} (or appended to it) to stdout.
+    """
+
+    remote = False
+    batch = False
+
+    def __init__(self, command=DEFAULT_LOCAL_TTS_COMMAND, extension="wav"):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.extension = extension
+        self.name = "local " + " ".join(self.command)
+
+    def synthesize(self, text):
+        if "{text}" in self.command:
+            args = [text if arg == "{text}" else arg for arg in self.command]
+        else:
+            args = self.command + [text]
+        result = subprocess.run(args, capture_output=True, timeout=LOCAL_TTS_TIMEOUT, check=True)
+        if not result.stdout:
+            raise ValueError(f"{self.command[0]} wrote no audio for {text}")
+        return result.stdout
+
+
+class PixabayProvider:
+    """Pixabay image search, with the API key of the script unless another one is given."""
+
+    name = "pixabay"
+    remote = True
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def search(self, query):
+        import simple_mandarin_ppt as smp
+        return smp.query_pixabay_hits(query, self.api_key or smp.PIXABAY_API_KEY)
+
+    def fetch(self, url):
+        import simple_mandarin_ppt as smp
+        return smp.get_http_client().get(url).content
+
+
+def _keywords(text):
+    """Return the normalized words of a file name or tag, and the whole of it as a phrase."""
+    phrase = normalize_query(text)
+    words = set(phrase.split())
+    if phrase:
+        words.add(phrase)
+    return words
+
+
+def build_library_index(directory):
+    """Index the images of a library directory by keyword and return the number of images."""
+    directory = os.path.abspath(directory)
+    tags = {}
+    tags_path = os.path.join(directory, LIBRARY_TAGS_NAME)
+    if os.path.exists(tags_path):
+        with open(tags_path, newline="", encoding="utf-8-sig") as tags_file:
+            for row in csv.reader(tags_file):
+                if len(row) >= 2 and not row[0].startswith("#"):
+                    tags[os.path.normpath(row[0].strip())] = row[1:]
+
+    index_path = os.path.join(directory, LIBRARY_INDEX_NAME)
+    temp_path = f"{index_path}.tmp-{os.getpid()}"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    db = sqlite3.connect(temp_path)
+    db.execute("CREATE TABLE images (id INTEGER PRIMARY KEY, url TEXT)")
+    db.execute("CREATE TABLE keywords (word TEXT, image INTEGER)")
+    count = 0
+    for root, folders, files in os.walk(directory):
+        folders[:] = sorted(folder for folder in folders if not folder.startswith("."))
+        for file_name in sorted(files):
+            stem, extension = os.path.splitext(file_name)
+            if extension.lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(root, file_name)
+            relative = os.path.relpath(path, directory)
+            words = _keywords(stem)
+            for folder in pathlib.Path(relative).parent.parts:
+                words |= _keywords(folder)
+            for tag in tags.get(os.path.normpath(relative), []):
+                words |= _keywords(tag)
+            # The modification time makes an edited image a new media cache entry
+            url = f"{pathlib.Path(path).as_uri()}#{os.stat(path).st_mtime_ns}"
+            image_id = db.execute("INSERT INTO images (url) VALUES (?)", (url,)).lastrowid
+            db.executemany("INSERT INTO keywords VALUES (?, ?)", [(word, image_id) for word in words])
+            count += 1
+    db.execute("CREATE INDEX keywords_word ON keywords (word)")
+    db.commit()
+    db.close()
+    os.replace(temp_path, index_path)
+    return count
+
+
+class ImageLibrary:
+    """
+    A directory of images searched through its keyword index.
+
+    The index is built when the library has none; after images are added,
+    rebuild it with build_library_index.
+    """
+
+    remote = False
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"Image library not found: {directory}")
+        self.name = "library " + self.directory
+        index_path = os.path.join(self.directory, LIBRARY_INDEX_NAME)
+        if not os.path.exists(index_path):
+            print(f"Indexing image library {self.directory}")
+            build_library_index(self.directory)
+        uri = pathlib.Path(index_path).as_uri() + "?mode=ro&immutable=1"
+        self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._db.execute(f"PRAGMA mmap_size={LIBRARY_MMAP_BYTES}")
+        self._lock = threading.Lock()
+
+    def search(self, query):
+        """Return the images whose keywords contain the whole query or all of its words."""
+        phrase = normalize_query(query)
+        words = sorted(set(phrase.split()) | {phrase}) if phrase else []
+        if not words:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT images.url, MAX(keywords.word = ?) AS exact, COUNT(DISTINCT keywords.word) AS matched "
+                f"FROM keywords JOIN images ON images.id = keywords.image "
+                f"WHERE keywords.word IN ({','.join('?' * len(words))}) "
+                f"GROUP BY keywords.image HAVING exact OR matched >= ? "
+                f"ORDER BY exact DESC, matched DESC, images.id LIMIT ?",
+                [phrase, *words, len(phrase.split()), LIBRARY_MAX_HITS],
+            ).fetchall()
+        return [{"largeImageURL": url} for url, _, _ in rows]
+
+    def fetch(self, url):
+        path = urllib.request.url2pathname(urllib.parse.urlparse(url).path)
+        with open(path, "rb") as image_file:
+            return image_file.read()
+
+
+class DictionaryTranslator:
+    """
+    Translates Chinese words with a local dictionary file.
+
+    The file is a CSV of chinese,english rows, or CC-CEDICT
+    (traditional simplified [pinyin] /gloss/gloss/), of which the first
+    gloss of an entry is used. Lines without an entry are translated to
+    an empty line, which BatchTranslator records as a failure.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        cedict_line = re.compile(r"^(\S+) (\S+) \[[^\]]*\] /([^/]+)/")
+        with open(path, encoding="utf-8-sig") as dictionary_file:
+            for line in dictionary_file:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                match = cedict_line.match(line)
+                if match:
+                    traditional, simplified, gloss = match.groups()
+                    self.entries.setdefault(simplified, gloss)
+                    self.entries.setdefault(traditional, gloss)
+                    continue
+                row = next(csv.reader([line]))
+                if len(row) >= 2 and row[0].strip() and row[1].strip():
+                    self.entries.setdefault(row[0].strip(), row[1].strip())
+
+    def translate(self, text):
+        return "\n".join(self.entries.get(line.strip(), "") for line in text.split("\n"))
+
+
+# Specs of the default providers
+DEFAULT_SPECS = ("gtts", "pixabay", "google")
+
+
+class Providers:
+    """
+    The TTS, image and translation providers of a run, and the
+    (tts, images, translation) specs they were made from.
+
+    specs is None for providers given as objects, which worker processes
+    cannot make again; load_providers records the specs.
+    """
+
+    def __init__(self, tts=None, images=None, translator=None, specs=None):
+        self.tts = tts or GTTSProvider()
+        self.images = images or PixabayProvider()
+        # None keeps the default GoogleTranslator of BatchTranslator
+        self.translator = translator
+        if specs is None and tts is None and images is None and translator is None:
+            specs = DEFAULT_SPECS
+        self.specs = specs
+
+
+def _split_spec(spec, kinds):
+    name, _, argument = spec.partition(":")
+    if name not in kinds:
+        raise ValueError(f"Unknown provider {name!r}, expected one of {', '.join(kinds)}")
+    return name, argument or None
+
+
+def load_providers(tts="gtts", images="pixabay", translation="google"):
+    """
+    Return the Providers given by spec strings, "name" or "name:argument".
+
+    Raises ValueError for an unknown or incomplete spec and
+    FileNotFoundError for a missing library or dictionary.
+    """
+    tts_name, tts_argument = _split_spec(tts or "gtts", TTS_PROVIDERS)
+    images_name, images_argument = _split_spec(images or "pixabay", IMAGE_PROVIDERS)
+    translation_name, translation_argument = _split_spec(translation or "google", TRANSLATION_PROVIDERS)
+
+    tts_provider = LocalTTSProvider(tts_argument or DEFAULT_LOCAL_TTS_COMMAND) if tts_name == "local" else None
+    if images_name == "library":
+        if not images_argument:
+            raise ValueError("The library image provider needs a directory: library:DIRECTORY")
+        images_provider = ImageLibrary(images_argument)
+    else:
+        images_provider = PixabayProvider(images_argument)
+    translator = None
+    if translation_name == "dictionary":
+        if not translation_argument:
+            raise ValueError("The dictionary translation provider needs a file: dictionary:PATH")
+        translator = DictionaryTranslator(translation_argument)
+    return Providers(tts_provider, images_provider, translator, (tts, images, translation))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="Build or rebuild the keyword index of an image library")
+    index.add_argument("directory")
+    search = commands.add_parser("search", help="Show the images of a library matching a query")
+    search.add_argument("directory")
+    search.add_argument("query")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Directory not found: {args.directory}", file=sys.stderr)
+        return 2
+    if args.command == "index":
+        print(f"Indexed {build_library_index(args.directory)} images of {args.directory}")
+    else:
+        for hit in ImageLibrary(args.directory).search(args.query):
+            print(hit["largeImageURL"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent index of Pixabay image searches.
+
+Queries are normalized first (case, punctuation, whitespace, stopwords and
+simple plurals), so "Cats", "the cat" and "cat!" share one entry; Pixabay
+itself is searched with the query as the caller gave it. An entry
+keeps the whole ranked hit list of a search for a while (ttl), and a
+search without hits is kept as a negative entry (negative_ttl), so a word
+Pixabay has no image for goes straight to the placeholder instead of
+being searched again on every run. Lookups of a query that is already
+being searched wait for that search, so near-duplicate words of a deck
+cost a single API call.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Seconds a hit list and a search without hits are kept
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 3600
+
+# Words left out of a query unless it has no other words
+STOPWORDS = frozenset("a an the to of for and or in on at by with my your his her its our their".split())
+
+# Endings of words singular() leaves as they are
+UNCHANGED_ENDINGS = ("ss", "us", "is", "ies", "ws")
+
+# Hit fields kept in the index
+HIT_FIELDS = ("largeImageURL", "webformatURL", "webformatWidth", "webformatHeight")
+
+
+def singular(word):
+    """
+    Return the singular of a regular English plural, or word unchanged.
+
+    Only used for index keys. Words whose singular cannot be told from
+    their ending (movies, series, news, bus, glass) are left as they are.
+    """
+    if word.endswith(UNCHANGED_ENDINGS):
+        return word
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_query(query):
+    """Return the form of a search query its index entry is kept under."""
+    words = re.findall(r"[^\W_]+", query.lower().replace("'", ""))
+    kept = [singular(word) for word in words if word not in STOPWORDS]
+    return " ".join(kept or words)
+
+
+class SearchIndex:
+    """
+    Ranked Pixabay hits by normalized query, shared by threads and runs.
+
+    path is the SQLite file of the index, or None to keep it in memory.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lookups = 0
+        self.api_calls = 0
+        self.index_hits = 0
+        self.negative_hits = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        # Normalized query -> Future of the search in progress
+        self._in_flight = {}
+        self._db = None
+        try:
+            self._db = self._open(path)
+        except sqlite3.Error as e:
+            print(f"Ignoring unreadable search index {path}: {e}")
+            self._db = self._open(None)
+
+    def _open(self, path):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path or ":memory:", timeout=30, check_same_thread=False)
+        if path:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, hits TEXT, fetched REAL)")
+        return db
+
+    def _load(self, query):
+        """Return the hits of a query if its entry has not expired, or None."""
+        row = self._db.execute("SELECT hits, fetched FROM searches WHERE query = ?", (query,)).fetchone()
+        if row is None:
+            return None
+        hits = json.loads(row[0])
+        if time.time() - row[1] > (self.ttl if hits else self.negative_ttl):
+            return None
+        return hits
+
+    def _store(self, query, hits):
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                                     (query, json.dumps(hits), time.time()))
+            except sqlite3.Error as e:
+                print(f"Could not write to the search index: {e}")
+
+    def lookup(self, query, search):
+        """
+        Return (hits, searched) for a query.
+
+        hits is the ranked list of hit dicts, empty when the search found
+        nothing. The index entry is kept under the normalized query, but
+        when it has no current one, search is called with the query as
+        given to get the hits, and searched is True.
+        Exceptions raised by search are raised to every lookup waiting
+        for it, and nothing is stored.
+        """
+        normalized = normalize_query(query)
+        if not normalized:
+            return [], False
+        with self._lock:
+            self.lookups += 1
+            hits = self._load(normalized)
+            if hits is not None:
+                if hits:
+                    self.index_hits += 1
+                else:
+                    self.negative_hits += 1
+                return hits, False
+            future = self._in_flight.get(normalized)
+            searching = future is None
+            if searching:
+                future = self._in_flight[normalized] = Future()
+            else:
+                self.collapsed += 1
+        if not searching:
+            return future.result(), False
+
+        try:
+            hits = [{field: hit[field] for field in HIT_FIELDS if field in hit} for hit in search(query)]
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[normalized]
+            future.set_exception(e)
+            raise
+        # Stored before the search is done, so no lookup misses both
+        self._store(normalized, hits)
+        with self._lock:
+            del self._in_flight[normalized]
+            self.api_calls += 1
+        future.set_result(hits)
+        return hits, True
+
+    def stats(self):
+        """Return the lookup counters; saved is the number of lookups answered without an API call."""
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "api_calls": self.api_calls,
+                "index_hits": self.index_hits,
+                "negative_hits": self.negative_hits,
+                "collapsed": self.collapsed,
+                "saved": self.index_hits + self.negative_hits + self.collapsed,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP service generating decks for other applications.
+
+The template is compiled and the media and translation caches are opened
+once when the service starts, so a request only pays for its own words.
+Jobs go through a bounded queue to a fixed pool of worker threads; when the
+queue is full the service answers 429 instead of piling up work.
+
+    POST /decks           CSV (text/csv) or JSON body, returns the job id (202),
+                          or the pptx itself with ?wait=1
+    GET  /jobs/<id>       job status and timings
+    GET  /jobs/<id>/pptx  the finished deck
+    GET  /health          queue length and worker count
+
+JSON bodies are a list of rows, or {"rows": [...], "auto_translate": true,
+"dedupe": true}. The same options can be given in the query string.
+
+Usage: python service.py [--port 8765] [--workers 2] [--queue-size 8] [--stubs]
+"""
+import argparse
+import collections
+import csv
+import io
+import ipaddress
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import simple_mandarin_ppt as smp
+from media_cache import MediaCache
+from metrics import RunMetrics
+from template_blueprint import get_blueprint
+from translation import BatchTranslator, TranslationCache, translation_cache_path
+
+DEFAULT_PORT = 8765
+
+# Decks generated at the same time
+DEFAULT_WORKERS = 2
+
+# Jobs waiting for a worker before new ones are refused with 429
+DEFAULT_QUEUE_SIZE = 8
+
+# Finished jobs kept for polling; older ones are forgotten with their deck
+MAX_FINISHED_JOBS = 100
+
+# Largest accepted upload, in bytes
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+
+PPTX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class Job:
+    """A deck requested from the service."""
+
+    def __init__(self, job_id, rows, options):
+        self.id = job_id
+        self.rows = rows
+        self.options = options
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.summary = None
+        self.pptx = None
+        self.error = None
+        self.done = threading.Event()
+
+    def as_dict(self):
+        """Return the status of the job and its timings, without the deck."""
+        result = {
+            "id": self.id,
+            "status": self.status,
+            "rows": len(self.rows),
+            "queued_seconds": round((self.started or time.time()) - self.created, 3),
+        }
+        if self.started:
+            result["run_seconds"] = round((self.finished or time.time()) - self.started, 3)
+        if self.summary:
+            result["summary"] = self.summary
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+class DeckService:
+    """Job queue and worker pool sharing one template, media cache and translator."""
+
+    def __init__(self, template_path=smp.DEFAULT_TEMPLATE_PATH, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, cache_dir=None, concurrency=smp.DEFAULT_CONCURRENCY):
+        self.template_path = template_path
+        self.concurrency = concurrency
+        # Compile the template and open the caches before the first request
+        get_blueprint(template_path)
+        self.cache = MediaCache(cache_dir) if cache_dir else smp.get_media_cache()
+        if cache_dir:
+            self.translator = BatchTranslator(TranslationCache(translation_cache_path(cache_dir)))
+        else:
+            self.translator = smp.get_translator()
+
+        self._queue = queue.Queue(queue_size)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.workers = workers
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, rows, options):
+        """Queue a job and return it, or return None if the queue is full."""
+        job = Job(f"{next(self._ids)}-{os.urandom(4).hex()}", rows, options)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            return None
+        return job
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                summary = smp.generate_presentation(
+                    job.rows, None, self.template_path, concurrency=self.concurrency,
+                    metrics=RunMetrics(), translator=self.translator, cache=self.cache, **job.options
+                )
+                job.pptx = summary.pop("pptx")
+                job.summary = summary
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            job.finished = time.time()
+            job.done.set()
+            self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+
+
+def parse_upload(body, content_type, query):
+    """
+    Return the rows and generation options of an upload.
+
+    Raises ValueError when the body is not valid CSV or JSON.
+    """
+    options = {
+        name: query[name][0].lower() in TRUE_VALUES
+        for name in ("auto_translate", "dedupe") if name in query
+    }
+    text = body.decode("utf-8-sig")
+    if "json" in content_type:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            for name in ("auto_translate", "dedupe"):
+                if name in data:
+                    options[name] = bool(data[name])
+            data = data.get("rows")
+        if not isinstance(data, list) or not all(isinstance(row, list) for row in data):
+            raise ValueError("expected a list of rows")
+        rows = [[str(cell) for cell in row] for row in data]
+    else:
+        rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        raise ValueError("no vocabulary rows")
+    return rows, options
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a DeckService, set as the `service` class attribute."""
+    service = None
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _is_local(self):
+        return ipaddress.ip_address(self.client_address[0]).is_loopback
+
+    def _send_deck(self, job):
+        status = job.as_dict()
+        self._send(200, job.pptx, PPTX_CONTENT_TYPE, {
+            "Content-Disposition": f'attachment; filename="deck-{job.id}.pptx"',
+            "X-Job-Id": job.id,
+            "X-Job-Timing": json.dumps({
+                "queued_seconds": status["queued_seconds"],
+                "run_seconds": status["run_seconds"],
+                "slides": job.summary["slides"],
+            }),
+        })
+
+    def do_GET(self):
+        if not self._is_local():
+            self._send(403, {"error": "the service only accepts local requests"})
+            return
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["health"]:
+            self._send(200, {"ok": True, "queued": self.service.queued(), "workers": self.service.workers})
+            return
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.job(parts[1])
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+            elif len(parts) == 2:
+                self._send(200, job.as_dict())
+            elif parts[2] != "pptx":
+                self._send(404, {"error": "not found"})
+            elif job.status != "done":
+                self._send(409, job.as_dict())
+            else:
+                self._send_deck(job)
+            return
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._is_local():
+            self._send(403, {"error": "the service only accepts local requests"})
+            return
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/decks":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            self._send(413, {"error": f"upload larger than {MAX_UPLOAD_BYTES} bytes"})
+            return
+        query = parse_qs(url.query)
+        try:
+            rows, options = parse_upload(self.rfile.read(length), self.headers.get("Content-Type", ""), query)
+        except ValueError as e:
+            self._send(400, {"error": f"invalid vocabulary: {e}"})
+            return
+
+        job = self.service.submit(rows, options)
+        if job is None:
+            self._send(429, {"error": "too many jobs queued, try again later"}, headers={"Retry-After": "5"})
+            return
+        if query.get("wait", ["0"])[0].lower() not in TRUE_VALUES:
+            self._send(202, {"id": job.id, "status_url": f"/jobs/{job.id}"}, headers={"Location": f"/jobs/{job.id}"})
+            return
+
+        job.done.wait()
+        if job.status == "done":
+            self._send_deck(job)
+        else:
+            self._send(500, job.as_dict())
+
+
+def create_server(service, port=DEFAULT_PORT, host="127.0.0.1"):
+    """Return an HTTP server for service on a loopback address (port 0 picks a free port)."""
+    if not ipaddress.ip_address(host).is_loopback:
+        raise ValueError(f"the service only listens on localhost, not {host}")
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--template", default=smp.DEFAULT_TEMPLATE_PATH, help="PowerPoint template file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Decks generated at the same time")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Jobs waiting for a worker before requests get 429")
+    parser.add_argument("--concurrency", type=int, default=smp.DEFAULT_CONCURRENCY, help="Words fetched at the same time per job")
+    parser.add_argument("--cache-dir", help="Media cache directory")
+    parser.add_argument("--stubs", type=float, metavar="LATENCY",
+                        help="Use the local stand-ins of benchmark.py for Pixabay, gTTS and translation")
+    args = parser.parse_args()
+
+    translator = None
+    if args.stubs is not None:
+        import benchmark
+        benchmark.install_stubs(benchmark.start_stub_server(args.stubs), args.stubs)
+        translator = BatchTranslator(TranslationCache(None), backend=benchmark.FakeTranslator(args.stubs))
+
+    service = DeckService(args.template, args.workers, args.queue_size, args.cache_dir, args.concurrency)
+    if translator is not None:
+        service.translator = translator
+    server = create_server(service, args.port)
+    print(f"Serving decks on http://127.0.0.1:{server.server_address[1]}/ with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,208 +1,1574 @@
 # -*- coding: utf-8 -*-
+import argparse
+import collections
+import contextlib
 import csv
+import glob
+import hashlib
+import multiprocessing
+import io
+import json
 import os
-from pptx import Presentation
-from pypinyin import pinyin, Style
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN
-from gtts import gTTS
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-import tkinter as tk
-from tkinter import filedialog, messagebox
-import requests
+import queue
+import sys
+import time
 import threading
-from deep_translator import GoogleTranslator
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed, wait,
+)
+# python-pptx, pypinyin, gTTS and requests take most of a second to import,
+# so they are imported where they are first used and the GUI window can
+# appear before them (see warm_up)
+from image_processing import DEFAULT_IMAGE_DPI, DEFAULT_IMAGE_QUALITY, image_spec, process_image
+from manifest import content_hash, load_previous_deck, row_key, write_manifest
+from media_cache import DEFAULT_CACHE_DIR, MediaCache, make_key
+from metrics import NULL_METRICS, RunMetrics, PROFILERS, RequestTally, profiled
+from pinyin_engine import (
+    DEFAULT_PINYIN_STORE, DEFAULT_STYLE as DEFAULT_PINYIN_STYLE, PINYIN_STORE_NAME, STYLES as PINYIN_STYLES,
+    PinyinEngine, load_overrides,
+)
+from pipeline import Cancelled, ThreadPerCall, ordered_map, raise_if_cancelled, run_in_thread
+from providers import GTTSProvider, PixabayProvider, Providers, load_providers
+from search_index import SearchIndex
+from tts_batch import batch_text, batch_words, split_clips
+from translation import DEFAULT_TRANSLATION_CACHE, BatchTranslator, TranslationCache, translation_cache_path
+
+# Pixabay API settings
+PIXABAY_API_URL = "https://pixabay.com/api/"
+PIXABAY_API_KEY = "49711697-387fe155204b00a0af7ff7360"  # Replace with your actual API key
+PIXABAY_IMAGE_TYPE = "illustration"  # Fetch illustration images
+
+# Template used when no custom template is chosen
+DEFAULT_TEMPLATE_PATH = "template.pptx"
+
+# Image shown when Pixabay has no result for a word, next to this script
+PLACEHOLDER_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media", "placeholder-image.png")
+
+# Number of words whose audio and images are fetched at the same time
+DEFAULT_CONCURRENCY = 8
+
+# Optional semaphore limiting network requests across batch worker processes
+_network_slots = None
+
+def network_slot():
+    """Context manager held around every network request."""
+    return _network_slots if _network_slots is not None else contextlib.nullcontext()
+
+# Shared HTTP client, created on first use
+_http_client = None
+
+def get_http_client():
+    """Return the pooled HTTP client shared by all runs in this process."""
+    global _http_client
+    if _http_client is None:
+        from http_client import HttpClient
+        _http_client = HttpClient()
+    return _http_client
+
+# Shared media cache, created on first use
+_media_cache = None
+
+def get_media_cache():
+    """Return the media cache shared by all runs in this process."""
+    global _media_cache
+    if _media_cache is None:
+        _media_cache = MediaCache()
+    return _media_cache
+
+# Search index file, next to the media cache entries
+SEARCH_INDEX_NAME = "search_index.sqlite3"
+
+# Search indexes by media cache directory, created on first use
+_search_indexes = {}
+_search_indexes_lock = threading.Lock()
+
+def get_search_index(cache):
+    """Return the Pixabay search index kept with a media cache, shared by all runs in this process."""
+    with _search_indexes_lock:
+        index = _search_indexes.get(cache.cache_dir)
+        if index is None:
+            index = SearchIndex(os.path.join(cache.cache_dir, SEARCH_INDEX_NAME))
+            _search_indexes[cache.cache_dir] = index
+    return index
+
+# Default providers of audio, images and translations, created on first use
+_providers = None
+
+def get_providers():
+    """Return the gTTS, Pixabay and Google Translate providers shared by all runs in this process."""
+    global _providers
+    if _providers is None:
+        _providers = Providers()
+    return _providers
+
+# Function to hold a network request slot for remote providers only
+def provider_slot(provider):
+    """Return network_slot() for a remote provider, and no limit for a local one."""
+    return network_slot() if provider.remote else contextlib.nullcontext()
+
+# Shared pinyin engine, created on first use
+_pinyin_engine = None
+
+def get_pinyin_engine():
+    """Return the pinyin engine shared by all runs in this process."""
+    global _pinyin_engine
+    if _pinyin_engine is None:
+        _pinyin_engine = PinyinEngine()
+    return _pinyin_engine
+
+# Number of words converted to pinyin at once while streaming
+PINYIN_BATCH_SIZE = 50
+
+# Function to convert the pinyin of upcoming rows in batches
+def annotate_rows(pairs, engine, batch_size=PINYIN_BATCH_SIZE, metrics=NULL_METRICS):
+    """
+    Yield (chinese, english) pairs after converting their pinyin in batches.
 
-# Function to create a PowerPoint presentation from a template
-def create_ppt_from_template(vocab_list, template_path, output_path):
+    The engine remembers the conversions, so the slides get their pinyin
+    from memory. At most batch_size rows are held back at a time.
     """
-    Create a PowerPoint presentation using a template file.
+    buffer = []
+
+    def flush():
+        converted_before = engine.converted
+        with metrics.stage("pinyin"):
+            engine.annotate_many([chinese for chinese, _ in buffer])
+        metrics.count("pinyin_converted", engine.converted - converted_before)
+        yield from buffer
+        buffer.clear()
+
+    for pair in pairs:
+        buffer.append(pair)
+        if len(buffer) >= batch_size:
+            yield from flush()
+    if buffer:
+        yield from flush()
+
+# Rows looked ahead to synthesize their audio in batched requests, fewer
+# for the first batch so the first slides are built early
+TTS_BATCH_ROWS = 100
+TTS_FIRST_BATCH_ROWS = 10
+
+# Function to synthesize the audio of several words in one request
+def synthesize_batch(words, cache, metrics=NULL_METRICS, tts=None):
     """
-    print(f"Loading template from: {template_path}")
-
-    if os.path.exists(template_path):
-        modification_time = os.path.getmtime(template_path)
-        print(f"Template last modified: {modification_time} (Unix timestamp)")
-
-    # Load template and get first slide
-    prs = Presentation(template_path)
-    template_slide = prs.slides[0]
+    Synthesize words with a single request of the TTS provider tts (gTTS by
+    default), cut the audio into one clip per word and cache the clips.
+    Returns whether it succeeded.
+    """
+    tts = tts or get_providers().tts
+    try:
+        with provider_slot(tts), metrics.stage("tts_batch"):
+            data = tts.synthesize(batch_text(words))
+        clips = split_clips(data, len(words))
+        if clips is None:
+            raise ValueError(f"the audio has fewer than {len(words) - 1} pauses")
+    except Exception as e:
+        print(f"Batched audio for {len(words)} words failed, creating it word by word: {e}")
+        metrics.count("tts_batch_fallback", len(words))
+        return False
+    for word, clip in zip(words, clips):
+        cache.put(audio_key(word, tts), clip, "." + tts.extension)
+    metrics.count("tts_requests")
+    metrics.count("tts_batched", len(words))
+    print(f"Audio created for {len(words)} words in one request.")
+    return True
+
+# Function to synthesize the audio of upcoming rows in batches
+def synthesize_rows(pairs, cache, concurrency=DEFAULT_CONCURRENCY, batch_size=TTS_BATCH_ROWS, skip=None,
+                    metrics=NULL_METRICS, cancel=None, run_deadline=None, tts=None, batches=None):
+    """
+    Yield (chinese, english) pairs while the audio of their words is
+    synthesized in batched requests (see tts_batch) in the background.
+
+    The rows of a batch are let through as soon as the batch is sent, and
+    its Future is put in the dict batches under each of its words, so
+    generate_audio waits for it while the images of the rows are being
+    fetched. The clips are put in the media cache, where generate_audio
+    finds them. Words that are cached already, pairs for which skip(pair)
+    is true and words of failed batches are left to generate_audio, which
+    synthesizes them one request per word. At most batch_size rows are
+    held back to fill a batch, and TTS_FIRST_BATCH_ROWS before the first
+    rows are let through, so the first slides are not held up. Nothing is
+    batched after run_deadline. A TTS provider tts whose batch requests
+    are no cheaper than single ones (see providers) is never batched.
+    """
+    tts = tts or get_providers().tts
+    if not tts.batch:
+        yield from pairs
+        return
+    batches = {} if batches is None else batches
+    buffer = []
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+
+    def flush():
+        raise_if_cancelled(cancel)
+        if run_deadline is None or time.perf_counter() < run_deadline:
+            words = [chinese for chinese, english in buffer
+                     if not (skip is not None and skip((chinese, english)))
+                     and not cache.contains(audio_key(chinese, tts), "." + tts.extension)]
+            for batch in batch_words(words)[0]:
+                # A batch of one word is no cheaper than the word's own request
+                if len(batch) > 1:
+                    future = executor.submit(synthesize_batch, batch, cache, metrics, tts)
+                    batches.update(dict.fromkeys(batch, future))
+        yield from buffer
+        buffer.clear()
 
-    # Log placeholders for debugging
-    print("Template slide placeholders:")
-    for placeholder in template_slide.placeholders:
-        print(f"  idx: {placeholder.placeholder_format.idx}, name: {placeholder.name}, type: {placeholder.placeholder_format.type}")
+    try:
+        size = min(batch_size, TTS_FIRST_BATCH_ROWS)
+        for pair in pairs:
+            buffer.append(pair)
+            if len(buffer) >= size:
+                yield from flush()
+                size = batch_size
+        if buffer:
+            yield from flush()
+    except BaseException:
+        # Drop the batches not sent yet when the rows are not wanted any more
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    # The last batches finish while their rows are being fetched
+    executor.shutdown(wait=False)
+
+# Function to list the settings a slide depends on
+def slide_settings(image_dpi, image_quality, pinyin_style, pinyin, providers=None):
+    """Return the generation settings that are part of a slide's manifest key."""
+    settings = [image_dpi, image_quality]
+    # Only added when they are not the defaults, so slides of decks built
+    # before pinyin styles, overrides and providers existed are still reused
+    if pinyin_style != DEFAULT_PINYIN_STYLE or pinyin.overrides:
+        settings += [pinyin_style, pinyin.overrides_fingerprint]
+    if providers is not None and providers.tts.name != GTTSProvider.name:
+        settings += ["tts", providers.tts.name]
+    if providers is not None and providers.images.name != PixabayProvider.name:
+        settings += ["images", providers.images.name]
+    return settings
+
+# Function to synthesize the TTS audio for a Chinese word
+def synthesize_audio(chinese, lang='zh'):
+    """Return the mp3 bytes of the pronunciation of a Chinese word."""
+    from gtts import gTTS
+    from http_client import DEFAULT_TIMEOUT
+    buffer = io.BytesIO()
+    gTTS(chinese, lang=lang, timeout=DEFAULT_TIMEOUT).write_to_fp(buffer)
+    return buffer.getvalue()
+
+# Media cache keys of the audio, image search and image of a word
+def audio_key(chinese, tts=None):
+    # Audio of other TTS providers is kept apart from the gTTS audio
+    return make_key("tts", chinese, "zh", tts.name if tts is not None else "gtts")
+
+def search_key(image_query, min_size=None):
+    return make_key("pixabay-search", image_query, PIXABAY_IMAGE_TYPE, min_size)
+
+def image_key(image_query, image_url, spec=None):
+    return make_key("image", image_query, PIXABAY_IMAGE_TYPE, image_url, spec)
+
+def image_search_params(english, image_spec=None):
+    """Return the Pixabay query and minimum image size used for an English word."""
+    image_query = english.replace(" ", "+")  # Use the English word as the query
+    min_size = max(image_spec.width, image_spec.height) if image_spec else None
+    return image_query, min_size
+
+# Function to generate the TTS audio for a Chinese word
+def generate_audio(chinese, cache, metrics=NULL_METRICS, tts=None, batches=None):
+    """
+    Return the audio bytes for a Chinese word, synthesizing them with the
+    TTS provider tts (gTTS by default) if they are not cached.
 
-    print("Template slide shapes:")
-    for shape in template_slide.shapes:
-        if shape.is_placeholder:
-            print(f"  Placeholder idx: {shape.placeholder_format.idx}, name: {shape.name}, type: {shape.placeholder_format.type}")
-        else:
-            print(f"  Shape: {shape.name}, not a placeholder")
-
-    # Loop through each vocabulary pair and create a slide
-    for chinese, english in vocab_list:
-        # Duplicate the template slide
-        slide = prs.slides.add_slide(template_slide.slide_layout)
-
-        # Populate placeholders using their idx values
-        for placeholder in slide.placeholders:
-            if placeholder.placeholder_format.idx == 0:  # Chinese title
-                placeholder.text = chinese
-            elif placeholder.placeholder_format.idx == 1:  # English subtitle
-                placeholder.text = english
-            elif placeholder.placeholder_format.idx == 14:  # Pinyin text
-                placeholder.text = ' '.join([p[0] for p in pinyin(chinese, style=Style.TONE)])
-            elif placeholder.placeholder_format.idx == 15:  # Audio placeholder
-                try:
-                    # Generate and add TTS audio
-                    tts = gTTS(chinese, lang='zh')
-                    audio_path = f"media/{chinese}.mp3"
-                    tts.save(audio_path)
+    When the dict batches (see synthesize_rows) holds a batched request
+    for the word, it is waited for first; its clip is then in the cache.
+    """
+    tts = tts or get_providers().tts
+    key = audio_key(chinese, tts)
+    suffix = "." + tts.extension
+    batch = batches.pop(chinese, None) if batches is not None else None
+    if batch is not None:
+        wait([batch])
+    data = cache.read(key, suffix)
+    if data is not None:
+        metrics.count("tts_cached")
+        return data
+
+    with provider_slot(tts), metrics.stage("tts", chinese):
+        data = tts.synthesize(chinese)
+    metrics.count("tts_requests")
+    metrics.count("provider_requests")
+    cache.put(key, data, suffix)
+    print(f"Audio created for '{chinese}'.")
+    return data
+
+# Function to get the ranked Pixabay hits of a query from the search index
+def search_image_hits(image_query, cache, metrics=NULL_METRICS, word=None, images=None):
+    """
+    Return the hits of the image provider images (Pixabay by default) for
+    a query, searching a remote provider only when the search index of the
+    cache has no current entry for it. Raises
+    requests.exceptions.RequestException when the search fails.
+    """
+    images = images or get_providers().images
+    if not images.remote:
+        # A local library is its own index
+        with metrics.stage("search", word):
+            hits = images.search(image_query)
+        metrics.count("provider_requests")
+        return hits
+
+    def search(query):
+        with network_slot(), metrics.stage("search", word):
+            hits = images.search(query)
+        metrics.count("provider_requests")
+        return hits
+
+    hits, searched = get_search_index(cache).lookup(image_query, search)
+    if not searched:
+        metrics.count("search_cached")
+    return hits
+
+# Function to find the image URL for a query, remembering previous searches
+def find_image_url(image_query, cache, min_size=None, metrics=NULL_METRICS, word=None, images=None):
+    """Return the image URL for a query, or None if there is no result."""
+    import requests
+    images = images or get_providers().images
+    if images.remote:
+        # Searches cached before the search index existed, and asset packs;
+        # only read when present, so a word the index answers is no miss
+        key = search_key(image_query, min_size)
+        if cache.contains(key, ".url"):
+            cached_url = cache.read(key, ".url")
+            if cached_url is not None:
+                metrics.count("search_cached")
+                return cached_url.decode("utf-8")
 
-                    if os.path.exists(audio_path):
-                        print(f"Audio file '{audio_path}' created.")
-                    else:
-                        print(f"Failed to create audio file '{audio_path}'.")
-
-                    # Position audio at placeholder location
-                    if placeholder.placeholder_format.idx == 15:
-                        left = placeholder.left
-                        top = placeholder.top
-                        width = placeholder.width
-                        height = placeholder.height
-                        slide.shapes.add_movie(audio_path, left, top, width=width, height=height)
-
-                    # Add clickable transparent overlay
-                    if placeholder.shape_type == MSO_SHAPE_TYPE.MEDIA:
-                        left = placeholder.left
-                        top = placeholder.top
-                        width = placeholder.width
-                        height = placeholder.height
-
-                        transparent_shape = slide.shapes.add_shape(
-                            MSO_SHAPE_TYPE.RECTANGLE, left, top, width, height
-                        )
-                        transparent_shape.fill.solid()
-                        transparent_shape.fill.fore_color.rgb = RGBColor(255, 255, 255)
-                        transparent_shape.fill.transparency = 1.0
-                        transparent_shape.line.fill.background()
+    try:
+        hits = search_image_hits(image_query, cache, metrics, word, images)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching images from {images.name}: {e}")
+        return None
+    image_url = pick_image_url(hits, min_size)
+    if image_url is None:
+        print(f"No images found for query: {image_query}")
+    return image_url
 
-                except Exception as e:
-                    print(f"Error adding audio for '{chinese}': {e}")
+# Function to download an image from a URL into the media cache
+def download_image(image_url, image_query, cache, spec=None, metrics=NULL_METRICS, word=None, images=None):
+    """
+    Download an image with the image provider images (Pixabay by default)
+    and return its bytes.
 
-        # Add Pixabay images to the left side of the slide
-        image_query = english.replace(" ", "+")  # Use the English word as the query
-        api_key = "49711697-387fe155204b00a0af7ff7360"  # Replace with your actual API key
-        image_url = search_pixabay_images(image_query, api_key)
+    When an ImageSpec is given, the image is downscaled and recompressed
+    to it before being cached.
+    """
+    images = images or get_providers().images
+    key = image_key(image_query, image_url, spec)
+    data = cache.read(key, ".img")
+    if data is not None:
+        metrics.count("images_cached")
+        return data
+
+    with provider_slot(images), metrics.stage("download", word):
+        data = images.fetch(image_url)
+    metrics.count("provider_requests")
+    metrics.count("bytes_downloaded", len(data))
+    if spec:
+        try:
+            with metrics.stage("image_process", word):
+                data = process_image(data, spec)
+        except Exception as e:
+            print(f"Could not process image {image_url}, embedding it unchanged: {e}")
+    cache.put(key, data, ".img")
+    return data
+
+# Function to fetch the audio of a single vocabulary word
+def fetch_audio(chinese, cache, metrics=NULL_METRICS, providers=None, audio_batches=None):
+    """Return the audio bytes of a word, or None when fetching failed."""
+    try:
+        return generate_audio(chinese, cache, metrics, (providers or get_providers()).tts, audio_batches)
+    except Exception as e:
+        print(f"Error adding audio for '{chinese}': {e}")
+        return None
 
-        if image_url:
-            try:
-                # Download the image
-                image_path = f"media/{image_query}.jpg"
-                response = requests.get(image_url, stream=True)
-                response.raise_for_status()
-                with open(image_path, "wb") as image_file:
-                    for chunk in response.iter_content(1024):
-                        image_file.write(chunk)
-
-                # Adjust the image position and size to be larger and more centered, but slightly to the left
-                left = Inches(1.5)  # Slightly more to the left
-                top = Inches(1.5)   # Centered vertically
-                slide.shapes.add_picture(image_path, left, top, width=Inches(5), height=Inches(5))
-
-                # Remove the attribution text below the image
-                # Removed the 'Image by Pixabay' text addition logic
-
-                print(f"Added image for '{english}' to the slide.")
-            except Exception as e:
-                print(f"Error adding image for '{english}': {e}")
-        else:
-            # Use the placeholder image if no image is found
-            placeholder_path = "media/placeholder-image.png"
-            if os.path.exists(placeholder_path):
-                left = Inches(1.5)  # Slightly more to the left
-                top = Inches(1.5)   # Centered vertically
-                slide.shapes.add_picture(placeholder_path, left, top, width=Inches(5), height=Inches(5))
-                print(f"Added placeholder image for '{english}' to the slide.")
+# Function to fetch the image of a single vocabulary word
+def fetch_image(chinese, english, cache, image_spec=None, metrics=NULL_METRICS, providers=None):
+    """
+    Return (image_url, image) for a word. image_url is None when the image
+    provider had no result, image is None when the download failed.
+    """
+    images = (providers or get_providers()).images
+    image_query, min_size = image_search_params(english, image_spec)
+    image_url = find_image_url(image_query, cache, min_size, metrics, chinese, images)
+    image = None
+    if image_url:
+        try:
+            image = download_image(image_url, image_query, cache, image_spec, metrics, chinese, images)
+        except Exception as e:
+            print(f"Error adding image for '{english}': {e}")
+    return image_url, image
+
+# Function to resolve the audio and image of a single vocabulary word
+def fetch_assets(chinese, english, cache, image_spec=None, metrics=NULL_METRICS, timeout=None, executor=None,
+                 providers=None, audio_batches=None):
+    """
+    Fetch the network assets for one word, with the providers given (see
+    providers) or the default ones. audio_batches holds the batched TTS
+    requests sent for upcoming words (see synthesize_rows).
+
+    Returns a tuple (audio, image_url, image, degraded) where audio and
+    image are the audio and image bytes, or None when fetching failed.
+    image_url is None when Pixabay had no result, in which case the
+    placeholder image is used. degraded maps "audio" and "image" to why
+    they are missing ("error" or "timeout"); a word without Pixabay
+    results is not degraded.
+
+    With an executor, audio and image are fetched side by side in it and
+    given up after timeout seconds. The abandoned calls keep running and
+    still fill the media cache for the next run. The timeout runs from
+    when the calls are submitted, so the executor has to start them right
+    away (see pipeline.ThreadPerCall).
+    """
+    degraded = {}
+    if executor is None:
+        # The image first, while the audio may still be in a batched request
+        image_url, image = fetch_image(chinese, english, cache, image_spec, metrics, providers)
+        audio = fetch_audio(chinese, cache, metrics, providers, audio_batches)
+    else:
+        end = time.perf_counter() + timeout
+        audio_future = executor.submit(fetch_audio, chinese, cache, metrics, providers, audio_batches)
+        image_future = executor.submit(fetch_image, chinese, english, cache, image_spec, metrics, providers)
+        try:
+            audio = audio_future.result(timeout=max(0, end - time.perf_counter()))
+        except FutureTimeoutError:
+            print(f"Audio for '{chinese}' missed its {timeout:.1f}s deadline")
+            audio = None
+            degraded["audio"] = "timeout"
+        try:
+            image_url, image = image_future.result(timeout=max(0, end - time.perf_counter()))
+        except FutureTimeoutError:
+            print(f"Image for '{english}' missed its {timeout:.1f}s deadline, using the placeholder")
+            image_url, image = None, None
+            degraded["image"] = "timeout"
+
+    if audio is None:
+        degraded.setdefault("audio", "error")
+    if image_url and image is None:
+        degraded.setdefault("image", "error")
+    return audio, image_url, image, degraded
+
+# Recent rows whose assets are handed to repeats of the row
+DUPLICATE_WINDOW = 64
+
+# Function to fetch the assets of the vocabulary words ahead of slide building
+def stream_assets(vocab_list, concurrency=DEFAULT_CONCURRENCY, cache=None, image_spec=None, skip=None,
+                  metrics=NULL_METRICS, cancel=None, asset_deadline=None, run_deadline=None, stats=None,
+                  providers=None, audio_batches=None):
+    """
+    Resolve audio, image search and image download for many words at once.
+
+    Runs in a background thread and yields ((chinese, english), assets)
+    in the order of vocab_list, staying a bounded number of words ahead of
+    the consumer so vocab_list can be a stream. Pairs for which skip(pair)
+    is true are not fetched and come with None assets. Once the event
+    cancel is set, no new word is fetched and Cancelled is raised.
+
+    Each word gets at most asset_deadline seconds, and nothing is fetched
+    after run_deadline (a time.perf_counter() value); the assets of words
+    that run out of time are missing and marked "timeout" or "budget" in
+    their degraded dict.
+
+    A row repeating one of the last DUPLICATE_WINDOW rows gets the assets
+    of that row, waiting for them if they are still being fetched, instead
+    of looking up its audio, search and image again. Their number is
+    counted as rows_collapsed in metrics and in the dict stats, if given,
+    and the provider requests (TTS, search and download) the first row
+    made for them as requests_avoided, for every repeat.
+
+    The assets come from providers, or the default providers. The audio
+    of words in the dict audio_batches comes from their batched TTS
+    request (see synthesize_rows).
+    """
+    cache = cache or get_media_cache()
+    timed = asset_deadline is not None or run_deadline is not None
+    # Audio and image of a word are fetched side by side, each in a thread
+    # of its own, so calls that missed their deadline and keep running do
+    # not hold up the words behind them; ordered_map limits the words in flight
+    executor = ThreadPerCall() if timed else None
+
+    # Pair -> Future of its assets, for the most recent rows
+    recent = collections.OrderedDict()
+    recent_lock = threading.Lock()
+
+    def fetch(pair):
+        raise_if_cancelled(cancel)
+        if skip is not None and skip(pair):
+            return pair, None
+        with recent_lock:
+            future = recent.get(pair)
+            repeated = future is not None
+            if repeated:
+                recent.move_to_end(pair)
             else:
-                print(f"Placeholder image not found at {placeholder_path}. Skipping image addition.")
+                future = recent[pair] = Future()
+                if len(recent) > DUPLICATE_WINDOW:
+                    recent.popitem(last=False)
+        if repeated:
+            # Submitted before this row, so it is already being fetched
+            assets, requests = future.result()
+            metrics.count("rows_collapsed")
+            metrics.count("requests_avoided", requests)
+            if stats is not None:
+                with recent_lock:
+                    stats["rows_collapsed"] = stats.get("rows_collapsed", 0) + 1
+                    stats["requests_avoided"] = stats.get("requests_avoided", 0) + requests
+            return pair, assets
+        tally = RequestTally(metrics)
+        try:
+            assets = resolve(pair, tally)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result((assets, tally.requests))
+        return pair, assets
+
+    def resolve(pair, metrics):
+        if not timed:
+            return fetch_assets(*pair, cache, image_spec, metrics, providers=providers, audio_batches=audio_batches)
+
+        timeout = asset_deadline if asset_deadline is not None else float("inf")
+        if run_deadline is not None:
+            remaining = run_deadline - time.perf_counter()
+            if remaining <= 0:
+                metrics.count("budget_exhausted")
+                return None, None, None, {"audio": "budget", "image": "budget"}
+            timeout = min(timeout, remaining)
+        audio, image_url, image, degraded = fetch_assets(*pair, cache, image_spec, metrics, timeout, executor,
+                                                         providers, audio_batches)
+        if run_deadline is not None and time.perf_counter() >= run_deadline:
+            degraded = {asset: "budget" if reason == "timeout" else reason for asset, reason in degraded.items()}
+        return audio, image_url, image, degraded
+
+    return run_in_thread(ordered_map(fetch, vocab_list, concurrency))
+
+# Function to save a deck built from a template
+def save_deck(prs, output_path, writer=None):
+    """
+    Remove the template slide, save the deck and return its size in bytes.
 
+    A path is written through a temporary file next to it, so a failed or
+    cancelled save never leaves a partial file at output_path. With a
+    StreamingDeckWriter, only what it has not written yet is saved.
+    """
     # Remove the original template slide safely
     xml_slides = prs.slides._sldIdLst  # Access the slide ID list
     slides = list(xml_slides)  # Convert to a list for iteration
     xml_slides.remove(slides[0])  # Remove the first slide (template slide)
 
-    # Save the presentation
-    prs.save(output_path)
+    if writer is not None:
+        deck_bytes = writer.close()
+        print(f"Presentation saved to {output_path if isinstance(output_path, str) else 'memory'}")
+        return deck_bytes
+
+    if not isinstance(output_path, str):
+        prs.save(output_path)
+        print("Presentation saved to memory")
+        return output_path.tell()
+
+    temp_path = f"{output_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        prs.save(temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
     print(f"Presentation saved to {output_path}")
+    return os.path.getsize(output_path)
 
-    # Auto-delete the generated mp3 files
-    for file_name in os.listdir("media"):
-        if file_name.endswith(".mp3"):
-            file_path = os.path.join("media", file_name)
-            try:
-                os.remove(file_path)
-                print(f"Deleted audio file: {file_path}")
-            except Exception as e:
-                print(f"Error deleting file {file_path}: {e}")
+# Function to describe the progress of a run
+def progress_event(stage, done, total, elapsed, stats_before, stats):
+    """
+    Return a progress event dict: the stage ("starting", "building",
+    "saving" or "done"), slides done, the total (or None), the estimated
+    seconds left (or None) and the media cache hit rate of this run.
+    """
+    hits = stats["hits"] - stats_before["hits"]
+    lookups = hits + stats["misses"] - stats_before["misses"]
+    eta = None
+    if total and done:
+        eta = round(elapsed / done * max(0, total - done), 1)
+    return {
+        "stage": stage,
+        "done": done,
+        "total": total,
+        "eta": eta,
+        "cache_hit_rate": round(hits / lookups, 3) if lookups else None,
+    }
 
-    # Auto-delete the downloaded images after saving the presentation, except for placeholder-image.png
-    for file_name in os.listdir("media"):
-        if file_name.endswith(".jpg") and file_name != "placeholder-image.png":
-            file_path = os.path.join("media", file_name)
-            try:
-                os.remove(file_path)
-                print(f"Deleted image file: {file_path}")
-            except Exception as e:
-                print(f"Error deleting file {file_path}: {e}")
+# Function to create a PowerPoint presentation from a template
+def create_ppt_from_template(vocab_list, template_path, output_path, concurrency=DEFAULT_CONCURRENCY, cache=None,
+                             image_dpi=DEFAULT_IMAGE_DPI, image_quality=DEFAULT_IMAGE_QUALITY, incremental=True,
+                             metrics=NULL_METRICS, cancel=None, on_progress=None, total=None,
+                             asset_deadline=None, time_budget=None, entries=None, stream=False,
+                             pinyin=None, pinyin_style=DEFAULT_PINYIN_STYLE, batch_tts=True, providers=None):
+    """
+    Create a PowerPoint presentation using a template file.
+
+    Images are downscaled to the image frame at image_dpi and recompressed
+    with image_quality; an image_dpi of 0 embeds them unchanged.
+
+    When output_path is a file path, a manifest is written next to it. With
+    incremental set, slides whose inputs did not change since the deck at
+    output_path was generated are copied from it instead of being rebuilt.
+
+    Stage timings and counters are recorded in metrics, if given.
+
+    on_progress, if given, is called from this thread with a progress event
+    dict after every slide (see progress_event); total is the expected
+    number of slides, if known. Setting the threading.Event cancel stops
+    the run with Cancelled, leaving any existing deck at output_path as
+    it was.
+
+    The audio and image of a word are given up after asset_deadline
+    seconds, and no more assets are fetched once time_budget seconds have
+    passed. Slides missing their image get the placeholder, slides missing
+    their audio get no audio shape. Such slides are listed in
+    summary["degraded"] and rebuilt instead of reused on the next run.
+
+    The manifest entries of the slides are appended to the entries list,
+    if one is given.
+
+    With stream set, every slide is written to the pptx as soon as it is
+    finished and its images and audio are released, so memory does not grow
+    with the size of the deck (see deck_writer).
 
-# Function to search for images using the Pixabay API
-def search_pixabay_images(query, api_key):
-    base_url = "https://pixabay.com/api/"
+    The pinyin is written in pinyin_style (see pinyin_engine.STYLES) by
+    the PinyinEngine pinyin, or by the shared one.
+
+    With batch_tts set, the audio of upcoming words is synthesized several
+    words per request (see synthesize_rows).
+
+    The audio and images come from providers (see providers), or the
+    default gTTS and Pixabay providers.
+    """
+    from pptx.dml.color import RGBColor
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+    from template_blueprint import add_audio, get_blueprint
+
+    print(f"Loading template from: {template_path}")
+
+    # Analyse the template once, then start from a fresh copy of it
+    with metrics.stage("template"):
+        blueprint = get_blueprint(template_path)
+        deck = blueprint.new_deck()
+    prs = deck.prs
+
+    spec = image_spec(*blueprint.image_region[2:], dpi=image_dpi, quality=image_quality)
+    pinyin = pinyin or get_pinyin_engine()
+    providers = providers or get_providers()
+    settings = slide_settings(image_dpi, image_quality, pinyin_style, pinyin, providers)
+    write_sidecar = isinstance(output_path, str)
+    previous = None
+    if write_sidecar and incremental:
+        with metrics.stage("manifest_load"):
+            previous = load_previous_deck(output_path, blueprint.fingerprint)
+
+    def is_reusable(pair):
+        return previous is not None and row_key(*pair, blueprint.fingerprint, settings) in previous
+
+    # Fetch audio and images in the background while slides are being built
+    cache = cache or get_media_cache()
+    stats_before = cache.stats()
+    search_index = get_search_index(cache)
+    search_before = search_index.stats()
+    started = time.perf_counter()
+    run_deadline = started + time_budget if time_budget is not None else None
+    slide_count = 0
+    slides_reused = 0
+    audio_bytes = 0
+    manifest_entries = []
+    degraded_slides = []
+    asset_stats = {}
+    # Content hashes of the audio and images in the deck so far; the deck's
+    # MediaRegistry stores a repeated payload once for all its slides
+    embedded = set()
+    bytes_shared = 0
+
+    def embed(payload, digest):
+        """Note a payload added to a slide and return whether the deck holds it already."""
+        nonlocal bytes_shared
+        if digest in embedded:
+            bytes_shared += len(payload)
+            return True
+        embedded.add(digest)
+        return False
+
+    def report(stage):
+        if on_progress is not None:
+            on_progress(progress_event(stage, slide_count, total, time.perf_counter() - started,
+                                       stats_before, cache.stats()))
+
+    report("starting")
+
+    writer = None
+    if stream:
+        from deck_writer import StreamingDeckWriter
+        writer = StreamingDeckWriter(prs, output_path)
+    try:
+        # Loop through each vocabulary pair and create a slide
+        rows = annotate_rows(vocab_list, pinyin, metrics=metrics)
+        # Batched TTS requests of upcoming words, by word
+        audio_batches = {}
+        if batch_tts:
+            rows = synthesize_rows(rows, cache, concurrency, skip=is_reusable, metrics=metrics, cancel=cancel,
+                                   run_deadline=run_deadline, tts=providers.tts, batches=audio_batches)
+        assets_stream = stream_assets(rows, concurrency, cache, spec, skip=is_reusable, metrics=metrics,
+                                      cancel=cancel, asset_deadline=asset_deadline, run_deadline=run_deadline,
+                                      stats=asset_stats, providers=providers, audio_batches=audio_batches)
+        for (chinese, english), assets in metrics.timed_iter(assets_stream, "wait_assets"):
+            raise_if_cancelled(cancel)
+            if slide_count:
+                report("building")
+            slide_count += 1
+            key = row_key(chinese, english, blueprint.fingerprint, settings)
+            if assets is None:
+                # Unchanged since the last run, copy the slide and its media
+                with metrics.stage("slide_copy", chinese):
+                    slide = deck.copy_slide(previous.slide(key))
+                    if writer is not None:
+                        writer.write_slide(slide)
+                reused = previous.entry(key)
+                manifest_entries.append(reused)
+                # Its audio and image are in the deck now, later slides share them
+                embedded.update(digest for digest in (reused.get("audio"), reused.get("image")) if digest)
+                slides_reused += 1
+                continue
+
+            audio, image_url, image, degraded = assets
+            entry = {
+                "key": key,
+                "chinese": chinese,
+                "english": english,
+                "audio": content_hash(audio),
+                "image": content_hash(image),
+            }
+            if degraded:
+                # Marked for backfill, the manifest never offers it for reuse
+                entry["degraded"] = degraded
+                degraded_slides.append({"slide": slide_count, "chinese": chinese, "english": english,
+                                        "missing": degraded})
+                metrics.count("slides_degraded")
+                metrics.event("slide_degraded", **degraded_slides[-1])
+            manifest_entries.append(entry)
+
+            with metrics.stage("slide_build", chinese):
+                # Stamp a copy of the prepared template slide with the texts
+                slide = deck.add_slide({
+                    "chinese": chinese,
+                    "english": english,
+                    "pinyin": pinyin.convert(chinese, pinyin_style),
+                })
+
+                if blueprint.audio_region and audio:
+                    try:
+                        # Position audio at placeholder location, named by its content hash
+                        left, top, width, height = blueprint.audio_region
+                        audio_name = hashlib.sha256(audio).hexdigest()[:16] + "." + providers.tts.extension
+                        add_audio(slide, audio, audio_name, left, top, width, height)
+                        if not embed(audio, entry["audio"]):
+                            audio_bytes += len(audio)
+
+                        # Add clickable transparent overlay
+                        if blueprint.audio_overlay:
+                            transparent_shape = slide.shapes.add_shape(
+                                MSO_SHAPE_TYPE.RECTANGLE, left, top, width, height
+                            )
+                            transparent_shape.fill.solid()
+                            transparent_shape.fill.fore_color.rgb = RGBColor(255, 255, 255)
+                            transparent_shape.fill.transparency = 1.0
+                            transparent_shape.line.fill.background()
+
+                    except Exception as e:
+                        print(f"Error adding audio for '{chinese}': {e}")
+
+                # Add Pixabay images to the left side of the slide
+                left, top, width, height = blueprint.image_region
+                if image:
+                    try:
+                        slide.shapes.add_picture(io.BytesIO(image), left, top, width=width, height=height)
+                        embed(image, entry["image"])
+                        print(f"Added image for '{english}' to the slide.")
+                    except Exception as e:
+                        print(f"Error adding image for '{english}': {e}")
+                else:
+                    # Use the placeholder image if no image is found or it could not be fetched in time
+                    placeholder_path = PLACEHOLDER_IMAGE_PATH
+                    if os.path.exists(placeholder_path):
+                        slide.shapes.add_picture(placeholder_path, left, top, width=width, height=height)
+                        print(f"Added placeholder image for '{english}' to the slide.")
+                    else:
+                        print(f"Placeholder image not found at {placeholder_path}. Skipping image addition.")
+
+            if writer is not None:
+                with metrics.stage("slide_write", chinese):
+                    writer.write_slide(slide)
+
+        raise_if_cancelled(cancel)
+        report("saving")
+
+        # Save the presentation
+        save_start = time.perf_counter()
+        with metrics.stage("save"):
+            deck_bytes = save_deck(prs, output_path, writer)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    save_seconds = time.perf_counter() - save_start
+    if write_sidecar:
+        with metrics.stage("manifest_write"):
+            write_manifest(output_path, blueprint.fingerprint, manifest_entries)
+    if entries is not None:
+        entries.extend(manifest_entries)
+
+    stats = cache.stats()
+    print(f"Media cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes']} bytes")
+    search = {name: count - search_before[name] for name, count in search_index.stats().items()}
+    if providers.images.remote:
+        print(f"Pixabay: {search['api_calls']} searches, {search['saved']} answered by the search index")
+    if degraded_slides:
+        print(f"{len(degraded_slides)} slides are missing audio or images and will be rebuilt on the next run")
+    rows_collapsed = asset_stats.get("rows_collapsed", 0)
+    requests_avoided = asset_stats.get("requests_avoided", 0)
+    if rows_collapsed or bytes_shared:
+        print(f"Repeated rows: {rows_collapsed} resolved once, saving {requests_avoided} requests, "
+              f"{bytes_shared} bytes of audio and images shared")
+    report("done")
+
+    return {
+        "slides": slide_count,
+        "slides_reused": slides_reused,
+        "degraded": degraded_slides,
+        "assets_cached": stats["hits"] - stats_before["hits"],
+        "assets_fetched": stats["misses"] - stats_before["misses"],
+        "deck_bytes": deck_bytes,
+        "audio_bytes": audio_bytes,
+        "duplicates": {
+            "rows_collapsed": rows_collapsed,
+            "requests_avoided": requests_avoided,
+            "bytes_shared": bytes_shared,
+        },
+        "save_seconds": round(save_seconds, 3),
+        "http": get_http_client().stats(),
+        "search": search,
+        "pinyin": pinyin.stats(),
+        "providers": {"tts": providers.tts.name, "images": providers.images.name},
+    }
+
+def _build_shard(vocab_list, template_path, cache_dir, pack_path, pinyin_config, provider_specs, options):
+    """Build the slides of one shard in a worker process and return (pptx bytes, manifest entries, summary)."""
+    from asset_pack import AssetPack
+    output = io.BytesIO()
+    entries = []
+    pack = AssetPack(pack_path) if pack_path else None
+    # The rows are translated already, the shard only needs audio and images
+    tts_spec, images_spec, _ = provider_specs
+    summary = create_ppt_from_template(vocab_list, template_path, output, cache=MediaCache(cache_dir, pack=pack),
+                                       incremental=False, entries=entries,
+                                       pinyin=PinyinEngine(*pinyin_config, pack=pack),
+                                       providers=load_providers(tts_spec, images_spec), **options)
+    return output.getvalue(), entries, summary
+
+# Function to build a large presentation in several processes
+def create_ppt_sharded(vocab_list, template_path, output_path, shards, cache_dir=None, incremental=True,
+                       metrics=NULL_METRICS, cancel=None, stream=False, pinyin=None, pack=None, providers=None,
+                       **options):
+    """
+    Create a presentation by building slices of the vocabulary in parallel.
+
+    The rows are split into `shards` contiguous chunks, each built into a
+    partial deck from the same template by its own process. The partial
+    decks are then merged in order into one deck, sharing identical images
+    and audio, and saved as create_ppt_from_template would. Slide XML,
+    including the audio timing, is copied unchanged.
+
+    options (concurrency, image_dpi, image_quality, asset_deadline,
+    time_budget, pinyin_style) are passed on to create_ppt_from_template in every shard;
+    concurrency limits the network requests of all shards together.
+    With stream set, the merged deck is written slide by slide as in
+    create_ppt_from_template. The shards mount the AssetPack pack, if given,
+    and make their own providers from the specs of providers; ValueError is
+    raised for providers without specs.
+    Returns the same summary as create_ppt_from_template, with the
+    summaries of the shards under "shards".
+    """
+    from template_blueprint import get_blueprint
+
+    with metrics.stage("template"):
+        blueprint = get_blueprint(template_path)
+    pinyin = pinyin or get_pinyin_engine()
+    providers = providers or get_providers()
+    if providers.specs is None:
+        raise ValueError("Providers made from provider objects cannot be rebuilt in shards, "
+                         "use load_providers to build sharded decks with other providers")
+    settings = slide_settings(options.get("image_dpi", DEFAULT_IMAGE_DPI),
+                              options.get("image_quality", DEFAULT_IMAGE_QUALITY),
+                              options.get("pinyin_style", DEFAULT_PINYIN_STYLE), pinyin, providers)
+    cache_dir = cache_dir or get_media_cache().cache_dir
+    concurrency = options.setdefault("concurrency", DEFAULT_CONCURRENCY)
+
+    vocab_list = list(vocab_list)
+    keys = [row_key(chinese, english, blueprint.fingerprint, settings) for chinese, english in vocab_list]
+    write_sidecar = isinstance(output_path, str)
+    previous = None
+    if write_sidecar and incremental:
+        with metrics.stage("manifest_load"):
+            previous = load_previous_deck(output_path, blueprint.fingerprint)
+
+    # Only rows that cannot be copied from the previous deck are built
+    todo = [pair for pair, key in zip(vocab_list, keys) if previous is None or key not in previous]
+    shards = max(1, min(shards, len(todo)))
+    size = -(-len(todo) // shards) if todo else 0
+    chunks = [todo[i:i + size] for i in range(0, len(todo), size)] if todo else []
+    print(f"Building {len(todo)} slides in {len(chunks)} shards, reusing {len(vocab_list) - len(todo)}")
+
+    results = []
+    if chunks:
+        with metrics.stage("shards"), multiprocessing.Manager() as manager:
+            network_slots = manager.BoundedSemaphore(max(1, concurrency))
+            with ProcessPoolExecutor(
+                max_workers=len(chunks),
+                initializer=_init_batch_worker,
+                initargs=(template_path, network_slots, len(chunks)),
+            ) as executor:
+                futures = [
+                    executor.submit(_build_shard, chunk, template_path, cache_dir, pack.path if pack else None,
+                                    (pinyin.store_path, pinyin.overrides), providers.specs, options)
+                    for chunk in chunks
+                ]
+                results = [future.result() for future in futures]
+    raise_if_cancelled(cancel)
+
+    # Merge the partial decks in row order
+    from pptx import Presentation
+    deck = blueprint.new_deck()
+    shard_slides = iter([
+        (slide, entry)
+        for pptx_bytes, entries, _ in results
+        for slide, entry in zip(Presentation(io.BytesIO(pptx_bytes)).slides, entries)
+    ])
+    manifest_entries = []
+    degraded_slides = []
+    writer = None
+    if stream:
+        from deck_writer import StreamingDeckWriter
+        writer = StreamingDeckWriter(deck.prs, output_path)
+    try:
+        with metrics.stage("merge"):
+            for number, ((chinese, english), key) in enumerate(zip(vocab_list, keys), start=1):
+                raise_if_cancelled(cancel)
+                if previous is not None and key in previous:
+                    merged = deck.copy_slide(previous.slide(key))
+                    manifest_entries.append(previous.entry(key))
+                else:
+                    slide, entry = next(shard_slides)
+                    merged = deck.copy_slide(slide)
+                    manifest_entries.append(entry)
+                    if entry.get("degraded"):
+                        degraded_slides.append({"slide": number, "chinese": chinese, "english": english,
+                                                "missing": entry["degraded"]})
+                        metrics.event("slide_degraded", **degraded_slides[-1])
+                if writer is not None:
+                    writer.write_slide(merged)
+
+        save_start = time.perf_counter()
+        with metrics.stage("save"):
+            deck_bytes = save_deck(deck.prs, output_path, writer)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    save_seconds = time.perf_counter() - save_start
+    if write_sidecar:
+        with metrics.stage("manifest_write"):
+            write_manifest(output_path, blueprint.fingerprint, manifest_entries)
+
+    shard_summaries = [summary for _, _, summary in results]
+    return {
+        "slides": len(vocab_list),
+        "slides_reused": len(vocab_list) - len(todo),
+        "degraded": degraded_slides,
+        "assets_cached": sum(summary["assets_cached"] for summary in shard_summaries),
+        "assets_fetched": sum(summary["assets_fetched"] for summary in shard_summaries),
+        "search": {name: sum(summary["search"][name] for summary in shard_summaries)
+                   for name in shard_summaries[0]["search"]} if shard_summaries else {},
+        "deck_bytes": deck_bytes,
+        "audio_bytes": sum(summary["audio_bytes"] for summary in shard_summaries),
+        "duplicates": {name: sum(summary["duplicates"][name] for summary in shard_summaries)
+                       for name in ("rows_collapsed", "requests_avoided", "bytes_shared")},
+        "save_seconds": round(save_seconds, 3),
+        "providers": {"tts": providers.tts.name, "images": providers.images.name},
+        "shards": shard_summaries,
+    }
+
+# Function to query the Pixabay API for the images of a search
+def query_pixabay_hits(query, api_key):
+    """
+    Return the ranked list of Pixabay hits for a query, empty if there are none.
+
+    Raises requests.exceptions.RequestException when the search fails.
+    """
+    base_url = PIXABAY_API_URL
     # Properly encode the query to handle spaces and special characters
     encoded_query = query.replace(" ", "+")
     params = {
         "key": api_key,
         "q": encoded_query,  # Use the encoded query
-        "image_type": "illustration",  # Fetch illustration images
+        "image_type": PIXABAY_IMAGE_TYPE,
         "safesearch": "true"
     }
 
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # Raise an error for HTTP issues
-        data = response.json()
+    response = get_http_client().get(base_url, params=params)  # Raises an error for HTTP issues
+    return response.json().get("hits") or []
 
-        if "hits" in data and len(data["hits"]) > 0:
-            return data["hits"][0]["largeImageURL"]  # Return the first image URL
-        else:
-            print(f"No images found for query: {query}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching images from Pixabay: {e}")
+# Function to choose the image URL of the best hit of a search
+def pick_image_url(hits, min_size=None):
+    """
+    Return the URL of the first hit, or None if there are no hits.
+
+    The smaller webformatURL is returned instead of largeImageURL when its
+    longest side is at least min_size pixels.
+    """
+    if not hits:
         return None
+    hit = hits[0]
+    webformat_size = max(hit.get("webformatWidth", 0), hit.get("webformatHeight", 0))
+    if min_size and hit.get("webformatURL") and webformat_size >= min_size:
+        return hit["webformatURL"]
+    return hit["largeImageURL"]  # Return the first image URL
+
+# Shared translator, created on first use
+_batch_translator = None
+
+def get_translator():
+    """Return the batch translator shared by all runs in this process."""
+    global _batch_translator
+    if _batch_translator is None:
+        _batch_translator = BatchTranslator()
+    return _batch_translator
 
 # Function to translate Chinese text to English
 def translate_chinese_to_english(text):
     """Translate Chinese to English using Google's translation service."""
+    return get_translator().translate(text)
+
+# Number of Chinese-only rows sent per translation request while streaming
+TRANSLATION_BATCH_SIZE = 50
+
+# Most rows held back for a translation batch, in batches
+TRANSLATION_BUFFER_FACTOR = 4
+
+# Function to read the rows of a CSV file lazily
+def iter_csv_rows(csv_path):
+    """Yield the rows of a CSV file one at a time."""
+    with open(csv_path, mode="r", encoding="utf-8") as file:
+        yield from csv.reader(file)
+
+# Function to turn CSV-style rows into (chinese, english) pairs
+def normalize_rows(rows, auto_translate=False, skipped=None, dedupe=False, metrics=NULL_METRICS):
+    """
+    Yield (chinese, english) pairs from rows of one or two columns.
+
+    Two-column rows are (chinese, english) pairs. One-column rows are only
+    kept when auto_translate is set, with english None until translated.
+    Invalid rows (and repeated rows if dedupe is set) are skipped and
+    recorded in the skipped list, if one is given, with the reason, and
+    as a row_skipped event of metrics.
+    """
+    seen = set()
+    for row_number, row in enumerate(rows, start=1):
+        # Handle different CSV formats based on auto-translate setting
+        reason = None
+        if len(row) >= 2:
+            # Traditional format with Chinese and English columns
+            chinese, english = row[0].strip(), row[1].strip()
+        elif len(row) == 1 and auto_translate:
+            # Chinese-only format, translated by translate_rows
+            chinese, english = row[0].strip(), None
+        elif len(row) == 1:
+            reason = "no English translation and auto-translate is off"
+        else:
+            reason = "empty row"
+
+        if reason is None and not chinese:
+            reason = "no Chinese word"
+        if reason is None and dedupe:
+            if (chinese, english) in seen:
+                reason = "duplicate row"
+            seen.add((chinese, english))
+
+        if reason:
+            # Skip invalid rows
+            print(f"Skipping invalid row {row_number} ({reason}): {row}")
+            if skipped is not None:
+                skipped.append({"row": row_number, "reason": reason})
+            metrics.event("row_skipped", row=row_number, reason=reason)
+            continue
+        yield chinese, english
+
+# Function to fill in the English of Chinese-only rows
+def translate_rows(pairs, translator=None, progress=print, batch_size=TRANSLATION_BATCH_SIZE, metrics=NULL_METRICS):
+    """
+    Yield (chinese, english) pairs, translating pairs without English.
+
+    Untranslated words are collected into batches of batch_size, so only
+    one batch of rows is held back at a time. Rows are also let through
+    once TRANSLATION_BUFFER_FACTOR * batch_size of them are held back, so
+    a few Chinese-only rows in a mostly translated file do not hold up the
+    rest of it. Row order is kept.
+    """
+    buffer = []
+    untranslated = 0
+
+    def flush():
+        nonlocal translator
+        words = [chinese for chinese, english in buffer if english is None]
+        if words:
+            progress(f"Translating {len(words)} words...")
+            translator = translator or get_translator()
+            with metrics.stage("translate"):
+                translations = iter(translator.translate_many(words))
+            metrics.count("words_translated", len(words))
+        for chinese, english in buffer:
+            if english is None:
+                english = next(translations)
+                print(f"Translated '{chinese}' to '{english}'")
+            yield chinese, english
+        buffer.clear()
+
+    for chinese, english in pairs:
+        if english is not None and not buffer:
+            yield chinese, english
+            continue
+        buffer.append((chinese, english))
+        if english is None:
+            untranslated += 1
+        if untranslated >= batch_size or len(buffer) >= batch_size * TRANSLATION_BUFFER_FACTOR:
+            yield from flush()
+            untranslated = 0
+    yield from flush()
+
+# Function to stream the vocabulary of a CSV file or an iterable of rows
+def iter_vocabulary(source, auto_translate=False, translator=None, progress=print, skipped=None, dedupe=False,
+                    metrics=NULL_METRICS):
+    """Yield the (chinese, english) pairs of a CSV path or an iterable of rows."""
+    rows = iter_csv_rows(source) if isinstance(source, (str, os.PathLike)) else source
+    return translate_rows(normalize_rows(rows, auto_translate, skipped, dedupe, metrics), translator, progress,
+                          metrics=metrics)
+
+# Function to count the rows of a vocabulary source for progress reports
+def count_rows(source):
+    """Return the number of rows of a CSV path or a sized iterable, or None."""
+    if isinstance(source, (str, os.PathLike)):
+        return sum(1 for _ in iter_csv_rows(source))
+    try:
+        return len(source)
+    except TypeError:
+        return None
+
+# Function to generate a presentation without the GUI
+def generate_presentation(source, output_path=None, template_path=DEFAULT_TEMPLATE_PATH,
+                          auto_translate=False, concurrency=DEFAULT_CONCURRENCY, cache_dir=None,
+                          dedupe=False, progress=print,
+                          image_dpi=DEFAULT_IMAGE_DPI, image_quality=DEFAULT_IMAGE_QUALITY, incremental=True,
+                          metrics=None, translator=None, cache=None, cancel=None, on_progress=None,
+                          asset_deadline=None, time_budget=None, shards=1, stream=False,
+                          pinyin=None, pinyin_style=DEFAULT_PINYIN_STYLE, pinyin_overrides=None, pack=None,
+                          batch_tts=True, providers=None):
+    """
+    Generate a presentation from a CSV path or an iterable of rows.
+
+    Rows are read, translated, fetched and turned into slides as a stream,
+    so the first slides are built while later rows are still in progress.
+    The deck is written to output_path (".pptx" is added if missing), or
+    returned as bytes in summary["pptx"] when output_path is None.
+    Slides of an existing deck at output_path whose inputs did not change
+    are reused unless incremental is False.
+    Returns a summary dict with the slide count, cached and fetched asset
+    counts, the skipped rows, the deck size, the save time and the
+    elapsed time. When a RunMetrics is given, its report of stage timings,
+    counters and per-word spans is added as summary["metrics"].
+    translator and cache replace the BatchTranslator used for Chinese-only
+    rows and the media cache, for callers keeping their own warm ones.
+    on_progress receives progress events and setting the threading.Event
+    cancel stops the run with Cancelled (see create_ppt_from_template).
+    asset_deadline and time_budget limit the seconds spent on each word's
+    assets and on the whole run; slides that ran out of time are listed in
+    summary["degraded"].
+    With shards above 1, the slides are built by that many processes and
+    merged (see create_ppt_sharded); on_progress is not called then.
+    With stream set, slides are written to the deck as they are finished
+    to keep memory use flat on very large decks.
+    The pinyin is written in pinyin_style, using the polyphone readings of
+    the CSV file pinyin_overrides (see pinyin_engine.load_overrides);
+    pinyin replaces the shared PinyinEngine.
+    pack is an asset pack path (or AssetPack) whose translations, pinyin,
+    audio and images are used before the caches and the network; it is
+    only used for caches created here, not for a given cache or translator.
+    batch_tts synthesizes the audio of several words per TTS request.
+    providers is a Providers, or a (tts, images, translation) tuple of
+    provider specs (see providers.load_providers), giving where audio,
+    images and translations come from; the default is gTTS, Pixabay and
+    Google Translate. A translation provider is not used when translator
+    is given.
+    """
+    start = time.perf_counter()
+    metrics = metrics or NULL_METRICS
+    if isinstance(pack, (str, os.PathLike)):
+        from asset_pack import AssetPack
+        pack = AssetPack(pack)
+        if pack.image_settings() != (image_dpi, image_quality):
+            progress(f"The images of {pack.path} were made at {pack.image_settings()[0]} dpi and quality "
+                     f"{pack.image_settings()[1]}, other images are fetched")
+    if cache is None:
+        if pack is not None:
+            cache = MediaCache(cache_dir or DEFAULT_CACHE_DIR, pack=pack)
+        else:
+            cache = MediaCache(cache_dir) if cache_dir else get_media_cache()
+    if isinstance(providers, tuple):
+        providers = load_providers(*providers)
+    providers = providers or get_providers()
+    if translator is None and providers.translator is not None:
+        # A local dictionary needs no cache, only the pack is looked up first
+        translator = BatchTranslator(TranslationCache(None, pack=pack), backend=providers.translator)
+    if translator is None and (cache_dir or pack is not None):
+        translations_path = translation_cache_path(cache_dir) if cache_dir else DEFAULT_TRANSLATION_CACHE
+        translator = BatchTranslator(TranslationCache(translations_path, pack=pack))
+    own_pinyin = pinyin is None and bool(cache_dir or pinyin_overrides or pack is not None)
+    if own_pinyin:
+        store_path = os.path.join(cache_dir, PINYIN_STORE_NAME) if cache_dir else DEFAULT_PINYIN_STORE
+        pinyin = PinyinEngine(store_path, load_overrides(pinyin_overrides) if pinyin_overrides else None, pack=pack)
+
+    skipped = []
+    vocab = run_in_thread(iter_vocabulary(source, auto_translate, translator, progress, skipped, dedupe, metrics))
+
+    if output_path is None:
+        output = io.BytesIO()
+    else:
+        output_path = os.fspath(output_path)
+        if not output_path.lower().endswith(".pptx"):
+            output_path += ".pptx"
+        output = output_path
+    metrics.event("run_start", output=output_path, shards=shards)
+
+    total = None
+    if on_progress is not None:
+        total = count_rows(source)
+
+    if time_budget is not None:
+        # The budget covers reading and translating the rows too
+        time_budget -= time.perf_counter() - start
+
+    if shards > 1:
+        summary = create_ppt_sharded(vocab, template_path, output, shards, cache.cache_dir, incremental, metrics, cancel,
+                                     stream, pinyin, pack, concurrency=concurrency, image_dpi=image_dpi,
+                                     image_quality=image_quality, asset_deadline=asset_deadline,
+                                     time_budget=time_budget, pinyin_style=pinyin_style, batch_tts=batch_tts,
+                                     providers=providers)
+    else:
+        summary = create_ppt_from_template(vocab, template_path, output, concurrency, cache, image_dpi, image_quality,
+                                           incremental, metrics, cancel, on_progress, total, asset_deadline,
+                                           time_budget, stream=stream, pinyin=pinyin, pinyin_style=pinyin_style,
+                                           batch_tts=batch_tts, providers=providers)
+    if own_pinyin:
+        pinyin.close()
+    if pack is not None:
+        summary["pack"] = pack.stats()
+    summary["output"] = output_path
+    summary["skipped"] = skipped
+    if output_path is None:
+        summary["pptx"] = output.getvalue()
+    summary["elapsed"] = round(time.perf_counter() - start, 3)
+    metrics.event("run_end", slides=summary["slides"], slides_reused=summary["slides_reused"],
+                  degraded=len(summary["degraded"]), skipped=len(skipped), elapsed=summary["elapsed"])
+    if metrics is not NULL_METRICS:
+        metrics.count("slides", summary["slides"])
+        metrics.count("slides_reused", summary["slides_reused"])
+        metrics.count("rows_skipped", len(skipped))
+        summary["metrics"] = metrics.report()
+    return summary
+
+def _init_batch_worker(template_path, network_slots, workers):
+    """Compile the template and share the network limits in a batch worker."""
+    from template_blueprint import get_blueprint
+    global _network_slots
+    get_blueprint(template_path)
+    _network_slots = network_slots
+    # Every worker gets an equal share of the per-host rate limits
+    get_http_client().scale_rate_limits(1 / workers)
+
+def _build_deck(csv_path, output_path, template_path, options, instrument=False):
+    """Build one deck in a batch worker and return its report."""
+    report = {"csv": csv_path, "output": output_path}
     try:
-        translator = GoogleTranslator(source='zh-CN', target='en')
-        translation = translator.translate(text)
-        return translation
+        metrics = RunMetrics() if instrument else None
+        summary = generate_presentation(csv_path, output_path, template_path, metrics=metrics, **options)
+        report.update(summary, ok=True)
     except Exception as e:
-        print(f"Translation error: {e}")
-        return f"[Translation failed: {text}]"
+        report.update(ok=False, error=str(e))
+    return report
+
+# Function to expand a directory or glob pattern into CSV files
+def find_csv_files(source):
+    """Return the CSV files in a directory, or the files matching a glob pattern."""
+    if os.path.isdir(source):
+        source = os.path.join(source, "*.csv")
+    return sorted(glob.glob(source))
+
+# Function to build one deck per CSV file across several processes
+def build_decks(csv_paths, output_dir, template_path=DEFAULT_TEMPLATE_PATH, workers=None,
+                concurrency=DEFAULT_CONCURRENCY, cache_dir=None, instrument=False, **options):
+    """
+    Build a deck for every CSV file using a process pool.
+
+    options are passed on to generate_presentation. With instrument set,
+    every report includes the stage timings of its deck under "metrics".
+    Each worker compiles the template once. concurrency is the total number of
+    network requests in flight across all workers, so adding workers does
+    not exceed the Pixabay/TTS rate limits, and the per-host rate limits of
+    the HTTP client are split between the workers. Returns one report per deck, in
+    the order of csv_paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    options.update(concurrency=concurrency, cache_dir=cache_dir or get_media_cache().cache_dir)
+
+    with multiprocessing.Manager() as manager:
+        network_slots = manager.BoundedSemaphore(max(1, concurrency))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(template_path, network_slots, workers),
+        ) as executor:
+            futures = {}
+            for csv_path in csv_paths:
+                name = os.path.splitext(os.path.basename(csv_path))[0] + ".pptx"
+                future = executor.submit(
+                    _build_deck, csv_path, os.path.join(output_dir, name),
+                    template_path, options, instrument,
+                )
+                futures[future] = csv_path
+            reports = {}
+            for future in as_completed(futures):
+                report = future.result()
+                reports[futures[future]] = report
+                status = "ok" if report["ok"] else f"failed: {report['error']}"
+                print(f"[{len(reports)}/{len(futures)}] {futures[future]}: {status}")
+
+    return [reports[csv_path] for csv_path in csv_paths]
+
+# Exit codes of the command line
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+def _generation_options(args):
+    """Return the generate_presentation options given on the command line."""
+    return {
+        "auto_translate": args.auto_translate,
+        "concurrency": args.concurrency,
+        "cache_dir": args.cache_dir,
+        "dedupe": args.dedupe,
+        "image_dpi": args.image_dpi,
+        "image_quality": args.image_quality,
+        "incremental": not args.full_rebuild,
+        "asset_deadline": args.asset_deadline,
+        "time_budget": args.time_budget,
+        "shards": args.shards,
+        "stream": args.stream,
+        "pinyin_style": args.pinyin_style,
+        "pinyin_overrides": args.pinyin_overrides,
+        "pack": args.pack,
+        "batch_tts": not args.no_batch_tts,
+        "providers": (args.tts, args.images, args.translator),
+    }
+
+def _write_report(path, report):
+    """Write a JSON run report."""
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, ensure_ascii=False, indent=1)
+    print(f"Run report written to {path}")
+
+def _run_batch(args):
+    """Run the --batch mode of the command line and print the per-deck report."""
+    csv_paths = find_csv_files(args.csv)
+    if not csv_paths:
+        print(f"No CSV files found: {args.csv}", file=sys.stderr)
+        return EXIT_USAGE
+    if not os.path.exists(args.template):
+        print(f"File not found: {args.template}", file=sys.stderr)
+        return EXIT_USAGE
+
+    start = time.perf_counter()
+    reports = build_decks(csv_paths, args.output, args.template, workers=args.workers,
+                          instrument=bool(args.report), **_generation_options(args))
+    elapsed = time.perf_counter() - start
+
+    print("\nDeck report:")
+    for report in reports:
+        if report["ok"]:
+            print(f"  {report['output']}: {report['slides']} slides, "
+                  f"{report['assets_fetched']} fetched, {report['assets_cached']} cached, "
+                  f"{len(report['degraded'])} degraded, {report['elapsed']}s")
+        else:
+            print(f"  {report['csv']}: FAILED ({report['error']})")
+    failed = sum(not report["ok"] for report in reports)
+    print(f"{len(reports) - failed} decks built, {failed} failed in {elapsed:.1f}s")
+
+    result = {"ok": not failed, "elapsed": round(elapsed, 3), "decks": reports}
+    if args.report:
+        _write_report(args.report, result)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    return EXIT_FAILED if failed else EXIT_OK
+
+def main(argv=None):
+    """Command line entry point. Starts the GUI when no arguments are given."""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        run_gui()
+        return EXIT_OK
+
+    parser = argparse.ArgumentParser(
+        prog="python -m simple_mandarin_ppt",
+        description="Generate a Mandarin vocabulary presentation from a CSV file.",
+    )
+    parser.add_argument("csv", help="Vocabulary CSV file, or a directory/glob of CSV files with --batch")
+    parser.add_argument("-o", "--output", required=True, help="Output .pptx path, or output directory with --batch")
+    parser.add_argument("--batch", action="store_true", help="Build one deck per CSV file using a process pool")
+    parser.add_argument("--workers", type=int, help="Worker processes for --batch (default: CPU count)")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE_PATH, help="PowerPoint template file")
+    parser.add_argument("--auto-translate", action="store_true", help="Translate Chinese-only rows to English")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Words fetched at the same time")
+    parser.add_argument("--cache-dir", help="Media cache directory")
+    parser.add_argument("--dedupe", action="store_true", help="Skip rows repeating an earlier Chinese/English pair")
+    parser.add_argument("--image-dpi", type=int, default=DEFAULT_IMAGE_DPI,
+                        help="Resolution images are downscaled to (0 embeds them unchanged)")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_IMAGE_QUALITY, help="JPEG quality of embedded images")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Rebuild every slide instead of reusing unchanged slides of the existing output")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Build the slides in this many processes and merge them (for very large decks)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write each slide and its media to the deck as soon as it is built, keeping memory flat")
+    parser.add_argument("--no-batch-tts", action="store_true",
+                        help="Synthesize the audio of every word with its own request instead of in batches")
+    parser.add_argument("--asset-deadline", type=float, metavar="SECONDS",
+                        help="Give up on a word's audio or image after this long (placeholder image, no audio)")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                        help="Stop fetching assets after this long and finish the deck without them")
+    parser.add_argument("--pinyin-style", choices=PINYIN_STYLES, default=DEFAULT_PINYIN_STYLE,
+                        help="Tone marks, tone numbers or zhuyin")
+    parser.add_argument("--pinyin-overrides", help="CSV file of word,pinyin rows fixing the reading of polyphones")
+    parser.add_argument("--pack", help="Offline asset pack looked up before the caches and the network "
+                                       "(built with asset_pack.py)")
+    parser.add_argument("--tts", default="gtts", metavar="PROVIDER",
+                        help="Audio from gtts, or local[:COMMAND] for a local speech engine (espeak-ng by default)")
+    parser.add_argument("--images", default="pixabay", metavar="PROVIDER",
+                        help="Images from pixabay[:API_KEY], or library:DIRECTORY for a local image library")
+    parser.add_argument("--translator", default="google", metavar="PROVIDER",
+                        help="Translations from google, or dictionary:PATH for a local CSV or CC-CEDICT dictionary")
+    parser.add_argument("--json", action="store_true", help="Print a JSON summary on the last line of output")
+    parser.add_argument("--report", help="Write a JSON run report with stage timings and counters to this file")
+    parser.add_argument("--events", help="Append every timed stage as a JSON line to this file")
+    parser.add_argument("--profile", choices=PROFILERS, help="Run under cProfile or tracemalloc")
+    parser.add_argument("--profile-out", help="Output file of --profile (default: <output>.<profiler>)")
+    args = parser.parse_args(argv)
+
+    if args.pinyin_overrides:
+        if not os.path.exists(args.pinyin_overrides):
+            print(f"File not found: {args.pinyin_overrides}", file=sys.stderr)
+            return EXIT_USAGE
+        try:
+            load_overrides(args.pinyin_overrides)
+        except ValueError as e:
+            print(f"Invalid pinyin overrides: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    if args.pack and not os.path.exists(args.pack):
+        print(f"File not found: {args.pack}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        load_providers(args.tts, args.images, args.translator)
+    except (OSError, ValueError) as e:
+        print(f"Invalid provider: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.batch:
+        if args.events or args.profile or args.shards > 1:
+            parser.error("--events, --profile and --shards cannot be used with --batch")
+        return _run_batch(args)
+
+    for path in (args.csv, args.template):
+        if not os.path.exists(path):
+            print(f"File not found: {path}", file=sys.stderr)
+            return EXIT_USAGE
+
+    metrics = RunMetrics(args.events) if args.report or args.events else None
+    profile_out = args.profile_out or f"{args.output}.{args.profile}"
+    try:
+        with profiled(args.profile, profile_out):
+            summary = generate_presentation(
+                args.csv, args.output, args.template, metrics=metrics, **_generation_options(args)
+            )
+    except Exception as e:
+        print(f"An error occurred: {e}", file=sys.stderr)
+        if args.json:
+            print(json.dumps({"ok": False, "error": str(e)}))
+        return EXIT_FAILED
+    finally:
+        if metrics:
+            metrics.close()
+
+    if args.report:
+        _write_report(args.report, dict(summary, ok=True))
+    if args.json:
+        print(json.dumps(dict(summary, ok=True), ensure_ascii=False))
+    return EXIT_OK
+
+# Function to load the slow parts of generation ahead of the first deck
+def warm_up(template_path=DEFAULT_TEMPLATE_PATH):
+    """
+    Import python-pptx, pypinyin, gTTS and requests, load the pinyin
+    dictionaries and compile the template, so the first deck does not wait
+    for them. Errors are ignored, they show up again when generating.
+    """
+    start = time.perf_counter()
+    try:
+        from pypinyin import pinyin
+        pinyin("预热")  # Loads the phrase dictionaries
+        get_pinyin_engine()
+        import gtts  # noqa: F401
+        get_http_client()
+        if os.path.exists(template_path):
+            from template_blueprint import get_blueprint
+            get_blueprint(template_path)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        return
+    print(f"Warm-up done in {time.perf_counter() - start:.2f}s")
 
 def run_gui():
+    # Imported here so the library and command line never need Tk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+
     def select_csv():
         file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
         if file_path:
             csv_path_var.set(file_path)
 
     # Set the default template path
-    default_template_path = "template.pptx"
+    default_template_path = DEFAULT_TEMPLATE_PATH
 
     def select_template():
         file_path = filedialog.askopenfilename(filetypes=[("PowerPoint Files", "*.pptx")])
@@ -271,72 +1637,128 @@ def run_gui():
     # Call the highlight function initially to set the default state
     update_template_highlight()
 
-    def generate_ppt_thread():
-        def task():
+    def set_generate_enabled(enabled):
+        if enabled:
+            # Re-enable the Generate button and restore hover effects
+            generate_button.config(state="normal")
+            generate_button.bind("<Enter>", on_enter_green)
+            generate_button.bind("<Leave>", on_leave_green)
+        else:
             # Disable the Generate button and remove hover effects to prevent multiple generations
             generate_button.config(state="disabled")
             generate_button.unbind("<Enter>")
             generate_button.unbind("<Leave>")
 
-            csv_path = csv_path_var.get()
-            template_path = template_path_var.get()
-            output_path = output_path_var.get()
-
-            if not csv_path or not template_path or not output_path:
-                messagebox.showerror("Error", "Please fill in all fields.")
-                generate_button.config(state="normal")  # Re-enable the button
-                generate_button.bind("<Enter>", on_enter_green)
-                generate_button.bind("<Leave>", on_leave_green)
-                return
+    def describe_progress(event):
+        """Return the loading message for a progress event of generate_presentation."""
+        zh = language_var.get() == "zh"
+        if event["stage"] == "saving":
+            return "正在保存..." if zh else "Saving presentation..."
+        if event["stage"] != "building":
+            return "正在生成..." if zh else "Generating PowerPoint... Please wait."
+        done, total = event["done"], event["total"]
+        parts = [f"{done} / {total}" if total else str(done)]
+        if event["eta"] is not None:
+            parts.append(f"约剩 {event['eta']:.0f} 秒" if zh else f"about {event['eta']:.0f}s left")
+        if event["cache_hit_rate"] is not None:
+            parts.append(f"缓存命中 {event['cache_hit_rate']:.0%}" if zh else f"{event['cache_hit_rate']:.0%} cached")
+        return " · ".join(parts)
 
-            if not output_path.lower().endswith(".pptx"):
-                output_path += ".pptx"
+    def generate_ppt_thread():
+        csv_path = csv_path_var.get()
+        template_path = template_path_var.get()
+        output_path = output_path_var.get()
+
+        if not csv_path or not template_path or not output_path:
+            messagebox.showerror("Error", "Please fill in all fields.")
+            return
+
+        if not output_path.lower().endswith(".pptx"):
+            output_path += ".pptx"
+
+        set_generate_enabled(False)
+
+        # Show a loading message and a Cancel button
+        loading_label = tk.Label(
+            root,
+            text="Generating PowerPoint... Please wait.",
+            font=("Helvetica", 12),
+            fg="#333333",
+            bg="#f4f4f9"
+        )
+        loading_label.grid(row=9, column=0, columnspan=3, pady=10)
+
+        cancel = threading.Event()
+
+        def cancel_generation():
+            cancel.set()
+            cancel_button.config(state="disabled")
+            loading_label.config(text="正在取消..." if language_var.get() == "zh" else "Cancelling...")
+
+        cancel_button = tk.Button(
+            root,
+            text="取消" if language_var.get() == "zh" else "Cancel",
+            command=cancel_generation,
+            font=("Helvetica", 10),
+            bg="#dc3545",
+            fg="white",
+            relief="flat",
+            padx=10
+        )
+        cancel_button.grid(row=7, column=2, padx=10, sticky="e")
+
+        # The worker thread never touches Tk, it only posts events that
+        # the main loop picks up in poll_events
+        events = queue.Queue()
+        translation_message = ""
 
+        def task():
             try:
-                # Show a loading message
-                loading_label = tk.Label(
-                    root,
-                    text="Generating PowerPoint... Please wait.",
-                    font=("Helvetica", 12),
-                    fg="#333333",
-                    bg="#f4f4f9"
+                generate_presentation(
+                    csv_path, output_path, template_path,
+                    auto_translate=auto_translate_var.get(),
+                    progress=lambda message: events.put(("message", message)),
+                    on_progress=lambda event: events.put(("progress", event)),
+                    cancel=cancel,
                 )
-                loading_label.grid(row=9, column=0, columnspan=3, pady=10)
-                root.update_idletasks()
-
-                vocab = []
-                with open(csv_path, mode="r", encoding="utf-8") as file:
-                    reader = csv.reader(file)
-                    for row in reader:
-                        # Handle different CSV formats based on auto-translate setting
-                        if len(row) >= 2:
-                            # Traditional format with Chinese and English columns
-                            chinese, english = row[0].strip(), row[1].strip()
-                            vocab.append((chinese, english))
-                        elif len(row) == 1 and auto_translate_var.get():
-                            # Chinese-only format with auto-translation enabled
-                            chinese = row[0].strip()
-                            # Update loading message to show translation is happening
-                            loading_label.config(text=f"Translating: {chinese}...")
-                            root.update_idletasks()
-                            # Translate Chinese to English
-                            english = translate_chinese_to_english(chinese)
-                            print(f"Translated '{chinese}' to '{english}'")
-                            vocab.append((chinese, english))
-                        else:
-                            # Skip invalid rows
-                            print(f"Skipping invalid row: {row}")
-                            continue
-
-                # Update loading message to show we're generating the PPT
-                loading_label.config(text="Generating PowerPoint... Please wait.")
-                root.update_idletasks()
-
-                create_ppt_from_template(vocab, template_path, output_path)
-
-                # Remove the loading message
-                loading_label.destroy()
+                events.put(("done", None))
+            except Cancelled:
+                events.put(("cancelled", None))
+            except Exception as e:
+                events.put(("failed", e))
 
+        def poll_events():
+            nonlocal translation_message
+            finished = None
+            progress = None
+            try:
+                while finished is None:
+                    kind, value = events.get_nowait()
+                    if kind == "message":
+                        translation_message = value
+                    elif kind == "progress":
+                        progress = value
+                    else:
+                        finished = (kind, value)
+            except queue.Empty:
+                pass
+
+            if finished is None:
+                if progress is not None and not cancel.is_set():
+                    text = describe_progress(progress)
+                    if progress["stage"] in ("starting", "building") and translation_message:
+                        text = f"{translation_message}\n{text}"
+                    loading_label.config(text=text)
+                root.after(100, poll_events)
+                return
+
+            # Remove the loading message and the Cancel button
+            loading_label.destroy()
+            cancel_button.destroy()
+            set_generate_enabled(True)
+
+            kind, value = finished
+            if kind == "done":
                 # Open the presentation automatically
                 try:
                     os.startfile(output_path)
@@ -345,18 +1767,14 @@ def run_gui():
                     print(f"Error opening PowerPoint file: {e}")
 
                 messagebox.showinfo("Success", f"Presentation saved to {output_path}")
-            except Exception as e:
-                # Remove the loading message in case of an error
-                loading_label.destroy()
-                messagebox.showerror("Error", f"An error occurred: {e}")
-            finally:
-                # Re-enable the Generate button and restore hover effects
-                generate_button.config(state="normal")
-                generate_button.bind("<Enter>", on_enter_green)
-                generate_button.bind("<Leave>", on_leave_green)
+            elif kind == "cancelled":
+                print("Generation cancelled.")
+            else:
+                messagebox.showerror("Error", f"An error occurred: {value}")
 
         # Run the task in a separate thread
         threading.Thread(target=task).start()
+        root.after(100, poll_events)
 
     # Adjust title label
     title_label = tk.Label(
@@ -634,7 +2052,11 @@ def run_gui():
         template_entry.config(state="disabled")
         browse_button.config(state="disabled")
 
+    # Load the heavy modules and the template once the window is shown,
+    # while the user is still picking a CSV file
+    root.after(100, lambda: threading.Thread(target=warm_up, args=(template_path_var.get(),), daemon=True).start())
+
     root.mainloop()
 
 if __name__ == "__main__":
-    run_gui()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Template analysis done once per template file.
+
+The template is compiled into a blueprint: which placeholder holds which
+text, where the audio and image go, and the XML of a slide prepared from
+the template layout. Slides are then stamped by copying that XML instead
+of cloning layout placeholders through the python-pptx object API.
+"""
+import copy
+import hashlib
+import io
+import os
+import threading
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.media import SPEAKER_IMAGE_BYTES, Video
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import PackURI
+from pptx.oxml.ns import qn
+from pptx.oxml.shapes.picture import CT_Picture
+from pptx.parts.image import Image, ImagePart
+from pptx.parts.media import MediaPart
+from pptx.parts.slide import SlidePart
+from pptx.text.text import TextFrame
+from pptx.util import Inches
+
+# Placeholder idx values of the template and what they hold
+PLACEHOLDER_ROLES = {
+    0: "chinese",   # Chinese title
+    1: "english",   # English subtitle
+    14: "pinyin",   # Pinyin text
+    15: "audio",    # Audio placeholder
+}
+
+# Position and size of the image, slightly to the left and centered vertically
+IMAGE_REGION = (Inches(1.5), Inches(1.5), Inches(5), Inches(5))
+
+
+class TemplateBlueprint:
+    """Compiled form of a template file."""
+
+    def __init__(self, template):
+        if isinstance(template, (str, os.PathLike)):
+            with open(template, "rb") as template_file:
+                self.template_bytes = template_file.read()
+        else:
+            self.template_bytes = template.read()
+
+        prs = self.open_presentation()
+        template_slide = prs.slides[0]
+        layout = template_slide.slide_layout
+
+        # Log placeholders for debugging
+        print("Template slide placeholders:")
+        for placeholder in template_slide.placeholders:
+            print(f"  idx: {placeholder.placeholder_format.idx}, name: {placeholder.name}, type: {placeholder.placeholder_format.type}")
+
+        print("Template slide shapes:")
+        for shape in template_slide.shapes:
+            if shape.is_placeholder:
+                print(f"  Placeholder idx: {shape.placeholder_format.idx}, name: {shape.name}, type: {shape.placeholder_format.type}")
+            else:
+                print(f"  Shape: {shape.name}, not a placeholder")
+
+        # Prepare one slide from the layout and record what each placeholder is for
+        slide = prs.slides.add_slide(layout)
+        self.roles = {}
+        self.text_positions = {}
+        self.audio_region = None
+        self.audio_overlay = False
+        shape_elements = list(slide.shapes._spTree)
+        for placeholder in slide.placeholders:
+            idx = placeholder.placeholder_format.idx
+            role = PLACEHOLDER_ROLES.get(idx)
+            if role is None:
+                continue
+            self.roles[idx] = role
+            if role == "audio":
+                self.audio_region = (placeholder.left, placeholder.top, placeholder.width, placeholder.height)
+                self.audio_overlay = placeholder.shape_type == MSO_SHAPE_TYPE.MEDIA
+            else:
+                self.text_positions[role] = shape_elements.index(placeholder._element)
+
+        self.image_region = IMAGE_REGION
+        self.layout_name = layout.name
+        self.fingerprint = hashlib.sha256(self.template_bytes).hexdigest()
+        self._slide_element = copy.deepcopy(slide._element)
+
+    def open_presentation(self):
+        """Return a new Presentation loaded from the template bytes."""
+        return Presentation(io.BytesIO(self.template_bytes))
+
+    def new_deck(self):
+        """Return a StampedDeck on a fresh copy of the template."""
+        return StampedDeck(self, self.open_presentation())
+
+
+class MediaRegistry:
+    """
+    The image and media parts of one package, looked up by SHA1.
+
+    python-pptx finds an existing image or media part, and the next free
+    part name, by walking every relationship of the package, so adding n
+    pictures costs O(n^2). The registry scans the package once, keeps the
+    parts in dicts and stands in for the package's own part collections.
+    """
+
+    def __init__(self, package):
+        self._package = package
+        self._images = {}
+        self._media = {}
+        self._next_image = 1
+        self._next_media = 1
+        for part in package.iter_parts():
+            partname = part.partname
+            if partname.startswith("/ppt/media/image"):
+                self._next_image = max(self._next_image, (partname.idx or 0) + 1)
+                if hasattr(part, "sha1"):
+                    self._images.setdefault(part.sha1, part)
+            elif partname.startswith("/ppt/media/media"):
+                self._next_media = max(self._next_media, (partname.idx or 0) + 1)
+                self._media.setdefault(hashlib.sha1(part.blob).hexdigest(), part)
+
+        # _image_parts and _media_parts are lazy properties of the package,
+        # which read their value from the instance dict when it is there
+        package.__dict__["_image_parts"] = self
+        package.__dict__["_media_parts"] = self
+
+    def get_or_add_image_part(self, image_file):
+        """Return the ImagePart holding the image in image_file, adding it if needed."""
+        image = Image.from_file(image_file)
+        part = self._images.get(image.sha1)
+        if part is not None:
+            return part
+        partname = PackURI("/ppt/media/image%d.%s" % (self._next_image, image.ext))
+        self._next_image += 1
+        part = ImagePart(partname, image.content_type, self._package, image.blob, image.filename)
+        self._images[image.sha1] = part
+        return part
+
+    def get_or_add_media_part(self, media):
+        """Return the MediaPart holding media, adding it if needed."""
+        part = self._media.get(media.sha1)
+        if part is not None:
+            return part
+        partname = PackURI("/ppt/media/media%d.%s" % (self._next_media, media.ext))
+        self._next_media += 1
+        part = MediaPart(partname, media.content_type, self._package, media.blob)
+        self._media[media.sha1] = part
+        return part
+
+
+class StampedDeck:
+    """A presentation that slides are stamped into from a blueprint."""
+
+    def __init__(self, blueprint, prs):
+        self.blueprint = blueprint
+        self.prs = prs
+        self.media = MediaRegistry(prs.part.package)
+        self._layout_part = prs.slides[0].slide_layout.part
+        self._sldIdLst = prs.slides._sldIdLst
+        self._next_number = len(self._sldIdLst) + 1
+        self._next_id = max([255] + [sldId.id for sldId in self._sldIdLst]) + 1
+
+    def add_slide(self, texts):
+        """
+        Add a slide from the blueprint and fill its text placeholders.
+
+        texts maps a role ("chinese", "english", "pinyin") to its text.
+        """
+        element = copy.deepcopy(self.blueprint._slide_element)
+        shape_elements = list(element.cSld.spTree)
+        for role, position in self.blueprint.text_positions.items():
+            if role in texts:
+                TextFrame(shape_elements[position].txBody, None).text = texts[role]
+        return self._add_slide_part(element)
+
+    def copy_slide(self, source_slide):
+        """
+        Add a copy of a slide from another deck built from the same template.
+
+        Images and media are copied into this deck (shared with identical
+        parts already in it) and the relationship ids in the slide XML are
+        renumbered to match.
+        """
+        element = copy.deepcopy(source_slide._element)
+        slide = self._add_slide_part(element)
+        slide_part = slide.part
+
+        rId_map = {}
+        for rId, rel in source_slide.part.rels.items():
+            if rel.is_external:
+                rId_map[rId] = slide_part.rels.get_or_add_ext_rel(rel.reltype, rel.target_ref)
+            elif rel.reltype == RT.IMAGE:
+                _, rId_map[rId] = slide_part.get_or_add_image_part(io.BytesIO(rel.target_part.blob))
+            elif rel.reltype in (RT.MEDIA, RT.VIDEO):
+                part = rel.target_part
+                video = Video.from_blob(part.blob, part.content_type, os.path.basename(part.partname))
+                media_rId, video_rId = slide_part.get_or_add_video_media_part(video)
+                rId_map[rId] = media_rId if rel.reltype == RT.MEDIA else video_rId
+
+        # Point the copied XML at the new relationship ids
+        for attribute in (qn("r:id"), qn("r:embed"), qn("r:link")):
+            for child in element.iter():
+                value = child.get(attribute)
+                if value in rId_map:
+                    child.set(attribute, rId_map[value])
+        return slide
+
+    def _add_slide_part(self, element):
+        """Add a slide part holding element, based on the template layout."""
+        # The slide part is new, so its relationships can be added without
+        # python-pptx searching the existing ones for a match
+        presentation_part = self.prs.part
+        partname = PackURI("/ppt/slides/slide%d.xml" % self._next_number)
+        slide_part = SlidePart(partname, CT.PML_SLIDE, presentation_part.package, element)
+        slide_part.rels._add_relationship(RT.SLIDE_LAYOUT, self._layout_part)
+        rId = presentation_part.rels._add_relationship(RT.SLIDE, slide_part)
+        self._sldIdLst._add_sldId(id=self._next_id, rId=rId)
+        self._next_number += 1
+        self._next_id += 1
+        return slide_part.slide
+
+
+def add_audio(slide, data, name, left, top, width, height):
+    """
+    Embed mp3 bytes on a slide as a movie shape named name.
+
+    Does what SlideShapes.add_movie does for a file, but from bytes while
+    keeping the .mp3 file name, which add_movie only takes from a path.
+    """
+    shapes = slide.shapes
+    video = Video.from_blob(data, CT.VIDEO, name)
+    media_rId, video_rId = slide.part.get_or_add_video_media_part(video)
+    _, poster_frame_rId = slide.part.get_or_add_image_part(io.BytesIO(SPEAKER_IMAGE_BYTES))
+    movie_pic = CT_Picture.new_video_pic(
+        shapes._next_shape_id, name, video_rId, media_rId, poster_frame_rId, left, top, width, height
+    )
+    shapes._spTree.append(movie_pic)
+    shapes._add_video_timing(movie_pic)
+    return shapes._shape_factory(movie_pic)
+
+
+# Compiled blueprints and their template modification time, keyed by path
+_blueprints = {}
+_blueprints_lock = threading.Lock()
+
+
+def get_blueprint(template):
+    """
+    Return the blueprint of a template path or file-like object.
+
+    Blueprints of template paths are cached until the file is modified.
+    """
+    if not isinstance(template, (str, os.PathLike)):
+        return TemplateBlueprint(template)
+
+    path = os.path.abspath(template)
+    modification_time = os.path.getmtime(path)
+    with _blueprints_lock:
+        cached = _blueprints.get(path)
+        if cached is None or cached[0] != modification_time:
+            print(f"Compiling template blueprint for: {path}")
+            cached = (modification_time, TemplateBlueprint(path))
+            _blueprints[path] = cached
+    return cached[1]
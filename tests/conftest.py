@@ -0,0 +1,68 @@
+import io
+import os
+import sys
+import zlib
+
+import pytest
+
+# The modules are top-level scripts next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template.pptx")
+
+
+def png_bytes(color="red", size=(40, 30)):
+    from PIL import Image
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, "PNG")
+    return output.getvalue()
+
+
+def image_color(url):
+    checksum = zlib.crc32(url.encode("utf-8"))
+    return checksum & 0xFF, checksum >> 8 & 0xFF, checksum >> 16 & 0xFF
+
+
+class RemoteImages:
+    """A remote image provider answering every search with one image, colored by its query."""
+
+    name = "remote images"
+    remote = True
+
+    def __init__(self):
+        self.searches = []
+        self.fetches = []
+
+    def search(self, query):
+        self.searches.append(query)
+        return [{"largeImageURL": f"https://example.com/{query}.png"}]
+
+    def fetch(self, url):
+        self.fetches.append(url)
+        return png_bytes(image_color(url))
+
+
+class EchoTTS:
+    """A local TTS provider whose audio is the text itself."""
+
+    name = "echo"
+    extension = "mp3"
+    remote = False
+    batch = False
+
+    def __init__(self):
+        self.texts = []
+
+    def synthesize(self, text):
+        self.texts.append(text)
+        return ("audio of " + text).encode("utf-8")
+
+
+@pytest.fixture
+def remote_images():
+    return RemoteImages()
+
+
+@pytest.fixture
+def echo_tts():
+    return EchoTTS()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import time
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH, EchoTTS, RemoteImages
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import Providers
+
+
+class SlowTTS(EchoTTS):
+    """Echo TTS taking seconds for the texts in slow."""
+
+    def __init__(self, slow=(), seconds=0.5):
+        super().__init__()
+        self.slow = set(slow)
+        self.seconds = seconds
+
+    def synthesize(self, text):
+        if text in self.slow:
+            time.sleep(self.seconds)
+        return super().synthesize(text)
+
+
+class SlowImages(RemoteImages):
+    """Remote images taking seconds to download the images of the queries in slow."""
+
+    def __init__(self, slow=(), seconds=0.5):
+        super().__init__()
+        self.slow = set(slow)
+        self.seconds = seconds
+
+    def fetch(self, url):
+        if any(url.endswith(f"/{query}.png") for query in self.slow):
+            time.sleep(self.seconds)
+        return super().fetch(url)
+
+
+def placeholder_bytes():
+    with open(smp.PLACEHOLDER_IMAGE_PATH, "rb") as placeholder_file:
+        return placeholder_file.read()
+
+
+def slide_media(slide):
+    """Return whether a slide has an audio button, and the bytes of its pictures."""
+    audio = any(shape.shape_type == MSO_SHAPE_TYPE.MEDIA for shape in slide.shapes)
+    pictures = [shape.image.blob for shape in slide.shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+    return audio, pictures
+
+
+def test_degraded_slides_are_marked_and_backfilled(tmp_path):
+    output_path = str(tmp_path / "deck.pptx")
+    cache = MediaCache(str(tmp_path / "cache"))
+    tts = SlowTTS(slow=["狗"])
+    images = SlowImages(slow=["fish"])
+    vocab = [("猫", "cat"), ("狗", "dog"), ("鱼", "fish")]
+
+    def build(**options):
+        return smp.create_ppt_from_template(vocab, TEMPLATE_PATH, output_path, cache=cache, image_dpi=0,
+                                            pinyin=PinyinEngine(None), providers=Providers(tts, images), **options)
+
+    summary = build(asset_deadline=0.2)
+    assert summary["degraded"] == [
+        {"slide": 2, "chinese": "狗", "english": "dog", "missing": {"audio": "timeout"}},
+        {"slide": 3, "chinese": "鱼", "english": "fish", "missing": {"image": "timeout"}},
+    ]
+    cat, dog, fish = Presentation(output_path).slides
+    assert slide_media(cat) == (True, [images.fetch("https://example.com/cat.png")])
+    # No audio button without audio, the placeholder without an image
+    assert slide_media(dog)[0] is False
+    assert slide_media(fish) == (True, [placeholder_bytes()])
+
+    # The next run rebuilds the degraded slides instead of reusing them
+    tts.slow.clear()
+    images.slow.clear()
+    summary = build()
+    assert summary["degraded"] == []
+    assert summary["slides_reused"] == 1
+    cat, dog, fish = Presentation(output_path).slides
+    assert slide_media(dog)[0] is True
+    assert slide_media(fish) == (True, [images.fetch("https://example.com/fish.png")])
+
+
+def test_nothing_is_fetched_once_the_time_budget_is_spent(tmp_path):
+    output_path = str(tmp_path / "deck.pptx")
+    tts = EchoTTS()
+    images = RemoteImages()
+    vocab = [("猫", "cat"), ("狗", "dog")]
+
+    def build(**options):
+        return smp.create_ppt_from_template(vocab, TEMPLATE_PATH, output_path, cache=MediaCache(str(tmp_path / "cache")),
+                                            pinyin=PinyinEngine(None), providers=Providers(tts, images), **options)
+
+    summary = build(time_budget=0)
+    assert [slide["missing"] for slide in summary["degraded"]] == [{"audio": "budget", "image": "budget"}] * 2
+    assert tts.texts == [] and images.searches == []
+    for slide in Presentation(output_path).slides:
+        assert slide_media(slide) == (False, [placeholder_bytes()])
+
+    summary = build()
+    assert summary["degraded"] == [] and summary["slides_reused"] == 0
+    assert sorted(tts.texts) == ["狗", "猫"]
+
+
+def test_abandoned_calls_do_not_hold_up_later_words(tmp_path):
+    # With one word at a time, the calls of the first two words used to
+    # fill the two executor slots until they returned
+    tts = SlowTTS(slow=["猫", "狗"], seconds=1.5)
+    vocab = [("猫", "cat"), ("狗", "dog"), ("鱼", "fish"), ("鸟", "bird")]
+    assets = smp.stream_assets(vocab, 1, MediaCache(str(tmp_path / "cache")), asset_deadline=0.3,
+                               providers=Providers(tts, RemoteImages()))
+    degraded = {pair[0]: word_assets[3] for pair, word_assets in assets}
+    assert degraded == {"猫": {"audio": "timeout"}, "狗": {"audio": "timeout"}, "鱼": {}, "鸟": {}}
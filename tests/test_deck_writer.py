@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import io
+import zipfile
+
+from PIL import Image
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.util import Inches
+
+from deck_writer import StreamingDeckWriter
+from template_blueprint import add_audio
+
+
+def make_png(color):
+    output = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_streamed_deck_keeps_repeated_images():
+    repeated = make_png("red")
+    images = [repeated, make_png("blue"), repeated, repeated]
+    prs = Presentation()
+    output = io.BytesIO()
+    writer = StreamingDeckWriter(prs, output)
+    for number, image in enumerate(images):
+        slide = prs.slides.add_slide(prs.slide_layouts[6])
+        slide.shapes.add_picture(io.BytesIO(image), Inches(1), Inches(1))
+        audio = b"audio %d" % (number % 2)
+        add_audio(slide, audio, f"{number % 2}.mp3", Inches(3), Inches(1), Inches(1), Inches(1))
+        writer.write_slide(slide)
+    writer.close()
+
+    deck = Presentation(io.BytesIO(output.getvalue()))
+    pictures = [[shape for shape in slide.shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+                for slide in deck.slides]
+    assert [len(slide_pictures) for slide_pictures in pictures] == [1, 1, 1, 1]
+    assert [slide_pictures[0].image.blob for slide_pictures in pictures] == images
+    # The repeated image is stored once and keeps its native size
+    assert pictures[0][0].image.size == (40, 30)
+    assert pictures[0][0].width == pictures[2][0].width
+    names = zipfile.ZipFile(output).namelist()
+    media = {name for name in names if name.startswith("ppt/media/") and name.endswith(".mp3")}
+    assert len(media) == 2
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH, RemoteImages
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import Providers
+
+VOCAB = [("猫", "cat"), ("狗", "dog"), ("猫", "cat"), ("猫", "cat")]
+
+
+def build(tmp_path, cache, providers):
+    return smp.create_ppt_from_template(VOCAB, TEMPLATE_PATH, str(tmp_path / "deck.pptx"), cache=cache,
+                                        incremental=False, image_dpi=0, pinyin=PinyinEngine(None),
+                                        providers=providers)
+
+
+def test_repeated_rows_are_resolved_once(tmp_path, remote_images, echo_tts):
+    cache = MediaCache(str(tmp_path / "cache"))
+    summary = build(tmp_path, cache, Providers(echo_tts, remote_images))
+
+    assert sorted(echo_tts.texts) == ["狗", "猫"]
+    assert sorted(remote_images.searches) == ["cat", "dog"]
+    cat_audio = "audio of 猫".encode("utf-8")
+    dog_audio = "audio of 狗".encode("utf-8")
+    assert summary["duplicates"] == {
+        "rows_collapsed": 2,
+        # The TTS request, search and download of the first 猫 row, for each repeat
+        "requests_avoided": 6,
+        "bytes_shared": 2 * (len(cat_audio) + len(RemoteImages().fetch("https://example.com/cat.png"))),
+    }
+    # Audio shared by several slides is stored once
+    assert summary["audio_bytes"] == len(cat_audio) + len(dog_audio)
+
+
+def test_repeats_of_cached_rows_avoid_no_requests(tmp_path, remote_images, echo_tts):
+    cache = MediaCache(str(tmp_path / "cache"))
+    build(tmp_path, cache, Providers(echo_tts, remote_images))
+    summary = build(tmp_path, cache, Providers(echo_tts, remote_images))
+    assert summary["duplicates"]["rows_collapsed"] == 2
+    assert summary["duplicates"]["requests_avoided"] == 0
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH
+from manifest import manifest_path
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import Providers
+
+
+def slide_english(output_path):
+    with open(manifest_path(output_path), encoding="utf-8") as manifest_file:
+        return [entry["english"] for entry in json.load(manifest_file)["slides"]]
+
+
+def deck_texts(output_path):
+    from pptx import Presentation
+    return [
+        [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame and shape.text_frame.text]
+        for slide in Presentation(output_path).slides
+    ]
+
+
+def test_only_changed_rows_are_rebuilt(tmp_path, remote_images, echo_tts):
+    output_path = str(tmp_path / "deck.pptx")
+    cache = MediaCache(str(tmp_path / "cache"))
+
+    def build(vocab):
+        return smp.create_ppt_from_template(vocab, TEMPLATE_PATH, output_path, cache=cache, pinyin=PinyinEngine(None),
+                                            providers=Providers(echo_tts, remote_images))
+
+    assert build([("猫", "cat"), ("狗", "dog"), ("鱼", "fish")])["slides_reused"] == 0
+    first_deck = deck_texts(output_path)
+
+    # An unchanged deck is copied slide by slide
+    summary = build([("猫", "cat"), ("狗", "dog"), ("鱼", "fish")])
+    assert summary["slides"] == 3 and summary["slides_reused"] == 3
+    assert deck_texts(output_path) == first_deck
+    assert sorted(echo_tts.texts) == sorted(["猫", "狗", "鱼"])
+
+    # An edited row is rebuilt, the others are reused
+    summary = build([("猫", "cat"), ("狗", "puppy"), ("鱼", "fish")])
+    assert summary["slides_reused"] == 2
+    assert sorted(remote_images.searches) == ["cat", "dog", "fish", "puppy"]
+    assert slide_english(output_path) == ["cat", "puppy", "fish"]
+    assert any("puppy" in texts for texts in deck_texts(output_path))
+
+    # A removed row is dropped from the deck and its manifest
+    summary = build([("猫", "cat"), ("狗", "puppy")])
+    assert summary["slides"] == 2 and summary["slides_reused"] == 2
+    assert slide_english(output_path) == ["cat", "puppy"]
+    assert len(deck_texts(output_path)) == 2
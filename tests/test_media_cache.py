@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import os
+
+from media_cache import MediaCache
+from pinyin_engine import PINYIN_STORE_NAME, PinyinEngine
+
+
+def test_open_pinyin_store_is_not_a_cache_entry(tmp_path):
+    store_path = os.path.join(tmp_path, PINYIN_STORE_NAME)
+    engine = PinyinEngine(store_path)
+    engine.annotate_many(["你好", "银行"])
+    store_files = {name for name in os.listdir(tmp_path) if name.startswith(PINYIN_STORE_NAME)}
+    assert PINYIN_STORE_NAME in store_files
+
+    cache = MediaCache(str(tmp_path), max_bytes=10)
+    for number in range(5):
+        cache.put(f"entry{number}", b"x" * 8, ".mp3")
+
+    assert cache.stats()["bytes"] <= 10
+    assert store_files <= set(os.listdir(tmp_path))
+    engine.close()
+    assert PinyinEngine(store_path).convert("银行") == engine.convert("银行")
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import json
+
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH, EchoTTS, RemoteImages
+from metrics import RunMetrics
+from pinyin_engine import PinyinEngine
+from providers import Providers
+
+
+def test_run_events_are_logged(tmp_path):
+    events_path = str(tmp_path / "events.jsonl")
+    metrics = RunMetrics(events_path)
+    rows = [["猫", "cat"], ["狗"], ["鱼", "fish"]]
+    summary = smp.generate_presentation(rows, str(tmp_path / "deck.pptx"), TEMPLATE_PATH,
+                                        cache_dir=str(tmp_path / "cache"), metrics=metrics, time_budget=0,
+                                        pinyin=PinyinEngine(None), providers=Providers(EchoTTS(), RemoteImages()))
+    metrics.close()
+
+    with open(events_path, encoding="utf-8") as events_file:
+        events = [json.loads(line) for line in events_file]
+    named = [event for event in events if event["event"] != "span"]
+    # Rows are read in another thread, so a skipped row may be logged among the slides
+    assert named[0]["event"] == "run_start" and named[-1]["event"] == "run_end"
+    assert named[0]["output"] == summary["output"]
+    by_name = {}
+    for event in named[1:-1]:
+        by_name.setdefault(event.pop("event"), []).append(event)
+    assert [(event["row"], event["reason"]) for event in by_name["row_skipped"]] == [
+        (2, "no English translation and auto-translate is off"),
+    ]
+    assert [(event["slide"], event["chinese"], event["missing"]) for event in by_name["slide_degraded"]] == [
+        (1, "猫", {"audio": "budget", "image": "budget"}),
+        (2, "鱼", {"audio": "budget", "image": "budget"}),
+    ]
+    assert {name: named[-1][name] for name in ("slides", "degraded", "skipped")} == {
+        "slides": 2, "degraded": 2, "skipped": 1,
+    }
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+import simple_mandarin_ppt as smp
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import DEFAULT_SPECS, ImageLibrary, LocalTTSProvider, Providers, load_providers
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), smp.DEFAULT_TEMPLATE_PATH)
+
+VOCAB = [("猫", "cat"), ("狗", "dog")]
+
+
+def make_library(directory, color):
+    from PIL import Image
+    os.makedirs(directory)
+    for _, english in VOCAB:
+        Image.new("RGB", (40, 30), color).save(os.path.join(directory, f"{english}.png"))
+    return directory
+
+
+def local_tts(audio):
+    return LocalTTSProvider([sys.executable, "-c", f"import sys; sys.stdout.buffer.write({audio!r})"], "mp3")
+
+
+def test_default_providers_keep_the_slide_settings():
+    pinyin = PinyinEngine(None)
+    assert smp.slide_settings(150, 80, "tone", pinyin, Providers()) == [150, 80]
+    assert smp.slide_settings(150, 80, "tone", pinyin, load_providers()) == [150, 80]
+
+
+def test_providers_made_from_objects_have_no_specs(tmp_path):
+    assert Providers().specs == DEFAULT_SPECS
+    assert load_providers("gtts", "library:" + str(tmp_path)).specs == ("gtts", "library:" + str(tmp_path), "google")
+    providers = Providers(images=ImageLibrary(str(tmp_path)))
+    assert providers.specs is None
+    with pytest.raises(ValueError):
+        smp.create_ppt_sharded(VOCAB, TEMPLATE_PATH, str(tmp_path / "deck.pptx"), 2, str(tmp_path / "cache"),
+                               providers=providers)
+
+
+def test_changing_providers_rebuilds_the_slides(tmp_path):
+    output_path = str(tmp_path / "deck.pptx")
+    cache = MediaCache(str(tmp_path / "cache"))
+    red = ImageLibrary(make_library(str(tmp_path / "red"), "red"))
+    blue = ImageLibrary(make_library(str(tmp_path / "blue"), "blue"))
+
+    def build(providers):
+        return smp.create_ppt_from_template(VOCAB, TEMPLATE_PATH, output_path, cache=cache, pinyin=PinyinEngine(None),
+                                            providers=providers)
+
+    assert build(Providers(local_tts(b"one"), red))["slides_reused"] == 0
+    assert build(Providers(local_tts(b"one"), red))["slides_reused"] == 2
+    assert build(Providers(local_tts(b"one"), blue))["slides_reused"] == 0
+    assert build(Providers(local_tts(b"two"), blue))["slides_reused"] == 0
+    assert build(Providers(local_tts(b"two"), blue))["slides_reused"] == 2
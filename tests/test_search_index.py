@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import Providers
+from search_index import SearchIndex, normalize_query, singular
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("cats", "cat"),
+    ("boxes", "box"),
+    ("churches", "church"),
+    ("classes", "class"),
+    ("movies", "movies"),
+    ("cookies", "cookies"),
+    ("series", "series"),
+    ("berries", "berries"),
+    ("news", "news"),
+    ("glass", "glass"),
+    ("bus", "bus"),
+    ("analysis", "analysis"),
+    ("cat", "cat"),
+])
+def test_singular(word, expected):
+    assert singular(word) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Cats", "cat"),
+    ("the cat", "cat"),
+    ("cat!", "cat"),
+    ("red+apples", "red apple"),
+    ("Movies", "movies"),
+    ("the news", "news"),
+    ("TV series", "tv series"),
+    ("cookies", "cookies"),
+    ("the", "the"),
+    ("", ""),
+])
+def test_normalize_query(query, expected):
+    assert normalize_query(query) == expected
+
+
+def test_lookup_searches_the_original_query():
+    index = SearchIndex(None)
+    searched = []
+
+    def search(query):
+        searched.append(query)
+        return [{"largeImageURL": "https://example.com/cat.jpg", "id": 1}]
+
+    hits, was_searched = index.lookup("The Cats", search)
+    assert was_searched and searched == ["The Cats"]
+    assert hits == [{"largeImageURL": "https://example.com/cat.jpg"}]
+    # Queries normalizing alike share the entry
+    assert index.lookup("cat", search) == (hits, False)
+    assert searched == ["The Cats"]
+    index.close()
+
+
+def test_warm_run_answered_by_the_index_fetches_nothing(tmp_path, remote_images, echo_tts):
+    cache = MediaCache(str(tmp_path / "cache"))
+
+    def build():
+        return smp.create_ppt_from_template([("猫", "cat"), ("狗", "dog")], TEMPLATE_PATH,
+                                            str(tmp_path / "deck.pptx"), cache=cache, incremental=False,
+                                            pinyin=PinyinEngine(None), providers=Providers(echo_tts, remote_images))
+
+    assert build()["search"]["api_calls"] == 2
+    summary = build()
+    assert summary["search"]["api_calls"] == 0
+    assert summary["assets_fetched"] == 0
+    assert summary["assets_cached"] == 4
+    assert sorted(remote_images.searches) == ["cat", "dog"]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from pptx import Presentation
+
+import service
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH, EchoTTS
+from pinyin_engine import PinyinEngine
+from providers import Providers
+from translation import BatchTranslator, TranslationCache
+
+
+class BlockedTTS(EchoTTS):
+    """Echo TTS holding every request until released is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def synthesize(self, text):
+        self.released.wait(10)
+        return super().synthesize(text)
+
+
+class Glossary:
+    """Translates the words it knows, line by line."""
+
+    words = {"猫": "cat", "狗": "dog"}
+
+    def translate(self, text):
+        return "\n".join(self.words.get(line, "") for line in text.split("\n"))
+
+
+@pytest.fixture
+def tts():
+    tts = BlockedTTS()
+    tts.released.set()
+    return tts
+
+
+@pytest.fixture
+def start_service(tmp_path, monkeypatch, tts, remote_images):
+    """Start a service on a free port and return its base URL."""
+    monkeypatch.setattr(smp, "_providers", Providers(tts, remote_images))
+    monkeypatch.setattr(smp, "_pinyin_engine", PinyinEngine(None))
+    servers = []
+
+    def start(workers=1, queue_size=4):
+        deck_service = service.DeckService(TEMPLATE_PATH, workers, queue_size, str(tmp_path / "cache"))
+        deck_service.translator = BatchTranslator(TranslationCache(None), backend=Glossary())
+        server = service.create_server(deck_service, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    tts.released.set()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(url, body=None, content_type="text/csv"):
+    """Return the status, headers and body of a request, also for error statuses."""
+    headers = {"Content-Type": content_type} if body is not None else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, body, headers), timeout=20) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def slide_count(pptx_bytes):
+    return len(Presentation(io.BytesIO(pptx_bytes)).slides)
+
+
+def wait_for_status(base_url, job_id, *statuses):
+    for _ in range(200):
+        status = json.loads(request(f"{base_url}/jobs/{job_id}")[2])
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} stayed {status['status']}")
+
+
+def test_wait_returns_the_deck_of_a_json_upload(start_service):
+    base_url = start_service()
+    body = json.dumps({"rows": [["猫"], ["狗"]], "auto_translate": True}).encode("utf-8")
+    status, headers, deck = request(f"{base_url}/decks?wait=1", body, "application/json")
+    assert status == 200
+    assert headers["Content-Type"] == service.PPTX_CONTENT_TYPE
+    assert json.loads(headers["X-Job-Timing"])["slides"] == 2
+    assert slide_count(deck) == 2
+
+    job = json.loads(request(f"{base_url}/jobs/{headers['X-Job-Id']}")[2])
+    assert job["status"] == "done" and job["rows"] == 2
+
+
+def test_jobs_are_polled_until_done(start_service, tts):
+    base_url = start_service()
+    tts.released.clear()
+    status, headers, body = request(f"{base_url}/decks", "猫, cat\n狗, dog\n".encode("utf-8"))
+    assert status == 202
+    job_id = json.loads(body)["id"]
+    assert headers["Location"] == f"/jobs/{job_id}"
+
+    assert wait_for_status(base_url, job_id, "running")["rows"] == 2
+    # The deck is not there before the job is done
+    assert request(f"{base_url}/jobs/{job_id}/pptx")[0] == 409
+
+    tts.released.set()
+    job = wait_for_status(base_url, job_id, "done", "failed")
+    assert job["status"] == "done" and job["summary"]["slides"] == 2
+    status, _, deck = request(f"{base_url}/jobs/{job_id}/pptx")
+    assert status == 200 and slide_count(deck) == 2
+    assert request(f"{base_url}/jobs/unknown")[0] == 404
+
+
+def test_a_full_queue_is_refused_with_429(start_service, tts):
+    base_url = start_service(workers=1, queue_size=1)
+    tts.released.clear()
+    upload = "猫, cat\n".encode("utf-8")
+    running = json.loads(request(f"{base_url}/decks", upload)[2])["id"]
+    wait_for_status(base_url, running, "running")
+    queued = json.loads(request(f"{base_url}/decks", upload)[2])["id"]
+
+    status, headers, _ = request(f"{base_url}/decks", upload)
+    assert status == 429
+    assert headers["Retry-After"] == "5"
+
+    tts.released.set()
+    for job_id in (running, queued):
+        assert wait_for_status(base_url, job_id, "done", "failed")["status"] == "done"
+    # Room again once the queue has drained
+    assert request(f"{base_url}/decks?wait=1", upload)[0] == 200
+
+
+def test_invalid_uploads_are_rejected(start_service):
+    base_url = start_service()
+    assert request(f"{base_url}/decks", b'{"rows": "cat"}', "application/json")[0] == 400
+    assert request(f"{base_url}/decks", b"", "text/csv")[0] == 400
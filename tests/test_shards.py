@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shlex
+import sys
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+import simple_mandarin_ppt as smp
+from conftest import TEMPLATE_PATH, image_color, png_bytes
+from manifest import manifest_path
+from pinyin_engine import PinyinEngine
+from providers import load_providers
+
+VOCAB = [("猫", "cat"), ("狗", "dog"), ("鱼", "fish"), ("鸟", "bird"), ("马", "horse")]
+
+# Prints the word it is given as its audio
+ECHO_COMMAND = shlex.join([sys.executable, "-c", "import sys; sys.stdout.buffer.write(sys.argv[1].encode())"])
+
+
+def test_shards_merge_in_row_order_with_the_given_providers(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    for _, english in VOCAB:
+        (library / f"{english}.png").write_bytes(png_bytes(image_color(english)))
+    providers = load_providers("local:" + ECHO_COMMAND, "library:" + str(library))
+    output_path = str(tmp_path / "deck.pptx")
+
+    summary = smp.create_ppt_sharded(VOCAB, TEMPLATE_PATH, output_path, 2, str(tmp_path / "cache"), image_dpi=0,
+                                     pinyin=PinyinEngine(None), providers=providers)
+
+    # The merged deck and its manifest keep the order of the rows
+    with open(manifest_path(output_path), encoding="utf-8") as manifest_file:
+        assert [entry["english"] for entry in json.load(manifest_file)["slides"]] == [e for _, e in VOCAB]
+    slides = list(Presentation(output_path).slides)
+    assert len(slides) == len(VOCAB)
+    for slide, (chinese, english) in zip(slides, VOCAB):
+        texts = [shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+        assert chinese in texts and english in texts
+        # Audio and image come from the local providers of the specs, not gTTS and Pixabay
+        media = [shape for shape in slide.shapes if shape.shape_type == MSO_SHAPE_TYPE.MEDIA]
+        pictures = [shape.image.blob for shape in slide.shapes if shape.shape_type == MSO_SHAPE_TYPE.PICTURE]
+        assert len(media) == 1
+        assert pictures == [png_bytes(image_color(english))]
+
+    # The summary adds up the shards
+    shards = summary["shards"]
+    assert len(shards) == 2
+    assert sum(shard["slides"] for shard in shards) == summary["slides"] == len(VOCAB)
+    assert summary["slides_reused"] == 0 and summary["degraded"] == []
+    for name in ("assets_cached", "assets_fetched", "audio_bytes"):
+        assert summary[name] == sum(shard[name] for shard in shards)
+    assert summary["assets_fetched"] == 2 * len(VOCAB)
+    assert summary["audio_bytes"] == sum(len(chinese.encode()) for chinese, _ in VOCAB)
+    for shard in shards:
+        assert shard["providers"] == {"tts": providers.tts.name, "images": providers.images.name}
+    assert os.path.getsize(output_path) == summary["deck_bytes"]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+import simple_mandarin_ppt as smp
+from benchmark import make_stub_mp3
+from conftest import TEMPLATE_PATH, RemoteImages
+from media_cache import MediaCache
+from pinyin_engine import PinyinEngine
+from providers import Providers
+from tts_batch import SEPARATOR
+
+
+class SlowTTS:
+    name = "slow"
+    extension = "mp3"
+    remote = False
+    batch = True
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.texts = []
+
+    def synthesize(self, text):
+        self.texts.append(text)
+        time.sleep(self.seconds)
+        raise ConnectionError("no audio")
+
+
+def make_pairs(count):
+    return [(chr(0x4E00 + number) * 2, f"word {number}") for number in range(count)]
+
+
+def test_rows_are_not_held_back_by_their_batches(tmp_path):
+    batches = {}
+    rows = smp.synthesize_rows(make_pairs(20), MediaCache(str(tmp_path)), batches=batches, tts=SlowTTS(1.0))
+    start = time.perf_counter()
+    assert len(list(rows)) == 20
+    # The batches are still running, the rows wait for them while their images are fetched
+    assert time.perf_counter() - start < 0.5
+    assert set(batches) == {chinese for chinese, _ in make_pairs(20)}
+    assert not any(future.done() for future in batches.values())
+
+
+def test_audio_waits_for_the_batch_of_its_word(tmp_path):
+    tts = SlowTTS(0.2)
+    cache = MediaCache(str(tmp_path))
+    batches = {}
+    list(smp.synthesize_rows(make_pairs(2), cache, batches=batches, tts=tts))
+    chinese = make_pairs(1)[0][0]
+    # The batch fails, so the word is synthesized on its own after it
+    with pytest.raises(ConnectionError):
+        smp.generate_audio(chinese, cache, tts=tts, batches=batches)
+    assert len(tts.texts) == 2 and tts.texts[1] == chinese
+    assert chinese not in batches
+
+
+def test_nothing_is_batched_after_the_run_deadline(tmp_path):
+    tts = SlowTTS(0)
+    batches = {}
+    rows = smp.synthesize_rows(make_pairs(20), MediaCache(str(tmp_path)), run_deadline=time.perf_counter(), tts=tts,
+                               batches=batches)
+    assert len(list(rows)) == 20
+    assert tts.texts == [] and batches == {}
+
+
+def test_first_rows_are_let_through_early(tmp_path):
+    pulled = []
+
+    def pairs():
+        for pair in make_pairs(smp.TTS_BATCH_ROWS * 2):
+            pulled.append(pair)
+            yield pair
+
+    rows = smp.synthesize_rows(pairs(), MediaCache(str(tmp_path)), tts=SlowTTS(0))
+    next(rows)
+    assert len(pulled) == smp.TTS_FIRST_BATCH_ROWS
+    rows.close()
+
+
+class GatedTTS:
+    """Batched TTS whose batch requests wait until every image is downloaded."""
+
+    name = "gated"
+    extension = "mp3"
+    remote = False
+    batch = True
+
+    def __init__(self, images_done):
+        self.images_done = images_done
+        self.texts = []
+        self.overlapped = None
+
+    def synthesize(self, text):
+        self.texts.append(text)
+        if SEPARATOR in text:
+            self.overlapped = self.images_done.wait(2)
+        return make_stub_mp3(text)
+
+
+class CountedImages(RemoteImages):
+    """Remote images setting done once count images are downloaded."""
+
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def fetch(self, url):
+        data = super().fetch(url)
+        with self.lock:
+            if len(self.fetches) >= self.count:
+                self.done.set()
+        return data
+
+
+def test_images_are_fetched_while_the_audio_batch_runs(tmp_path):
+    vocab = [("猫", "cat"), ("狗", "dog"), ("鱼", "fish"), ("鸟", "bird")]
+    images = CountedImages(len(vocab))
+    tts = GatedTTS(images.done)
+    summary = smp.create_ppt_from_template(vocab, TEMPLATE_PATH, str(tmp_path / "deck.pptx"),
+                                           cache=MediaCache(str(tmp_path / "cache")), image_dpi=0,
+                                           pinyin=PinyinEngine(None), providers=Providers(tts, images))
+    assert tts.overlapped is True
+    # One batched request made the audio of every slide
+    assert len(tts.texts) == 1
+    assert summary["degraded"] == []
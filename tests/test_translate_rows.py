@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import simple_mandarin_ppt as smp
+
+
+class CountingTranslator:
+    def __init__(self):
+        self.batches = []
+
+    def translate_many(self, words):
+        self.batches.append(list(words))
+        return [f"word {chinese}" for chinese in words]
+
+
+def test_translated_rows_are_not_held_behind_one_untranslated_row():
+    translator = CountingTranslator()
+    pulled = []
+
+    def rows():
+        yield "一", None
+        for number in range(100000):
+            pulled.append(number)
+            yield f"字{number}", f"word {number}"
+
+    stream = smp.translate_rows(rows(), translator, progress=lambda message: None, batch_size=10)
+    assert next(stream) == ("一", "word 一")
+    # Only up to TRANSLATION_BUFFER_FACTOR batches were read ahead
+    assert len(pulled) < 10 * smp.TRANSLATION_BUFFER_FACTOR
+    assert translator.batches == [["一"]]
+
+
+def test_translate_rows_keeps_order():
+    rows = [("一", None), ("二", "two"), ("三", None), ("四", "four")]
+    translated = list(smp.translate_rows(rows, CountingTranslator(), progress=lambda message: None, batch_size=1))
+    assert translated == [("一", "word 一"), ("二", "two"), ("三", "word 三"), ("四", "four")]
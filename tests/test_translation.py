@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from media_cache import MediaCache
+from translation import LEGACY_TRANSLATION_CACHE_NAME, TranslationCache, translation_cache_path
+
+
+def test_media_cache_eviction_keeps_translation_cache(tmp_path):
+    translations = TranslationCache(translation_cache_path(str(tmp_path)))
+    translations.add("你好", "hello")
+    translations.add_failure("猫", "timeout")
+    translations.save()
+
+    cache = MediaCache(str(tmp_path), max_bytes=10)
+    for number in range(5):
+        cache.put(f"entry{number}", b"x" * 8, ".mp3")
+
+    reloaded = TranslationCache(translation_cache_path(str(tmp_path)))
+    assert reloaded.get("你好") == "hello"
+    assert "猫" in reloaded.failures
+
+
+def test_legacy_translation_cache_is_moved(tmp_path):
+    with open(tmp_path / LEGACY_TRANSLATION_CACHE_NAME, "w", encoding="utf-8") as legacy_file:
+        json.dump({"translations": {"你好": "hello"}, "failures": {}}, legacy_file)
+
+    cache = TranslationCache(translation_cache_path(str(tmp_path)))
+    assert cache.get("你好") == "hello"
+    assert not os.path.exists(tmp_path / LEGACY_TRANSLATION_CACHE_NAME)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Batched Chinese to English translation with a persistent cache.
+
+deep_translator's translate_batch still sends one request per text, so
+words are joined with newlines and sent as a single text instead, which
+Google translates line by line.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from media_cache import DEFAULT_CACHE_DIR
+
+# File name of the translation cache in a cache directory. A dotfile, so
+# the media cache sharing the directory never counts or evicts it
+TRANSLATION_CACHE_NAME = ".translations.json"
+
+# Name the translation cache had before, moved to TRANSLATION_CACHE_NAME
+LEGACY_TRANSLATION_CACHE_NAME = "translations.json"
+
+# Default location of the translation cache
+DEFAULT_TRANSLATION_CACHE = os.path.join(DEFAULT_CACHE_DIR, TRANSLATION_CACHE_NAME)
+
+# Google rejects texts longer than 5000 characters
+MAX_BATCH_CHARS = 4500
+
+
+def translation_cache_path(cache_dir):
+    """Return the path of the translation cache kept in a cache directory."""
+    return os.path.join(cache_dir, TRANSLATION_CACHE_NAME)
+
+
+def failed_translation(text):
+    """Return the text shown on a slide when a word could not be translated."""
+    return f"[Translation failed: {text}]"
+
+
+class TranslationCache:
+    """
+    JSON file remembering successful translations and failed attempts.
+
+    Failures are kept apart from successes so they are retried on the next
+    run instead of being reused. Translations in the asset pack pack, if
+    one is mounted, are used first.
+    """
+
+    def __init__(self, path=DEFAULT_TRANSLATION_CACHE, pack=None):
+        self.path = path
+        self.pack = pack
+        self.translations = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+        if path and os.path.basename(path) == TRANSLATION_CACHE_NAME and not os.path.exists(path):
+            legacy_path = os.path.join(os.path.dirname(path), LEGACY_TRANSLATION_CACHE_NAME)
+            if os.path.exists(legacy_path):
+                try:
+                    os.replace(legacy_path, path)
+                except OSError as e:
+                    print(f"Could not move the translation cache {legacy_path}: {e}")
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as cache_file:
+                    data = json.load(cache_file)
+                self.translations = data.get("translations", {})
+                self.failures = data.get("failures", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable translation cache {path}: {e}")
+
+    def get(self, text):
+        if self.pack is not None:
+            translation = self.pack.translation(text)
+            if translation is not None:
+                return translation
+        return self.translations.get(text)
+
+    def add(self, text, translation):
+        with self._lock:
+            self.translations[text] = translation
+            self.failures.pop(text, None)
+
+    def add_failure(self, text, error):
+        with self._lock:
+            self.failures[text] = {"error": str(error), "time": time.time()}
+
+    def save(self):
+        """Write the cache atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"translations": self.translations, "failures": self.failures}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+                json.dump(data, temp_file, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+
+
+class BatchTranslator:
+    """
+    Translates lists of Chinese words with one reused translator and few requests.
+
+    backend is any object with a translate(text) method; a GoogleTranslator
+    is created on first use when none is given.
+    """
+
+    def __init__(self, cache=None, source='zh-CN', target='en', max_batch_chars=MAX_BATCH_CHARS, backend=None):
+        self.cache = cache if cache is not None else TranslationCache()
+        self.source = source
+        self.target = target
+        self.max_batch_chars = max_batch_chars
+        self.requests_made = 0
+        self._translator = backend
+
+    @property
+    def translator(self):
+        if self._translator is None:
+            # Imported on first use, deep_translator pulls in requests and BeautifulSoup
+            from deep_translator import GoogleTranslator
+            self._translator = GoogleTranslator(source=self.source, target=self.target)
+        return self._translator
+
+    def _request(self, text):
+        self.requests_made += 1
+        return self.translator.translate(text)
+
+    def _batches(self, texts):
+        """Split texts into groups that fit in a single request."""
+        batch, size = [], 0
+        for text in texts:
+            if batch and size + len(text) + 1 > self.max_batch_chars:
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + 1
+        if batch:
+            yield batch
+
+    def _translate_one(self, text):
+        try:
+            translation = self._request(text)
+            if not translation:
+                raise ValueError("empty translation")
+            self.cache.add(text, translation.strip())
+        except Exception as e:
+            print(f"Translation error: {e}")
+            self.cache.add_failure(text, e)
+
+    def _translate_batch(self, batch):
+        if len(batch) == 1:
+            self._translate_one(batch[0])
+            return
+        try:
+            lines = (self._request("\n".join(batch)) or "").split("\n")
+        except Exception as e:
+            print(f"Batch translation error, translating words one by one: {e}")
+            lines = []
+        if len(lines) != len(batch):
+            # Lines were merged or split, fall back to one request per word
+            for text in batch:
+                self._translate_one(text)
+            return
+        for text, line in zip(batch, lines):
+            if line.strip():
+                self.cache.add(text, line.strip())
+            else:
+                self._translate_one(text)
+
+    def translate_many(self, texts):
+        """
+        Translate a list of Chinese words, returning translations in the same order.
+
+        Cached words are not sent again; failed words get the failed_translation text.
+        """
+        missing = []
+        for text in texts:
+            if self.cache.get(text) is None and text not in missing:
+                missing.append(text)
+
+        for batch in self._batches(missing):
+            self._translate_batch(batch)
+        if missing:
+            self.cache.save()
+
+        return [self.cache.get(text) or failed_translation(text) for text in texts]
+
+    def translate(self, text):
+        return self.translate_many([text])[0]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Batched TTS: several words per synthesis request, split into clips.
+
+gTTS sends every text of up to 100 characters in a single request, so the
+words of a deck are joined with a sentence separator into as few texts as
+possible. The separator makes the speaker pause between words, and the
+mp3 of a batch is cut in the middle of those pauses into one clip per
+word. Nothing is decoded: MP3 (Layer III) frames are cut at frame
+boundaries, and a frame whose granules have no big values (no spectral
+content worth coding) counts as silent. Each clip is trimmed to its
+word with a little silence around it and loses the ID3 tag, which makes
+it smaller than the mp3 of a single-word request.
+
+When a batch does not split into as many clips as it has words, its
+words are synthesized one by one as before.
+"""
+
+# Characters gTTS sends in one request
+MAX_BATCH_CHARS = 100
+
+# Put between the words of a batch, read as the end of a sentence
+SEPARATOR = "。"
+
+# Words with sentence punctuation would be cut in two, they are not batched
+SENTENCE_MARKS = frozenset("。！？!?.;；")
+
+# Silent frames kept before and after a word (about 50 ms at 24 kHz)
+PAD_FRAMES = 2
+
+# Shortest silence taken for the pause between two words; pauses inside
+# a word are shorter
+MIN_PAUSE_SECONDS = 0.15
+
+# Bitrates (kbps) of Layer III by bitrate index, for MPEG-1 and MPEG-2/2.5
+BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by version bits and sample rate index
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def batch_words(words, max_chars=MAX_BATCH_CHARS):
+    """
+    Group words into texts of at most max_chars characters.
+
+    Returns (batches, single) where batches is a list of word lists and
+    single the words that cannot be batched.
+    """
+    batches = []
+    single = []
+    batch = []
+    length = 0
+    for word in dict.fromkeys(words):
+        if not word:
+            continue
+        if len(word) > max_chars or any(char in SENTENCE_MARKS for char in word):
+            single.append(word)
+            continue
+        added = len(word) + (len(SEPARATOR) if batch else 0)
+        if batch and length + added > max_chars:
+            batches.append(batch)
+            batch, length, added = [], 0, len(word)
+        batch.append(word)
+        length += added
+    if batch:
+        batches.append(batch)
+    return batches, single
+
+
+def batch_text(words):
+    return SEPARATOR.join(words) + SEPARATOR
+
+
+def _skip_id3(data):
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | data[9] & 0x7F)
+        if data[5] & 0x10:
+            size += 10  # Footer
+        return size
+    return 0
+
+
+def _frame_info(data, offset):
+    """Return (length, seconds, silent) of the Layer III frame at offset, or None if there is none."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 3
+    layer = (data[offset + 1] >> 1) & 3
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (data[offset + 2] >> 1) & 1
+    length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    seconds = (1152 if mpeg1 else 576) / sample_rate
+
+    mono = data[offset + 3] >> 6 == 3
+    side_start = offset + 4 + (0 if data[offset + 1] & 1 else 2)  # CRC
+    side_length = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    side = data[side_start:side_start + side_length]
+    if offset + length > len(data) or len(side) < side_length:
+        return None
+    if data[side_start + side_length:side_start + side_length + 4] in (b"Xing", b"Info"):
+        # Header of a VBR stream, describes the whole file
+        return length, seconds, None
+
+    # Bits before the first granule: main_data_begin, private bits and scfsi
+    header_bits = (18 if mono else 20) if mpeg1 else (9 if mono else 10)
+    granule_bits = 59 if mpeg1 else 63
+    bits = int.from_bytes(side, "big")
+    total_bits = side_length * 8
+    silent = True
+    for granule in range(2 if mpeg1 else 1):
+        position = header_bits + granule * granule_bits * (1 if mono else 2)
+        big_values = (bits >> (total_bits - position - 12 - 9)) & 0x1FF
+        if big_values:
+            silent = False
+    return length, seconds, silent
+
+
+def mp3_frames(data):
+    """Return the (offset, length, seconds, silent) frames of mp3 data."""
+    frames = []
+    offset = _skip_id3(data)
+    while offset + 4 <= len(data):
+        info = _frame_info(data, offset)
+        if info is None:
+            # Lost sync, look for the next frame header
+            offset += 1
+            continue
+        length, seconds, silent = info
+        if silent is not None:
+            frames.append((offset, length, seconds, silent))
+        offset += length
+    return frames
+
+
+def _clip(data, frames):
+    return b"".join(data[offset:offset + length] for offset, length, _, _ in frames)
+
+
+def split_clips(data, count, pad_frames=PAD_FRAMES):
+    """
+    Cut the mp3 of count words read one after the other into one clip per word.
+
+    The words are told apart by the count - 1 longest pauses between
+    sounds. Returns the list of clips, or None when the audio does not
+    have exactly that many pauses of at least MIN_PAUSE_SECONDS that are
+    longer than all other silences between sounds.
+    """
+    frames = mp3_frames(data)
+    voiced = [index for index, frame in enumerate(frames) if not frame[3]]
+    if not voiced:
+        return None
+    # Runs of silent frames between two voiced frames, as (length, start), longest first
+    gaps = sorted((
+        (following - previous - 1, previous + 1)
+        for previous, following in zip(voiced, voiced[1:])
+        if following - previous > 1
+    ), reverse=True)
+    cuts = gaps[:count - 1]
+    if len(cuts) < count - 1:
+        return None
+    if cuts:
+        shortest, start = cuts[-1]
+        if sum(frame[2] for frame in frames[start:start + shortest]) < MIN_PAUSE_SECONDS:
+            return None
+        if len(gaps) >= count and gaps[count - 1][0] >= shortest:
+            # A silence inside a word is as long as a pause between words
+            return None
+    cuts.sort(key=lambda gap: gap[1])
+
+    # A word runs from its first to its last sound, padded with silence up
+    # to the middle of the pauses around it
+    starts = [voiced[0]] + [start + length for length, start in cuts]
+    ends = [start for _, start in cuts] + [voiced[-1] + 1]
+    middles = [start + length // 2 for length, start in cuts]
+    clips = []
+    for number, (first, end) in enumerate(zip(starts, ends)):
+        lower = middles[number - 1] if number else 0
+        upper = middles[number] if number < len(middles) else len(frames)
+        clips.append(_clip(data, frames[max(first - pad_frames, lower):min(end + pad_frames, upper)]))
+    return clips